@@ -0,0 +1,36 @@
+"""
+Shared, lazily constructed dependencies for the API retrievers.
+
+Each factory is cached so the OpenAI clients, the local Qdrant store
+(which holds a file lock on its storage directory) and the activity
+matcher's caches are created once and reused by every retriever that
+needs them.
+"""
+
+from functools import lru_cache
+
+from retrieval import ActivityMatcher, EmbeddingGenerator, QdrantStore, QueryRewriter
+
+
+@lru_cache(maxsize=1)
+def get_embedding_generator() -> EmbeddingGenerator:
+    """Return the process-wide embedding generator."""
+    return EmbeddingGenerator()
+
+
+@lru_cache(maxsize=1)
+def get_query_rewriter() -> QueryRewriter:
+    """Return the process-wide query rewriter."""
+    return QueryRewriter()
+
+
+@lru_cache(maxsize=1)
+def get_activity_matcher() -> ActivityMatcher:
+    """Return the process-wide activity matcher."""
+    return ActivityMatcher()
+
+
+@lru_cache(maxsize=None)
+def get_qdrant_store(collection_name: str = "travel_documents") -> QdrantStore:
+    """Return the Qdrant store for a collection, creating it on first use."""
+    return QdrantStore(collection_name=collection_name)
@@ -4,34 +4,62 @@ Provides endpoints for search, query rewriting, and chat.
 """
 
 import os
-import sys
+import asyncio
+import importlib.util
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, List, Tuple
+import orjson
+from cachetools import LRUCache, TTLCache, cached
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse
 from pydantic import BaseModel
 
-# Add parent directory to path for imports
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from retrieval import (
+    BaselineRetriever,
+    ImprovedRetriever,
+    VectorRetriever,
+    HybridRetriever,
+    SemanticQueryCache,
+)
+from app.deps import (
+    get_activity_matcher, get_embedding_generator, get_query_rewriter, get_qdrant_store
+)
+
+# LangChain retrievers (optional); only imported when they are initialized
+LANGCHAIN_AVAILABLE = all(
+    importlib.util.find_spec(name) is not None
+    for name in ("langchain_community", "langchain_openai", "langchain_core")
+)
+
+def _orjson_default(obj: Any) -> Any:
+    """Fallback encoder for values orjson does not serialize natively."""
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8", errors="replace")
+    if hasattr(obj, "item"):
+        # NumPy scalars (e.g. float32 scores)
+        return obj.item()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
 
-from retrieval.baseline_retriever import BaselineRetriever
-from retrieval.improved_retriever import ImprovedRetriever
-from retrieval.query_rewriter import QueryRewriter
-from retrieval.vector_retriever import VectorRetriever
-from retrieval.hybrid_retriever import HybridRetriever
 
-# LangChain retrievers (optional)
-try:
-    from retrieval.langchain_retriever import LangChainVectorRetriever, LangChainHybridRetriever
-    LANGCHAIN_AVAILABLE = True
-except ImportError:
-    LANGCHAIN_AVAILABLE = False
-    LangChainVectorRetriever = None
-    LangChainHybridRetriever = None
+class APIResponse(ORJSONResponse):
+    """ORJSONResponse that also accepts NumPy values and bytes."""
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_orjson_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+
 
 app = FastAPI(
     title="Travel Agency RAG System",
     description="Retrieval-Augmented Generation system for travel agency Q&A",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=APIResponse
 )
 
 # CORS middleware
@@ -58,41 +86,243 @@ query_rewriter = None
 langchain_vector_retriever = None
 langchain_hybrid_retriever = None
 
+# Dedicated pool for blocking retriever work (Whoosh searches, OpenAI and
+# Qdrant calls) so it never runs on the event loop
+RETRIEVER_POOL = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="retriever")
+
+# Response cache keyed by (method, normalized query, limit), and query
+# embedding cache shared by the vector and hybrid retrievers
+_RESULT_CACHE = TTLCache(maxsize=4096, ttl=300)
+_EMB_CACHE = LRUCache(maxsize=16384)
+
+
+async def _run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking call in the retriever pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(RETRIEVER_POOL, partial(func, *args, **kwargs))
+
+
+class BatchScheduler:
+    """
+    Micro-batches concurrent search requests per retrieval method.
+    
+    Each method gets its own queue. A background task collects requests
+    until either `max_batch` items are queued or `flush_ms` has elapsed
+    since the first one arrived, then runs the retriever's `search_batch`
+    in the retriever pool so the blocking work stays off the event loop.
+    """
+    
+    def __init__(self, resolve_retriever: Callable[[str], Any],
+                 max_batch: int = 32, flush_ms: float = 5.0):
+        """
+        Initialize the scheduler.
+        
+        Args:
+            resolve_retriever: Callable returning the retriever for a method name
+            max_batch: Maximum number of requests per batch
+            flush_ms: Maximum time to wait for a batch to fill, in milliseconds
+        """
+        self._resolve_retriever = resolve_retriever
+        self.max_batch = max_batch
+        self.flush_ms = flush_ms
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._tasks: List[asyncio.Task] = []
+    
+    @property
+    def running(self) -> bool:
+        """Whether the batching loops have been started."""
+        return bool(self._tasks)
+    
+    def start(self, methods: List[str]):
+        """Start one batching loop per retrieval method."""
+        for method in methods:
+            queue = asyncio.Queue()
+            self._queues[method] = queue
+            self._tasks.append(asyncio.create_task(self._loop(method, queue)))
+    
+    async def stop(self):
+        """Cancel the batching loops."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queues = {}
+    
+    async def submit(self, method: str, query: str, limit: int) -> Any:
+        """Queue a search and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queues[method].put((query, limit, future))
+        return await future
+    
+    async def _loop(self, method: str, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.flush_ms / 1000
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(method, batch)
+    
+    async def _flush(self, method: str, batch: List[Tuple[str, int, asyncio.Future]]):
+        queries = [query for query, _, _ in batch]
+        limits = [limit for _, limit, _ in batch]
+        try:
+            retriever = self._resolve_retriever(method)
+            results = await _run_blocking(retriever.search_batch, queries, limits)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def _get_retriever(method: str):
+    """Look up the current retriever for a batching method."""
+    return {
+        "baseline": baseline_retriever,
+        "improved": improved_retriever,
+        "vector": vector_retriever,
+        "hybrid": hybrid_retriever,
+    }[method]
+
+
+batch_scheduler = BatchScheduler(_get_retriever)
+
+
+async def _batched_search(method: str, query: str, limit: int):
+    """Run a search through the batch scheduler, or directly if it isn't running."""
+    if batch_scheduler.running:
+        return await batch_scheduler.submit(method, query, limit)
+    return await _run_blocking(_get_retriever(method).search, query, limit=limit)
+
+
+@lru_cache(maxsize=8192)
+def _normalize(query: str) -> str:
+    """Lowercase, collapse whitespace and NFC-normalize a query string."""
+    return unicodedata.normalize("NFC", " ".join(query.lower().split()))
+
+
+async def _cached_search(method: str, query: str, limit: int):
+    """Return a cached search result for a normalized query, running the search on a miss."""
+    key = (method, query, limit)
+    result = _RESULT_CACHE.get(key)
+    if result is None:
+        result = await _batched_search(method, query, limit)
+        _RESULT_CACHE[key] = result
+    return result
+
+
 # Initialize retrievers on startup
+def _try_init(name: str, ctor: Callable[[], Any]) -> Any:
+    """Run a retriever constructor, returning None (with a warning) on failure."""
+    try:
+        return ctor()
+    except Exception as e:
+        print(f"Warning: Could not initialize {name}: {e}")
+        return None
+
+
+def _init_langchain_retrievers() -> Tuple[Any, Any]:
+    """Build the LangChain retrievers if LangChain and the Qdrant store are present."""
+    from retrieval import LangChainVectorRetriever, LangChainHybridRetriever
+    
+    qdrant_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "qdrant_db")
+    if not os.path.exists(qdrant_path):
+        return None, None
+    shared = {"rewriter": get_query_rewriter(), "activity_matcher": get_activity_matcher()}
+    vector = LangChainVectorRetriever(qdrant_path=qdrant_path, **shared)
+    hybrid = LangChainHybridRetriever(
+        qdrant_path=qdrant_path,
+        whoosh_index_path=IMPROVED_INDEX if os.path.exists(IMPROVED_INDEX) else None,
+        **shared
+    )
+    print("✅ LangChain retrievers initialized")
+    return vector, hybrid
+
+
+def _init_vector_retriever() -> VectorRetriever:
+    """Build the vector retriever on the shared embedding generator and Qdrant store."""
+    return VectorRetriever(
+        embedding_cache=_EMB_CACHE,
+        embedding_generator=get_embedding_generator(),
+        qdrant_store=get_qdrant_store(),
+        query_cache=SemanticQueryCache(capacity=256, threshold=0.97),
+        activity_matcher=get_activity_matcher()
+    )
+
+
+def _warm_up():
+    """
+    Run a throwaway BM25 query through the Whoosh retrievers.
+    
+    This loads segment files, term dictionaries and the query parser up
+    front so the first real request does not pay for it. The OpenAI-backed
+    paths (query rewriting, embeddings) are deliberately skipped: there is
+    nothing local to warm and each call would be billed.
+    """
+    try:
+        if baseline_retriever:
+            baseline_retriever.search("warmup query", limit=1)
+        if improved_retriever:
+            improved_retriever.search_with_filters("warmup query", limit=1)
+    except Exception as e:
+        print(f"Warning: Retriever warm-up failed: {e}")
+
+
 @app.on_event("startup")
 async def startup_event():
     global baseline_retriever, improved_retriever, query_rewriter
+    global vector_retriever, hybrid_retriever
     global langchain_vector_retriever, langchain_hybrid_retriever
     
-    try:
-        if os.path.exists(BASELINE_INDEX):
-            baseline_retriever = BaselineRetriever(BASELINE_INDEX)
-        if os.path.exists(IMPROVED_INDEX):
-            improved_retriever = ImprovedRetriever(IMPROVED_INDEX)
-        query_rewriter = QueryRewriter()
-        
-        # Initialize LangChain retrievers if available
-        if LANGCHAIN_AVAILABLE:
-            try:
-                qdrant_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "qdrant_db")
-                if os.path.exists(qdrant_path):
-                    langchain_vector_retriever = LangChainVectorRetriever(qdrant_path=qdrant_path)
-                    langchain_hybrid_retriever = LangChainHybridRetriever(
-                        qdrant_path=qdrant_path,
-                        whoosh_index_path=IMPROVED_INDEX if os.path.exists(IMPROVED_INDEX) else None
-                    )
-                    print("✅ LangChain retrievers initialized")
-            except Exception as e:
-                print(f"Warning: Could not initialize LangChain retrievers: {e}")
-        # Initialize vector and hybrid retrievers
-        try:
-            vector_retriever = VectorRetriever()
-            hybrid_retriever = HybridRetriever(IMPROVED_INDEX)
-        except Exception as ve:
-            print(f"Warning: Vector search not available: {ve}")
-            print("Note: Vector index may need to be built. Run indexing/index_builder.py")
-    except Exception as e:
-        print(f"Warning: Could not initialize retrievers: {e}")
+    # Independent retrievers are built concurrently in the retriever pool; the
+    # hybrid retriever is then assembled from the improved and vector ones.
+    query_rewriter = _try_init("query rewriter", get_query_rewriter)
+    ctors = [
+        ("baseline retriever",
+         lambda: BaselineRetriever(BASELINE_INDEX) if os.path.exists(BASELINE_INDEX) else None),
+        ("improved retriever",
+         lambda: ImprovedRetriever(IMPROVED_INDEX, rewriter=query_rewriter,
+                                   activity_matcher=get_activity_matcher())
+         if os.path.exists(IMPROVED_INDEX) else None),
+        ("vector retriever", _init_vector_retriever),
+    ]
+    if LANGCHAIN_AVAILABLE:
+        ctors.append(("LangChain retrievers", _init_langchain_retrievers))
+    
+    results = await asyncio.gather(
+        *(_run_blocking(_try_init, name, ctor) for name, ctor in ctors)
+    )
+    baseline_retriever, improved_retriever, vector_retriever = results[:3]
+    if LANGCHAIN_AVAILABLE and results[3]:
+        langchain_vector_retriever, langchain_hybrid_retriever = results[3]
+    
+    if vector_retriever is None:
+        print("Note: Vector index may need to be built. Run indexing/index_builder.py")
+    elif improved_retriever is not None:
+        hybrid_retriever = HybridRetriever(
+            IMPROVED_INDEX,
+            bm25_retriever=improved_retriever,
+            vector_retriever=vector_retriever
+        )
+    
+    await _run_blocking(_warm_up)
+    batch_scheduler.start(["baseline", "improved", "vector", "hybrid"])
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await batch_scheduler.stop()
 
 
 # Request/Response models
@@ -132,23 +362,24 @@ async def search(request: SearchRequest):
     
     Supports baseline, improved, vector, and hybrid retrieval methods.
     """
+    query = _normalize(request.query)
     try:
         # LangChain retrievers (if requested and available)
         if request.use_langchain and LANGCHAIN_AVAILABLE:
             if request.use_hybrid and langchain_hybrid_retriever:
-                result = langchain_hybrid_retriever.search(request.query, limit=request.limit)
+                result = await _run_blocking(langchain_hybrid_retriever.search, query, limit=request.limit)
                 return {
                     "method": "langchain_hybrid",
-                    "original_query": result["original_query"],
+                    "original_query": request.query,
                     "rewritten_query": result.get("rewritten_query"),
                     "results": result["results"],
                     "num_results": result["num_results"]
                 }
             elif langchain_vector_retriever:
-                result = langchain_vector_retriever.search(request.query, limit=request.limit)
+                result = await _run_blocking(langchain_vector_retriever.search, query, limit=request.limit)
                 return {
                     "method": "langchain_vector",
-                    "original_query": result["original_query"],
+                    "original_query": request.query,
                     "rewritten_query": result.get("rewritten_query"),
                     "results": result["results"],
                     "num_results": result["num_results"]
@@ -161,10 +392,10 @@ async def search(request: SearchRequest):
             if not hybrid_retriever:
                 raise HTTPException(status_code=503, detail="Hybrid retriever not available. Please build vector index first.")
             
-            result = hybrid_retriever.search(request.query, limit=request.limit, use_hybrid=True)
+            result = await _cached_search("hybrid", query, request.limit)
             return {
                 "method": "hybrid",
-                "original_query": result["query"],
+                "original_query": request.query,
                 "rewritten_query": result.get("bm25_rewritten_query"),
                 "results": result["results"],
                 "num_results": result["num_results"],
@@ -177,10 +408,10 @@ async def search(request: SearchRequest):
             if not vector_retriever:
                 raise HTTPException(status_code=503, detail="Vector retriever not available. Please build vector index first.")
             
-            result = vector_retriever.search(request.query, limit=request.limit)
+            result = await _cached_search("vector", query, request.limit)
             return {
                 "method": "vector",
-                "original_query": result["query"],
+                "original_query": request.query,
                 "rewritten_query": None,
                 "results": result["results"],
                 "num_results": result["num_results"]
@@ -191,10 +422,10 @@ async def search(request: SearchRequest):
             if not improved_retriever:
                 raise HTTPException(status_code=503, detail="Improved index not available. Please build the index first.")
             
-            result = improved_retriever.search(request.query, limit=request.limit)
+            result = await _cached_search("improved", query, request.limit)
             return {
                 "method": "improved",
-                "original_query": result["original_query"],
+                "original_query": request.query,
                 "rewritten_query": result["rewritten_query"],
                 "results": result["results"],
                 "num_results": result["num_results"]
@@ -205,7 +436,7 @@ async def search(request: SearchRequest):
             if not baseline_retriever:
                 raise HTTPException(status_code=503, detail="Baseline index not available. Please build the index first.")
             
-            results = baseline_retriever.search(request.query, limit=request.limit)
+            results = await _cached_search("baseline", query, request.limit)
             return {
                 "method": "baseline",
                 "original_query": request.query,
@@ -226,7 +457,7 @@ async def rewrite_query(request: RewriteRequest):
         if not query_rewriter:
             raise HTTPException(status_code=503, detail="Query rewriter not available.")
         
-        rewritten = query_rewriter.rewrite_query(request.query)
+        rewritten = await _run_blocking(query_rewriter.rewrite_query, request.query)
         return {
             "original_query": request.query,
             "rewritten_query": rewritten
@@ -235,6 +466,33 @@ async def rewrite_query(request: RewriteRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+_CONTEXT_DOC_FMT = "Document {i}: {name} ({dt})\nRegion: {r}\nDescription: {d}...".format
+
+
+def _build_context_text(docs: List[Dict[str, Any]]) -> str:
+    """Format retrieved documents into the LLM context block."""
+    return "\n\n".join(
+        _CONTEXT_DOC_FMT(
+            i=i, name=doc['name'], dt=doc['doc_type'], r=doc.get('region', 'N/A'),
+            d=doc['document'].get('description', '')[:200]
+        )
+        for i, doc in enumerate(docs, 1)
+    )
+
+
+def _cached_context_text(method: str, query: str, limit: int, docs: List[Dict[str, Any]]) -> str:
+    """Return the context block for a cached chat search, rendering it on a miss."""
+    # Kept with the docs it was rendered from, so a re-run search is never paired
+    # with a context built from an earlier result
+    key = ("chat", method, query, limit)
+    cached = _RESULT_CACHE.get(key)
+    if cached is not None and cached[0] is docs:
+        return cached[1]
+    context_text = _build_context_text(docs)
+    _RESULT_CACHE[key] = (docs, context_text)
+    return context_text
+
+
 @app.post("/api/chat")
 async def chat(request: ChatRequest):
     """
@@ -243,21 +501,17 @@ async def chat(request: ChatRequest):
     This endpoint retrieves relevant documents and could be extended
     to generate answers using an LLM (currently returns retrieved docs).
     """
+    query = _normalize(request.query)
     try:
         if request.use_improved:
             if not improved_retriever:
                 raise HTTPException(status_code=503, detail="Improved index not available.")
             
-            result = improved_retriever.search(request.query, limit=request.limit)
+            result = await _cached_search("improved", query, request.limit)
             
             # Format context for LLM (could be extended to actually call LLM)
             context_docs = result["results"]
-            context_text = "\n\n".join([
-                f"Document {i+1}: {doc['name']} ({doc['doc_type']})\n"
-                f"Region: {doc.get('region', 'N/A')}\n"
-                f"Description: {doc['document'].get('description', '')[:200]}..."
-                for i, doc in enumerate(context_docs)
-            ])
+            context_text = _cached_context_text("improved", query, request.limit, context_docs)
             
             return {
                 "query": request.query,
@@ -270,14 +524,9 @@ async def chat(request: ChatRequest):
             if not baseline_retriever:
                 raise HTTPException(status_code=503, detail="Baseline index not available.")
             
-            results = baseline_retriever.search(request.query, limit=request.limit)
+            results = await _cached_search("baseline", query, request.limit)
             
-            context_text = "\n\n".join([
-                f"Document {i+1}: {doc['name']} ({doc['doc_type']})\n"
-                f"Region: {doc.get('region', 'N/A')}\n"
-                f"Description: {doc['document'].get('description', '')[:200]}..."
-                for i, doc in enumerate(results)
-            ])
+            context_text = _cached_context_text("baseline", query, request.limit, results)
             
             return {
                 "query": request.query,
@@ -290,18 +539,26 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+_HEALTH_BASE = {"status": "healthy"}
+
+
+@cached(TTLCache(maxsize=1, ttl=10))
+def _indexes_present() -> Tuple[bool, bool]:
+    """Whether the baseline and improved index directories exist (cached briefly)."""
+    return os.path.exists(BASELINE_INDEX), os.path.exists(IMPROVED_INDEX)
+
+
 @app.get("/api/health")
 async def health():
     """Health check endpoint."""
-    vector_available = vector_retriever is not None
-    hybrid_available = hybrid_retriever is not None
+    baseline_index, improved_index = _indexes_present()
     
     return {
-        "status": "healthy",
-        "baseline_index": os.path.exists(BASELINE_INDEX),
-        "improved_index": os.path.exists(IMPROVED_INDEX),
-        "vector_search": vector_available,
-        "hybrid_search": hybrid_available
+        **_HEALTH_BASE,
+        "baseline_index": baseline_index,
+        "improved_index": improved_index,
+        "vector_search": vector_retriever is not None,
+        "hybrid_search": hybrid_retriever is not None
     }
 
 
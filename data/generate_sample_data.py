@@ -4,9 +4,15 @@ This creates realistic travel agency data for testing the RAG system.
 Generates 100 destinations and 1000 guides.
 """
 
-import json
+import itertools
 import os
 import random
+import string
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import orjson
 
 # Base templates for generating diverse data
 CITIES = [
@@ -109,6 +115,9 @@ GUIDE_REGIONS = [
     "Abu Dhabi, UAE", "Sharjah, UAE", "Almaty, Kazakhstan", "Tashkent, Uzbekistan"
 ]
 
+# Shared generator; per-item values are drawn from it in vectorized batches
+_RNG = np.random.default_rng()
+
 DESCRIPTION_TEMPLATES_DEST = [
     "A vibrant {type} destination offering {features}. Experience {activities} and immerse yourself in {culture}. Perfect for {audience}.",
     "Discover {type} with stunning {features}. Enjoy {activities} and explore {culture}. Ideal for {audience}.",
@@ -126,9 +135,23 @@ DESCRIPTION_TEMPLATES_GUIDE = [
 ]
 
 
+def _compile_template(template):
+    """Convert a str.format template into an equivalent %-style template."""
+    # %-formatting with a dict skips str.format's per-call field parsing
+    parts = []
+    for literal, field, _, _ in string.Formatter().parse(template):
+        parts.append(literal.replace("%", "%%"))
+        if field is not None:
+            parts.append(f"%({field})s")
+    return "".join(parts)
+
+
+_DEST_TEMPLATES = [_compile_template(template) for template in DESCRIPTION_TEMPLATES_DEST]
+
+
 def generate_destination_description(name, country, activities):
     """Generate a description for a destination."""
-    template = random.choice(DESCRIPTION_TEMPLATES_DEST)
+    template = random.choice(_DEST_TEMPLATES)
     
     types = ["cosmopolitan city", "coastal town", "mountain retreat", "tropical paradise", 
              "historic city", "cultural hub", "adventure destination", "wellness retreat"]
@@ -139,92 +162,132 @@ def generate_destination_description(name, country, activities):
     audiences = ["couples", "families", "solo travelers", "adventure seekers", 
                 "culture enthusiasts", "food lovers", "photography enthusiasts"]
     
-    return template.format(
-        type=random.choice(types),
-        features=random.choice(features),
-        activities=", ".join(activities[:3]),
-        culture=random.choice(cultures),
-        audience=random.choice(audiences)
-    )
+    return template % {
+        "type": random.choice(types),
+        "features": random.choice(features),
+        "activities": ", ".join(activities[:3]),
+        "culture": random.choice(cultures),
+        "audience": random.choice(audiences)
+    }
+
+
+GUIDE_SPECIALTIES = np.array(["historical tours", "culinary experiences", "cultural immersion",
+                              "adventure activities", "photography tours", "wellness retreats"])
+GUIDE_LANGUAGES = np.array(["English", "Spanish", "French", "German", "Italian", "Portuguese",
+                            "Japanese", "Chinese", "Arabic", "Russian"])
+GUIDE_SERVICES = np.array(["personalized tours", "group experiences", "private excursions",
+                           "custom itineraries", "expert guidance"])
+GUIDE_TOUR_TYPES = np.array(["private tours", "group tours", "custom experiences"])
+GUIDE_TYPES = np.array(["cultural", "adventure", "culinary", "historical", "photography"])
+GUIDE_EXPERTISES = np.array(["local history", "regional cuisine", "cultural traditions",
+                             "hidden gems", "local insights"])
+
+def _permutation_rows(rng, count, n):
+    """Return a (count, n) array whose rows are independent permutations of range(n)."""
+    # Row-wise Fisher-Yates shuffle in C; prefixes of each row are random subsets
+    return rng.permuted(np.broadcast_to(np.arange(n), (count, n)), axis=1)
+
+
+_GUIDE_TEMPLATES = [_compile_template(template) for template in DESCRIPTION_TEMPLATES_GUIDE]
+
+
+def generate_guide_descriptions(regions, rng=None):
+    """Generate descriptions for a batch of guides, one per region."""
+    if rng is None:
+        rng = _RNG
+    count = len(regions)
+    
+    # One draw per field for the whole batch
+    template_idx = rng.integers(0, len(_GUIDE_TEMPLATES), size=count)
+    specialties = GUIDE_SPECIALTIES[rng.integers(0, len(GUIDE_SPECIALTIES), size=count)]
+    services = GUIDE_SERVICES[rng.integers(0, len(GUIDE_SERVICES), size=count)]
+    tour_types = GUIDE_TOUR_TYPES[rng.integers(0, len(GUIDE_TOUR_TYPES), size=count)]
+    types = GUIDE_TYPES[rng.integers(0, len(GUIDE_TYPES), size=count)]
+    expertises = GUIDE_EXPERTISES[rng.integers(0, len(GUIDE_EXPERTISES), size=count)]
+    experience = rng.integers(5, 21, size=count)
+    
+    # 2-4 distinct languages per guide
+    num_languages = rng.integers(2, 5, size=count)
+    language_order = _permutation_rows(rng, count, len(GUIDE_LANGUAGES))
+    
+    return [
+        _GUIDE_TEMPLATES[template_idx[i]] % {
+            "specialty": specialties[i],
+            "languages": ", ".join(GUIDE_LANGUAGES[language_order[i, :num_languages[i]]]),
+            "services": services[i],
+            "tour_types": tour_types[i],
+            "experience": experience[i],
+            "region": region.split(",")[0],
+            "type": types[i],
+            "expertise": expertises[i]
+        }
+        for i, region in enumerate(regions)
+    ]
 
 
 def generate_guide_description(name, region, activities):
     """Generate a description for a guide."""
-    template = random.choice(DESCRIPTION_TEMPLATES_GUIDE)
+    return generate_guide_descriptions([region])[0]
+
+
+def _sample_activities(rng, count, low, high):
+    """Draw `count` activity lists of low..high distinct activities each."""
+    num_activities = rng.integers(low, high + 1, size=count)
+    order = _permutation_rows(rng, count, len(ACTIVITIES_POOL))
+    return [
+        [ACTIVITIES_POOL[j] for j in order[i, :num_activities[i]]]
+        for i in range(count)
+    ]
+
+
+def generate_destinations(count=100, rng=None):
+    """Generate destination data."""
+    if rng is None:
+        rng = _RNG
     
-    specialties = ["historical tours", "culinary experiences", "cultural immersion",
-                   "adventure activities", "photography tours", "wellness retreats"]
-    languages = ["English", "Spanish", "French", "German", "Italian", "Portuguese",
-                 "Japanese", "Chinese", "Arabic", "Russian"]
-    services = ["personalized tours", "group experiences", "private excursions",
-               "custom itineraries", "expert guidance"]
-    tour_types = ["private tours", "group tours", "custom experiences"]
-    types = ["cultural", "adventure", "culinary", "historical", "photography"]
-    expertises = ["local history", "regional cuisine", "cultural traditions",
-                 "hidden gems", "local insights"]
+    # Draw unique city-country combinations as flat indices into the
+    # CITIES x COUNTRIES grid (only repeat once the grid is exhausted)
+    num_combos = len(CITIES) * len(COUNTRIES)
+    combo_idx = rng.choice(num_combos, size=count, replace=count > num_combos)
+    city_idx, country_idx = np.divmod(combo_idx, len(COUNTRIES))
     
-    return template.format(
-        specialty=random.choice(specialties),
-        languages=", ".join(random.sample(languages, random.randint(2, 4))),
-        services=random.choice(services),
-        tour_types=random.choice(tour_types),
-        experience=random.randint(5, 20),
-        region=region.split(",")[0] if "," in region else region,
-        type=random.choice(types),
-        expertise=random.choice(expertises)
-    )
-
-
-def generate_destinations(count=100):
-    """Generate destination data."""
-    destinations = []
-    used_combinations = set()
+    # Generate activities (3-7 per destination)
+    activity_lists = _sample_activities(rng, count, 3, 7)
     
-    for i in range(count):
-        # Ensure unique city-country combinations
-        while True:
-            city = random.choice(CITIES)
-            country = random.choice(COUNTRIES)
-            combo = (city, country)
-            if combo not in used_combinations or len(used_combinations) > len(CITIES) * 2:
-                used_combinations.add(combo)
-                break
-        
-        # Generate activities (3-7 per destination)
-        num_activities = random.randint(3, 7)
-        activities = random.sample(ACTIVITIES_POOL, num_activities)
-        
-        description = generate_destination_description(city, country, activities)
-        
+    destinations = []
+    for c, k, activities in zip(city_idx, country_idx, activity_lists):
+        city = CITIES[c]
+        country = COUNTRIES[k]
         destinations.append({
             "name": city,
             "country": country,
-            "description": description,
+            "description": generate_destination_description(city, country, activities),
             "activities": activities
         })
     
     return destinations
 
 
-def generate_guides(count=1000):
+def generate_guides(count=1000, rng=None):
     """Generate guide data."""
-    guides = []
+    if rng is None:
+        rng = _RNG
+    
+    first_idx = rng.integers(0, len(FIRST_NAMES), size=count)
+    last_idx = rng.integers(0, len(LAST_NAMES), size=count)
+    region_idx = rng.integers(0, len(GUIDE_REGIONS), size=count)
     
-    for i in range(count):
-        first_name = random.choice(FIRST_NAMES)
-        last_name = random.choice(LAST_NAMES)
-        name = f"{first_name} {last_name}"
-        
-        region = random.choice(GUIDE_REGIONS)
-        
-        # Generate activities (2-5 per guide)
-        num_activities = random.randint(2, 5)
-        activities = random.sample(ACTIVITIES_POOL, num_activities)
-        
-        description = generate_guide_description(name, region, activities)
-        
+    # Generate activities (2-5 per guide)
+    activity_lists = _sample_activities(rng, count, 2, 5)
+    
+    regions = [GUIDE_REGIONS[r] for r in region_idx]
+    descriptions = generate_guide_descriptions(regions, rng)
+    
+    guides = []
+    for first, last, region, description, activities in zip(
+            first_idx, last_idx, regions, descriptions, activity_lists):
         guides.append({
-            "name": name,
+            "name": f"{FIRST_NAMES[first]} {LAST_NAMES[last]}",
             "region": region,
             "description": description,
             "activities": activities
@@ -233,6 +296,65 @@ def generate_guides(count=1000):
     return guides
 
 
+# Below this many guides per worker, process start-up costs more than it saves
+MIN_GUIDES_PER_WORKER = 20000
+
+
+def _generate_guides_shard(count, seed):
+    """Generate one shard of guides from an independent seed (process pool worker)."""
+    return generate_guides(count, rng=np.random.default_rng(seed))
+
+
+def generate_guides_parallel(count=1000, workers=None, seed=None):
+    """
+    Generate guide data, sharding large batches across worker processes.
+    
+    Args:
+        count: Number of guides to generate
+        workers: Maximum number of worker processes (defaults to CPU count)
+        seed: Optional seed for reproducible output
+    
+    Returns:
+        List of guide dicts
+    """
+    workers = min(workers or os.cpu_count() or 1, count // MIN_GUIDES_PER_WORKER)
+    if workers <= 1:
+        return generate_guides(count, rng=np.random.default_rng(seed) if seed is not None else None)
+    
+    # Independent, non-overlapping streams per shard
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    sizes = [count // workers + (1 if i < count % workers else 0) for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        shards = pool.map(_generate_guides_shard, sizes, seeds)
+        return list(itertools.chain.from_iterable(shards))
+
+
+def _write_json(path, data):
+    """
+    Serialize `data` as indented JSON and write it in a single call.
+    
+    The file is written to a temporary sibling and renamed into place, so
+    readers never see a partial file. Once it is on disk, its pages are
+    dropped from the page cache so regenerating data does not evict the
+    memory-mapped indexes.
+    """
+    payload = orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        # mkstemp creates the file owner-only; match a normally created file
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
 def generate_data():
     """Generate and save sample data files."""
     data_dir = os.path.dirname(os.path.abspath(__file__))
@@ -241,18 +363,16 @@ def generate_data():
     destinations = generate_destinations(100)
     
     print("Generating 1000 guides...")
-    guides = generate_guides(1000)
+    guides = generate_guides_parallel(1000)
     
     # Save destinations
     destinations_path = os.path.join(data_dir, "destinations.json")
-    with open(destinations_path, 'w', encoding='utf-8') as f:
-        json.dump(destinations, f, indent=2, ensure_ascii=False)
+    _write_json(destinations_path, destinations)
     print(f"✅ Generated {len(destinations)} destinations in {destinations_path}")
     
     # Save guides
     guides_path = os.path.join(data_dir, "guides.json")
-    with open(guides_path, 'w', encoding='utf-8') as f:
-        json.dump(guides, f, indent=2, ensure_ascii=False)
+    _write_json(guides_path, guides)
     print(f"✅ Generated {len(guides)} guides in {guides_path}")
     
     return destinations_path, guides_path
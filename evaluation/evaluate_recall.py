@@ -4,9 +4,13 @@ Compares baseline vs improved retrieval on test queries.
 """
 
 import os
+import re
 import sys
-import json
-from typing import List, Dict, Any
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+import orjson
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -60,6 +64,23 @@ TEST_QUERIES = [
 ]
 
 
+@lru_cache(maxsize=None)
+def _expected_pattern(expected_docs: Tuple[str, ...]) -> Optional["re.Pattern"]:
+    """Compile the expected names into one alternation, matched as substrings."""
+    if not expected_docs:
+        return None
+    return re.compile("|".join(map(re.escape, dict.fromkeys(expected_docs))))
+
+
+def _precompile_patterns(test_queries: List[Dict[str, Any]]):
+    """Compile each test case's matcher once, before evaluation threads share them."""
+    for test_case in test_queries:
+        _expected_pattern(tuple(test_case["expected_docs"]))
+
+
+_precompile_patterns(TEST_QUERIES)
+
+
 def evaluate_retrieval(retriever, query: str, expected_docs: List[str], top_k: int = 10) -> Dict[str, Any]:
     """
     Evaluate retrieval for a single query.
@@ -79,7 +100,8 @@ def evaluate_retrieval(retriever, query: str, expected_docs: List[str], top_k: i
     retrieved_names = [doc["name"] for doc in retrieved]
     
     # Calculate metrics
-    relevant_retrieved = sum(1 for name in retrieved_names if any(exp in name for exp in expected_docs))
+    pattern = _expected_pattern(tuple(expected_docs))
+    relevant_retrieved = sum(1 for name in retrieved_names if pattern.search(name)) if pattern else 0
     recall = relevant_retrieved / len(expected_docs) if expected_docs else 0
     precision = relevant_retrieved / len(retrieved_names) if retrieved_names else 0
     
@@ -99,6 +121,34 @@ def evaluate_retrieval(retriever, query: str, expected_docs: List[str], top_k: i
     return result_dict
 
 
+async def evaluate_all(baseline_retriever, improved_retriever,
+                       test_queries: List[Dict[str, Any]],
+                       max_concurrency: int = 4) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Evaluate both retrievers on every test query concurrently.
+    
+    Both retrievers run side by side for each query, and up to
+    `max_concurrency` queries are in flight at once to respect API rate limits.
+    
+    Returns:
+        List of (baseline result, improved result) pairs, aligned with `test_queries`
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    with ThreadPoolExecutor(max_workers=2 * max_concurrency) as pool:
+        async def evaluate_one(test_case):
+            async with semaphore:
+                return tuple(await asyncio.gather(
+                    loop.run_in_executor(pool, evaluate_retrieval, baseline_retriever,
+                                         test_case["query"], test_case["expected_docs"]),
+                    loop.run_in_executor(pool, evaluate_retrieval, improved_retriever,
+                                         test_case["query"], test_case["expected_docs"])
+                ))
+        
+        return await asyncio.gather(*(evaluate_one(test_case) for test_case in test_queries))
+
+
 def run_evaluation():
     """Run full evaluation comparing baseline vs improved."""
     index_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "indexes")
@@ -125,7 +175,10 @@ def run_evaluation():
     baseline_results = []
     improved_results = []
     
-    for test_case in TEST_QUERIES:
+    # Run all retrievals concurrently, then report in query order
+    evaluated = asyncio.run(evaluate_all(baseline_retriever, improved_retriever, TEST_QUERIES))
+    
+    for test_case, (baseline_result, improved_result) in zip(TEST_QUERIES, evaluated):
         query = test_case["query"]
         expected_docs = test_case["expected_docs"]
         
@@ -135,7 +188,6 @@ def run_evaluation():
         print(f"{'='*80}")
         
         # Baseline evaluation
-        baseline_result = evaluate_retrieval(baseline_retriever, query, expected_docs)
         baseline_results.append(baseline_result)
         
         print(f"\n📊 BASELINE RESULTS:")
@@ -145,7 +197,6 @@ def run_evaluation():
         print(f"  Precision: {baseline_result['precision']:.2%}")
         
         # Improved evaluation
-        improved_result = evaluate_retrieval(improved_retriever, query, expected_docs)
         improved_results.append(improved_result)
         
         print(f"\n✨ IMPROVED RESULTS:")
@@ -192,8 +243,8 @@ def run_evaluation():
     results_dir = os.path.dirname(__file__)
     results_path = os.path.join(results_dir, "evaluation_results.json")
     
-    with open(results_path, 'w') as f:
-        json.dump({
+    with open(results_path, 'wb') as f:
+        f.write(orjson.dumps({
             "baseline_results": baseline_results,
             "improved_results": improved_results,
             "summary": {
@@ -204,7 +255,7 @@ def run_evaluation():
                 "recall_improvement": improved_avg_recall - baseline_avg_recall,
                 "precision_improvement": improved_avg_precision - baseline_avg_precision
             }
-        }, f, indent=2)
+        }, option=orjson.OPT_INDENT_2))
     
     print(f"\n✅ Results saved to {results_path}")
     
@@ -4,9 +4,12 @@ Supports both baseline (naive) and improved (structured) indexing.
 """
 
 import os
-import json
 import sys
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import chain, islice
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
+import orjson
 from whoosh import index
 from whoosh.fields import Schema, TEXT, ID, KEYWORD, STORED
 from whoosh.analysis import StandardAnalyzer
@@ -16,15 +19,128 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from llm_extractor import ActivityExtractor
 from retrieval.embedding_generator import EmbeddingGenerator
 from retrieval.qdrant_store import QdrantStore
+from retrieval.stored_fields import pack_document
+
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    # Fallback: parse each file whole with orjson
+    IJSON_AVAILABLE = False
+
+# Below this many documents per worker, forking writer processes costs more
+# than it saves
+MIN_DOCS_PER_PROC = 500
+
+# Documents extracted, written and embedded together by build_improved_index
+INDEX_WINDOW = 1024
+
+
+def _iter_json_array(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, 'rb') as f:
+        if IJSON_AVAILABLE:
+            # Floats as float, not Decimal, which msgpack and orjson can't encode
+            yield from ijson.items(f, 'item', use_float=True)
+        else:
+            yield from orjson.loads(f.read())
+
+
+def iter_documents(destinations_path: str, guides_path: str,
+                   skip_missing: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Stream documents from the destinations and guides JSON files.
+    
+    Args:
+        destinations_path: Path to the destinations JSON array
+        guides_path: Path to the guides JSON array
+        skip_missing: Yield nothing for a file that doesn't exist instead of raising
+    
+    Returns:
+        Iterator over documents, destinations first, tagged with their type
+    """
+    if not skip_missing or os.path.exists(destinations_path):
+        for dest in _iter_json_array(destinations_path):
+            yield {**dest, "type": "destination", "region": f"{dest['name']}, {dest['country']}"}
+    if not skip_missing or os.path.exists(guides_path):
+        for guide in _iter_json_array(guides_path):
+            yield {**guide, "type": "guide"}
+
+
+def document_text(doc: Dict[str, Any]) -> str:
+    """
+    Build the searchable text of a document.
+    
+    Shared by the BM25 and vector builders so every index sees the same text.
+    
+    Args:
+        doc: Document dictionary
+    
+    Returns:
+        Name, country, region and description joined by spaces
+    """
+    return " ".join(part for part in (
+        doc.get("name"), doc.get("country"), doc.get("region"), doc.get("description")
+    ) if part)
+
+
+def merge_activities(extracted_activities: List[str], original_activities: List[str]) -> List[str]:
+    """
+    Merge extracted and original activities, dropping duplicates.
+    
+    Order is preserved (extracted first) so documents and prompts are built
+    reproducibly, and the strings are interned since the same few activities
+    recur across thousands of documents.
+    
+    Args:
+        extracted_activities: Activities extracted by the LLM
+        original_activities: Activities listed in the source data
+    
+    Returns:
+        Normalized, de-duplicated activity list
+    """
+    return list(dict.fromkeys(
+        sys.intern(activity.lower().strip())
+        for activity in (*extracted_activities, *original_activities) if activity
+    ))
+
+
+def _max_writer_procs() -> int:
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def _with_writer_count(documents: Iterable[Dict[str, Any]]) -> Tuple[Iterable[Dict[str, Any]], int]:
+    """
+    Count documents well enough to size the Whoosh writer pool.
+    
+    Streams have no length, so just enough of them is buffered to tell
+    whether every writer process would get MIN_DOCS_PER_PROC documents.
+    
+    Args:
+        documents: Documents to index, as a sized collection or a stream
+    
+    Returns:
+        (documents, count), where documents replays any buffered prefix and
+        count is capped at what the largest writer pool needs
+    """
+    if hasattr(documents, "__len__"):
+        return documents, len(documents)
+    doc_iter = iter(documents)
+    head = list(islice(doc_iter, _max_writer_procs() * MIN_DOCS_PER_PROC))
+    return chain(head, doc_iter), len(head)
 
 
 class IndexBuilder:
     """Builds and manages search indexes for travel documents."""
     
-    def __init__(self, index_dir: str = "indexes", build_vector_index: bool = True):
+    def __init__(self, index_dir: str = "indexes", build_vector_index: bool = True,
+                 cache_dir: Optional[str] = None):
         self.index_dir = index_dir
         os.makedirs(index_dir, exist_ok=True)
-        self.extractor = ActivityExtractor()
+        # LLM extractions persist across rebuilds; delete the file to invalidate
+        self.cache_dir = cache_dir or index_dir
+        self.extractor = ActivityExtractor(
+            cache_path=os.path.join(self.cache_dir, ".llm_cache.sqlite")
+        )
         self.build_vector_index = build_vector_index
         if build_vector_index:
             self.embedding_generator = EmbeddingGenerator()
@@ -39,7 +155,7 @@ class IndexBuilder:
             country=STORED,
             region=STORED,
             content=TEXT(analyzer=StandardAnalyzer()),  # Combined text field
-            raw_data=STORED  # Store full document
+            raw_data=STORED  # Full document, MessagePack
         )
     
     def create_improved_schema(self) -> Schema:
@@ -53,33 +169,35 @@ class IndexBuilder:
             content=TEXT(analyzer=StandardAnalyzer()),  # Still include for BM25
             activities=KEYWORD(stored=True, lowercase=True, commas=True),  # Structured activities
             extracted_activities=STORED,  # Store as list
-            raw_data=STORED
+            raw_data=STORED  # Full document, MessagePack
         )
     
     def load_documents(self, destinations_path: str, guides_path: str) -> List[Dict[str, Any]]:
         """Load documents from JSON files."""
-        documents = []
+        return list(iter_documents(destinations_path, guides_path))
+    
+    def _open_writer(self, ix, num_docs: int):
+        """
+        Open a Whoosh writer, spreading large builds across processes.
         
-        # Load destinations
-        with open(destinations_path, 'r', encoding='utf-8') as f:
-            destinations = json.load(f)
-            for dest in destinations:
-                doc = dest.copy()
-                doc["type"] = "destination"
-                doc["region"] = f"{dest['name']}, {dest['country']}"
-                documents.append(doc)
+        Each worker process tokenizes its share of the documents into its own
+        segment; with multisegment=True the segments are kept as-is instead of
+        being merged on commit.
         
-        # Load guides
-        with open(guides_path, 'r', encoding='utf-8') as f:
-            guides = json.load(f)
-            for guide in guides:
-                doc = guide.copy()
-                doc["type"] = "guide"
-                documents.append(doc)
+        Args:
+            ix: Whoosh index to write to
+            num_docs: Number of documents that will be added (a lower bound
+                      is enough, see _with_writer_count)
         
-        return documents
+        Returns:
+            Whoosh writer
+        """
+        procs = min(_max_writer_procs(), num_docs // MIN_DOCS_PER_PROC)
+        if procs < 2:
+            return ix.writer(limitmb=256)
+        return ix.writer(procs=procs, multisegment=True, limitmb=256)
     
-    def build_baseline_index(self, documents: List[Dict[str, Any]], index_name: str = "baseline"):
+    def build_baseline_index(self, documents: Iterable[Dict[str, Any]], index_name: str = "baseline"):
         """Build baseline index (naive approach - just text search)."""
         schema = self.create_baseline_schema()
         index_path = os.path.join(self.index_dir, index_name)
@@ -91,19 +209,13 @@ class IndexBuilder:
         os.makedirs(index_path, exist_ok=True)
         
         ix = index.create_in(index_path, schema)
-        writer = ix.writer()
+        documents, writer_count = _with_writer_count(documents)
+        writer = self._open_writer(ix, writer_count)
         
+        num_docs = 0
         for i, doc in enumerate(documents):
             doc_id = f"{doc['type']}_{i}"
-            
-            # Combine all text fields for naive search
-            content_parts = [
-                doc.get("name", ""),
-                doc.get("country", ""),
-                doc.get("region", ""),
-                doc.get("description", "")
-            ]
-            content = " ".join(filter(None, content_parts))
+            num_docs += 1
             
             writer.add_document(
                 doc_id=doc_id,
@@ -111,16 +223,32 @@ class IndexBuilder:
                 name=doc.get("name", ""),
                 country=doc.get("country", ""),
                 region=doc.get("region", ""),
-                content=content,
-                raw_data=json.dumps(doc)
+                # Combine all text fields for naive search
+                content=document_text(doc),
+                raw_data=pack_document(doc)
             )
         
         writer.commit()
-        print(f"Built baseline index with {len(documents)} documents")
+        print(f"Built baseline index with {num_docs} documents")
         return index_path
     
-    def build_improved_index(self, documents: List[Dict[str, Any]], index_name: str = "improved"):
-        """Build improved index with structured activity extraction."""
+    def _extract_window(self, window: List[Dict[str, Any]], start: int) -> List[List[str]]:
+        print(f"Extracting activities for documents {start}-{start + len(window) - 1}...")
+        return self.extractor.extract_activities_batch(
+            [(doc.get("description", ""), doc.get("type", "destination")) for doc in window]
+        )
+    
+    def build_improved_index(self, documents: Iterable[Dict[str, Any]], index_name: str = "improved"):
+        """
+        Build improved index with structured activity extraction.
+        
+        Documents are processed in windows of INDEX_WINDOW, pipelined so the
+        external calls overlap: while a window is written to Whoosh, the next
+        window's activities are already being extracted by the LLM, and (if
+        enabled) the window's embeddings and Qdrant upload run alongside, as
+        they don't depend on the extracted activities. Streamed input never
+        has to be held in memory at once.
+        """
         schema = self.create_improved_schema()
         index_path = os.path.join(self.index_dir, index_name)
         
@@ -131,79 +259,96 @@ class IndexBuilder:
         os.makedirs(index_path, exist_ok=True)
         
         ix = index.create_in(index_path, schema)
-        writer = ix.writer()
+        documents, writer_count = _with_writer_count(documents)
+        writer = self._open_writer(ix, writer_count)
+        if self.build_vector_index:
+            print("\nBuilding vector index with Qdrant...")
         
-        for i, doc in enumerate(documents):
-            doc_id = f"{doc['type']}_{i}"
-            
-            # Extract activities using LLM
-            print(f"Extracting activities for {doc.get('name', doc_id)}...")
-            doc_with_activities = self.extractor.extract_structured_fields(doc)
-            extracted_activities = doc_with_activities.get("extracted_activities", [])
-            
-            # Also use original activities if available (for comparison)
-            original_activities = doc.get("activities", [])
-            all_activities = list(set(extracted_activities + original_activities))
-            
-            # Combine text fields for BM25
-            content_parts = [
-                doc.get("name", ""),
-                doc.get("country", ""),
-                doc.get("region", ""),
-                doc.get("description", "")
-            ]
-            content = " ".join(filter(None, content_parts))
+        doc_iter = iter(documents)
+        num_docs = 0
+        # One worker each for the current and next extraction and the vector upload;
+        # Qdrant indexing is suspended until every window has been uploaded
+        bulk_load = self.qdrant_store.bulk_load() if self.build_vector_index else nullcontext()
+        with bulk_load, ThreadPoolExecutor(max_workers=3) as stages:
+            pending_vectors = None
+            window = list(islice(doc_iter, INDEX_WINDOW))
+            pending_extract = stages.submit(self._extract_window, window, 0) if window else None
             
-            # Store activities as comma-separated string for KEYWORD field
-            activities_str = ",".join(all_activities) if all_activities else ""
+            while window:
+                # Built once and shared by the BM25 content field and the embeddings
+                contents = [document_text(doc) for doc in window]
+                
+                # Vector uploads run one window at a time, in order
+                if self.build_vector_index:
+                    if pending_vectors is not None:
+                        pending_vectors.result()
+                    pending_vectors = stages.submit(
+                        self.build_vector_index_for_documents, window, num_docs, contents
+                    )
+                
+                next_window = list(islice(doc_iter, INDEX_WINDOW))
+                extracted = pending_extract.result()
+                if next_window:
+                    pending_extract = stages.submit(
+                        self._extract_window, next_window, num_docs + len(window)
+                    )
+                
+                # The Whoosh writer is not thread-safe, so writes stay on this thread
+                for i, (doc, content, extracted_activities) in enumerate(zip(window, contents, extracted), num_docs):
+                    doc_id = f"{doc['type']}_{i}"
+                    
+                    # Also use original activities if available (for comparison)
+                    all_activities = merge_activities(extracted_activities, doc.get("activities", []))
+                    
+                    # Store activities as comma-separated string for KEYWORD field
+                    activities_str = ",".join(all_activities) if all_activities else ""
+                    
+                    writer.add_document(
+                        doc_id=doc_id,
+                        doc_type=doc["type"],
+                        name=doc.get("name", ""),
+                        country=doc.get("country", ""),
+                        region=doc.get("region", ""),
+                        content=content,
+                        activities=activities_str,
+                        extracted_activities=all_activities,
+                        raw_data=pack_document(doc)
+                    )
+                
+                num_docs += len(window)
+                window = next_window
             
-            writer.add_document(
-                doc_id=doc_id,
-                doc_type=doc["type"],
-                name=doc.get("name", ""),
-                country=doc.get("country", ""),
-                region=doc.get("region", ""),
-                content=content,
-                activities=activities_str,
-                extracted_activities=json.dumps(all_activities),
-                raw_data=json.dumps(doc)
-            )
+            if pending_vectors is not None:
+                pending_vectors.result()
         
         writer.commit()
-        print(f"Built improved index with {len(documents)} documents")
-        
-        # Build vector index if enabled
-        if self.build_vector_index:
-            print("\nBuilding vector index with Qdrant...")
-            self.build_vector_index_for_documents(documents)
+        print(f"Built improved index with {num_docs} documents")
         
         return index_path
     
-    def build_vector_index_for_documents(self, documents: List[Dict[str, Any]]):
+    def build_vector_index_for_documents(self, documents: List[Dict[str, Any]], start: int = 0,
+                                         contents: Optional[List[str]] = None):
         """
         Build vector index in Qdrant for documents.
         
         Args:
             documents: List of documents to index
+            start: Position of the first document in the full corpus, used
+                   for its doc_id and point id
+            contents: document_text() of each document, if already built
         """
+        if contents is None:
+            contents = [document_text(doc) for doc in documents]
         print(f"Generating embeddings for {len(documents)} documents...")
         
         # Prepare documents for vector indexing
         indexed_docs = []
         texts_to_embed = []
         
-        for i, doc in enumerate(documents):
-            # Create text representation for embedding
-            text_parts = [
-                doc.get("name", ""),
-                doc.get("country", ""),
-                doc.get("region", ""),
-                doc.get("description", "")
-            ]
+        for i, (doc, text) in enumerate(zip(documents, contents), start):
+            # Embed the BM25 text plus the activity list
             if doc.get("activities"):
-                text_parts.append(", ".join(doc["activities"]))
-            
-            text = " ".join(filter(None, text_parts))
+                text = f"{text} {', '.join(doc['activities'])}" if text else ", ".join(doc["activities"])
             texts_to_embed.append(text)
             
             # Prepare document metadata
@@ -221,13 +366,13 @@ class IndexBuilder:
         
         # Generate embeddings in batches
         print("Generating embeddings (this may take a few minutes)...")
-        embeddings = self.embedding_generator.generate_embeddings_batch(texts_to_embed, batch_size=100)
+        embeddings = self.embedding_generator.generate_embeddings_batch(texts_to_embed, batch_size=1024)
         
         print(f"Generated {len(embeddings)} embeddings")
         print("Storing in Qdrant...")
         
         # Store in Qdrant
-        self.qdrant_store.add_documents(indexed_docs, embeddings)
+        self.qdrant_store.add_documents(indexed_docs, embeddings, start_id=start)
         
         print(f"✅ Vector index built with {len(indexed_docs)} documents")
 
@@ -249,15 +394,12 @@ if __name__ == "__main__":
         from generate_sample_data import generate_data
         generate_data()
     
-    # Load documents
-    documents = builder.load_documents(destinations_path, guides_path)
-    
-    # Build indexes
+    # Build indexes, streaming the documents from disk for each
     print("Building baseline index...")
-    baseline_path = builder.build_baseline_index(documents)
+    baseline_path = builder.build_baseline_index(iter_documents(destinations_path, guides_path))
     
     print("\nBuilding improved index (this may take a few minutes due to LLM calls)...")
-    improved_path = builder.build_improved_index(documents)
+    improved_path = builder.build_improved_index(iter_documents(destinations_path, guides_path))
     
     print(f"\nIndexes built successfully!")
     print(f"Baseline: {baseline_path}")
@@ -4,8 +4,13 @@ Migrates from custom Whoosh/Qdrant to LangChain framework.
 """
 
 import os
-import json
-from typing import List, Dict, Any, Optional
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+from typing import List, Dict, Any, Optional, Iterable, Iterator
+import orjson
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams, Batch
 from langchain_community.vectorstores import Qdrant
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document
@@ -13,6 +18,56 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from indexing.llm_extractor import ActivityExtractor
+from indexing.index_builder import document_text, iter_documents, merge_activities
+from retrieval.qdrant_store import UPSERT_BATCH_SIZE
+
+
+# Texts per embeddings request (the OpenAI API accepts up to 2048 inputs)
+EMBEDDING_BATCH_SIZE = 1024
+
+# Below this many documents per worker process, start-up costs more than it saves
+MIN_DOCS_PER_WORKER = 5000
+
+# Documents extracted, embedded and uploaded together by build_vector_index;
+# large enough that conversion can still be spread over worker processes
+BUILD_WINDOW = 4 * MIN_DOCS_PER_WORKER
+
+
+def _build_langchain_doc(doc: Dict[str, Any], index: int, extracted_activities: List[str]) -> Document:
+    all_activities = merge_activities(extracted_activities, doc.get("activities", []))
+    
+    # Create text content
+    content = document_text(doc)
+    if all_activities:
+        activities_text = f"Activities: {', '.join(all_activities)}"
+        content = f"{content} {activities_text}" if content else activities_text
+    
+    # Create metadata
+    metadata = {
+        "doc_id": f"{doc.get('type', 'unknown')}_{index}",
+        "doc_type": doc.get("type", "unknown"),
+        "name": doc.get("name", ""),
+        "country": doc.get("country", ""),
+        "region": doc.get("region", ""),
+        # Lowercased copies so query-time filters compare without re-lowering
+        "name_lc": doc.get("name", "").lower(),
+        "country_lc": doc.get("country", "").lower(),
+        "region_lc": doc.get("region", "").lower(),
+        "activities": all_activities,  # Store as list for filtering (already lowercased)
+        "activities_str": ",".join(all_activities),  # Store as string for search
+        "raw_data": orjson.dumps(doc).decode()  # Store original data
+    }
+    
+    return Document(page_content=content, metadata=metadata)
+
+
+def _build_langchain_docs_shard(documents: List[Dict[str, Any]], start: int,
+                                extracted: List[List[str]]) -> List[Document]:
+    """Convert one contiguous shard of documents (process pool worker)."""
+    return [
+        _build_langchain_doc(doc, i, activities)
+        for i, (doc, activities) in enumerate(zip(documents, extracted), start)
+    ]
 
 
 class LangChainIndexBuilder:
@@ -36,81 +91,76 @@ class LangChainIndexBuilder:
             length_function=len,
         )
     
-    def load_documents(self, destinations_path: str, guides_path: str) -> List[Dict[str, Any]]:
-        """Load documents from JSON files."""
-        documents = []
-        
-        if os.path.exists(destinations_path):
-            with open(destinations_path, 'r') as f:
-                destinations = json.load(f)
-                documents.extend(destinations)
-        
-        if os.path.exists(guides_path):
-            with open(guides_path, 'r') as f:
-                guides = json.load(f)
-                documents.extend(guides)
-        
-        return documents
+    def load_documents(self, destinations_path: str, guides_path: str) -> Iterator[Dict[str, Any]]:
+        """Stream documents from the JSON files, skipping files that don't exist."""
+        return iter_documents(destinations_path, guides_path, skip_missing=True)
     
-    def document_to_langchain_doc(self, doc: Dict[str, Any], index: int) -> Document:
+    def document_to_langchain_doc(self, doc: Dict[str, Any], index: int,
+                                  extracted_activities: Optional[List[str]] = None) -> Document:
         """
         Convert a document dict to LangChain Document.
         
         Args:
             doc: Document dictionary
             index: Document index
+            extracted_activities: Activities already extracted for this document;
+                                  extracted with the LLM if not given
         
         Returns:
             LangChain Document with metadata
         """
         # Extract activities using LLM
-        doc_with_activities = self.extractor.extract_structured_fields(doc)
-        extracted_activities = doc_with_activities.get("extracted_activities", [])
-        original_activities = doc.get("activities", [])
-        all_activities = list(set(extracted_activities + original_activities))
-        
-        # Create text content
-        content_parts = [
-            doc.get("name", ""),
-            doc.get("country", ""),
-            doc.get("region", ""),
-            doc.get("description", "")
-        ]
-        if all_activities:
-            content_parts.append(f"Activities: {', '.join(all_activities)}")
-        
-        content = " ".join(filter(None, content_parts))
-        
-        # Create metadata
-        metadata = {
-            "doc_id": f"{doc.get('type', 'unknown')}_{index}",
-            "doc_type": doc.get("type", "unknown"),
-            "name": doc.get("name", ""),
-            "country": doc.get("country", ""),
-            "region": doc.get("region", ""),
-            "activities": all_activities,  # Store as list for filtering
-            "activities_str": ",".join(all_activities),  # Store as string for search
-            "raw_data": json.dumps(doc)  # Store original data
-        }
+        if extracted_activities is None:
+            doc_with_activities = self.extractor.extract_structured_fields(doc)
+            extracted_activities = doc_with_activities.get("extracted_activities", [])
+        return _build_langchain_doc(doc, index, extracted_activities)
+    
+    def documents_to_langchain_docs(self, documents: List[Dict[str, Any]],
+                                    extracted: List[List[str]],
+                                    workers: Optional[int] = None,
+                                    start: int = 0) -> List[Document]:
+        """
+        Convert documents with pre-extracted activities to LangChain Documents.
+        
+        Large corpora are split into contiguous shards converted in worker
+        processes, since building texts and metadata is CPU-bound.
+        
+        Args:
+            documents: List of document dictionaries
+            extracted: Extracted activities, aligned with `documents`
+            workers: Maximum number of worker processes (defaults to CPU count)
+            start: Position of the first document in the full corpus, used for doc ids
         
-        return Document(page_content=content, metadata=metadata)
+        Returns:
+            LangChain Documents, in input order
+        """
+        workers = min(workers or os.cpu_count() or 1, len(documents) // MIN_DOCS_PER_WORKER)
+        if workers <= 1:
+            return _build_langchain_docs_shard(documents, start, extracted)
+        
+        size = -(-len(documents) // workers)
+        starts = range(0, len(documents), size)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            shards = pool.map(
+                _build_langchain_docs_shard,
+                [documents[shard:shard + size] for shard in starts],
+                [start + shard for shard in starts],
+                [extracted[shard:shard + size] for shard in starts]
+            )
+            return list(chain.from_iterable(shards))
     
-    def build_vector_index(self, documents: List[Dict[str, Any]], recreate: bool = True):
+    def build_vector_index(self, documents: Iterable[Dict[str, Any]], recreate: bool = True):
         """
         Build vector index using LangChain QdrantVectorStore.
         
+        Documents are processed in windows of BUILD_WINDOW, so streamed input
+        never has to be held in memory at once.
+        
         Args:
-            documents: List of document dictionaries
+            documents: Document dictionaries, as a list or a stream
             recreate: Whether to recreate the collection
         """
-        print(f"Building LangChain vector index for {len(documents)} documents...")
-        
-        # Convert documents to LangChain Documents
-        langchain_docs = []
-        for i, doc in enumerate(documents):
-            print(f"Processing {i+1}/{len(documents)}: {doc.get('name', 'Unknown')}")
-            langchain_doc = self.document_to_langchain_doc(doc, i)
-            langchain_docs.append(langchain_doc)
+        print("Building LangChain vector index...")
         
         # Create or load Qdrant vector store
         if recreate and os.path.exists(self.qdrant_path):
@@ -123,16 +173,78 @@ class LangChainIndexBuilder:
                 print(f"Warning: Could not remove existing database: {e}")
         
         print("Creating Qdrant vector store...")
-        vector_store = Qdrant.from_documents(
-            documents=langchain_docs,
-            embedding=self.embeddings,
-            path=self.qdrant_path,
+        client = QdrantClient(path=self.qdrant_path)
+        collection_ready = self.collection_name in {
+            col.name for col in client.get_collections().collections
+        }
+        
+        doc_iter = iter(documents)
+        num_docs = 0
+        window = list(islice(doc_iter, BUILD_WINDOW))
+        while window:
+            vectors, langchain_docs = self._embed_window(window, num_docs)
+            if not collection_ready:
+                self._create_collection(client, len(vectors[0]))
+                collection_ready = True
+            self._upsert_window(client, langchain_docs, vectors)
+            num_docs += len(window)
+            window = list(islice(doc_iter, BUILD_WINDOW))
+        
+        if not collection_ready:
+            self._create_collection(client, 1536)
+        vector_store = Qdrant(
+            client=client,
             collection_name=self.collection_name,
+            embeddings=self.embeddings,
         )
         
-        print(f"✅ LangChain vector index built with {len(langchain_docs)} documents")
+        print(f"✅ LangChain vector index built with {num_docs} documents")
         return vector_store
     
+    def _embed_window(self, window: List[Dict[str, Any]], start: int):
+        """Extract activities for, convert and embed one window of documents."""
+        # Extract activities for the window with concurrent LLM calls
+        extracted = self.extractor.extract_activities_batch(
+            [(doc.get("description", ""), doc.get("type", "destination")) for doc in window]
+        )
+        
+        # Convert documents to LangChain Documents
+        print(f"Converting documents {start}-{start + len(window) - 1} to LangChain format...")
+        langchain_docs = self.documents_to_langchain_docs(window, extracted, start=start)
+        
+        # Embed the window's texts in large batches, then upload the
+        # precomputed vectors in the payload layout LangChain's Qdrant store reads
+        texts = [doc.page_content for doc in langchain_docs]
+        unique_texts = list(dict.fromkeys(texts))
+        print(f"Generating embeddings for {len(unique_texts)} unique documents...")
+        unique_vectors = []
+        for batch in range(0, len(unique_texts), EMBEDDING_BATCH_SIZE):
+            unique_vectors.extend(self.embeddings.embed_documents(unique_texts[batch:batch + EMBEDDING_BATCH_SIZE]))
+        vector_by_text = dict(zip(unique_texts, unique_vectors))
+        return [vector_by_text[text] for text in texts], langchain_docs
+    
+    def _create_collection(self, client: QdrantClient, size: int):
+        client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=VectorParams(size=size, distance=Distance.COSINE)
+        )
+    
+    def _upsert_window(self, client: QdrantClient, langchain_docs: List[Document],
+                       vectors: List[List[float]]):
+        # Pipeline column-oriented batches; only the last waits to be applied
+        for start in range(0, len(langchain_docs), UPSERT_BATCH_SIZE):
+            end = start + UPSERT_BATCH_SIZE
+            chunk = langchain_docs[start:end]
+            client.upsert(
+                collection_name=self.collection_name,
+                points=Batch(
+                    ids=[str(uuid.uuid4()) for _ in chunk],
+                    vectors=vectors[start:end],
+                    payloads=[{"page_content": doc.page_content, "metadata": doc.metadata} for doc in chunk]
+                ),
+                wait=end >= len(langchain_docs)
+            )
+    
     def load_vector_store(self) -> Qdrant:
         """Load existing Qdrant vector store."""
         return Qdrant(
@@ -159,7 +271,7 @@ if __name__ == "__main__":
         from generate_sample_data import generate_data
         generate_data()
     
-    # Load documents
+    # Stream documents
     documents = builder.load_documents(destinations_path, guides_path)
     
     # Build index
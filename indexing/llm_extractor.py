@@ -4,25 +4,110 @@ Extracts activities/services from document descriptions.
 """
 
 import os
-import json
-from typing import List, Dict, Any
+import atexit
+import hashlib
+import sqlite3
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Tuple, Optional
+import httpx
+import orjson
+from cachetools import LRUCache
 from openai import OpenAI
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# HTTP/2 needs the optional h2 package; without it httpx speaks HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_http_client: Optional[httpx.Client] = None
+_http_client_lock = threading.Lock()
+
+
+def _get_http_client() -> httpx.Client:
+    """
+    Return the process-wide HTTP client shared by all extractors.
+    
+    Concurrent extraction requests reuse its pooled keep-alive connections
+    (multiplexed over HTTP/2 when available) instead of each client opening
+    its own.
+    """
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+                timeout=30.0
+            )
+            atexit.register(_http_client.close)
+        return _http_client
+
 
 class ActivityExtractor:
     """Extracts structured activities from travel documents using LLM."""
     
-    def __init__(self, model: str = "gpt-3.5-turbo"):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self, model: str = "gpt-4o-mini", cache_path: Optional[str] = None):
+        """
+        Initialize the extractor.
+        
+        Args:
+            model: OpenAI chat model to use
+            cache_path: Optional SQLite file persisting extractions across runs;
+                delete the file to invalidate it
+        """
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=_get_http_client())
         self.model = model
+        self.cache_path = cache_path
+        self._memory_cache = LRUCache(maxsize=4096)
+        self._db = None
+        self._db_lock = threading.Lock()
+    
+    def _cache_key(self, description: str, doc_type: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{doc_type}\0{description}".encode()).hexdigest()
+    
+    def _get_db(self) -> sqlite3.Connection:
+        # Opened lazily so extractors that never extract don't create the file
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            self._db = sqlite3.connect(self.cache_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS activities (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+        return self._db
+    
+    def _cache_get(self, key: str) -> Optional[List[str]]:
+        with self._db_lock:
+            if key in self._memory_cache:
+                return self._memory_cache[key]
+            row = self._get_db().execute(
+                "SELECT value FROM activities WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            activities = orjson.loads(row[0])
+            self._memory_cache[key] = activities
+            return activities
+    
+    def _cache_set(self, key: str, activities: List[str]):
+        with self._db_lock:
+            db = self._get_db()
+            with db:
+                db.execute(
+                    "INSERT OR REPLACE INTO activities (key, value) VALUES (?, ?)",
+                    (key, orjson.dumps(activities).decode())
+                )
+            self._memory_cache[key] = activities
     
     def extract_activities(self, description: str, doc_type: str = "destination") -> List[str]:
         """
         Extract activities/services from a document description.
         
+        Results are served from the on-disk cache when `cache_path` is set and
+        the same model, document type and description were seen before.
+        
         Args:
             description: The document description text
             doc_type: Type of document ("destination" or "guide")
@@ -30,49 +115,81 @@ class ActivityExtractor:
         Returns:
             List of extracted activity strings
         """
+        key = None
+        if self.cache_path is not None:
+            key = self._cache_key(description, doc_type)
+            cached = self._cache_get(key)
+            if cached is not None:
+                return list(cached)
+        
+        try:
+            activities = self._request_activities(description, doc_type)
+        except Exception as e:
+            print(f"Error extracting activities: {e}")
+            return []
+        
+        # Failures are not cached so the next build retries them
+        if key is not None:
+            self._cache_set(key, activities)
+        return activities
+    
+    def _request_activities(self, description: str, doc_type: str) -> List[str]:
+        """Call the LLM and parse its answer, raising on API or parse errors."""
         prompt = f"""Extract a structured list of activities, services, or experiences mentioned in the following {doc_type} description.
 
-Return ONLY a JSON array of activity strings. Each activity should be a concise, normalized term (e.g., "snorkeling", "wine tasting", "city tours").
+Each activity should be a concise, normalized term (e.g., "snorkeling", "wine tasting", "city tours").
 
 Description:
 {description}
 
-Return format (JSON array only, no other text):
-["activity1", "activity2", "activity3"]
+Return a JSON object of the form:
+{{"activities": ["activity1", "activity2", "activity3"]}}
 """
         
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that extracts structured information from travel descriptions. Always return valid JSON arrays."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=200
-            )
-            
-            content = response.choices[0].message.content.strip()
-            
-            # Clean up the response (remove markdown code blocks if present)
-            if content.startswith("```"):
-                content = content.split("```")[1]
-                if content.startswith("json"):
-                    content = content[4:]
-                content = content.strip()
-            
-            activities = json.loads(content)
-            
-            # Ensure it's a list of strings
-            if isinstance(activities, list):
-                return [str(a).lower().strip() for a in activities if a]
-            else:
-                return []
-                
-        except Exception as e:
-            print(f"Error extracting activities: {e}")
+        # JSON mode guarantees a parseable object, so no markdown fences to strip
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant that extracts structured information from travel descriptions. Always return valid JSON."},
+                {"role": "user", "content": prompt}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.1,
+            max_tokens=200
+        )
+        
+        activities = orjson.loads(response.choices[0].message.content).get("activities", [])
+        
+        # Ensure it's a list of strings
+        if isinstance(activities, list):
+            return [str(a).lower().strip() for a in activities if a]
+        else:
             return []
     
+    def extract_activities_batch(self, items: List[Tuple[str, str]],
+                                 max_concurrency: int = 16) -> List[List[str]]:
+        """
+        Extract activities for many documents with concurrent LLM requests.
+        
+        Args:
+            items: List of (description, doc_type) pairs
+            max_concurrency: Maximum number of requests in flight
+        
+        Returns:
+            List of extracted activity lists, aligned with `items`
+        """
+        if not items:
+            return []
+        
+        # Identical (description, doc_type) pairs are extracted once
+        unique_items = list(dict.fromkeys(items))
+        
+        # Requests are network-bound, so threads sharing the client overlap
+        # their round trips; failures yield [] per item as in extract_activities
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(unique_items))) as pool:
+            extracted = dict(zip(unique_items, pool.map(lambda item: self.extract_activities(*item), unique_items)))
+        return [list(extracted[item]) for item in items]
+    
     def extract_structured_fields(self, document: Dict[str, Any]) -> Dict[str, Any]:
         """
         Extract structured fields from a document.
@@ -1,2 +1,46 @@
 """Retrieval module for Travel Agency RAG System."""
 
+import importlib
+
+__all__ = [
+    "ActivityMatcher",
+    "BaselineRetriever",
+    "EmbeddingGenerator",
+    "HybridRetriever",
+    "ImprovedRetriever",
+    "LangChainHybridRetriever",
+    "LangChainVectorRetriever",
+    "QdrantStore",
+    "QueryRewriter",
+    "SemanticQueryCache",
+    "VectorRetriever",
+]
+
+# Public name -> defining submodule. Submodules are imported on first
+# attribute access so importing the package stays cheap, and the optional
+# LangChain stack is only loaded when its retrievers are actually used.
+_EXPORTS = {
+    "ActivityMatcher": "activity_matcher",
+    "BaselineRetriever": "baseline_retriever",
+    "EmbeddingGenerator": "embedding_generator",
+    "HybridRetriever": "hybrid_retriever",
+    "ImprovedRetriever": "improved_retriever",
+    "LangChainHybridRetriever": "langchain_retriever",
+    "LangChainVectorRetriever": "langchain_retriever",
+    "QdrantStore": "qdrant_store",
+    "QueryRewriter": "query_rewriter",
+    "SemanticQueryCache": "semantic_cache",
+    "VectorRetriever": "vector_retriever",
+}
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{_EXPORTS[name]}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
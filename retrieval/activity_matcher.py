@@ -3,8 +3,48 @@ Activity matching with fuzzy matching and synonym expansion.
 Handles plural/singular variations and similar activity names.
 """
 
-from typing import List, Set
+from functools import lru_cache
+from typing import FrozenSet, List, Sequence, Set
 import re
+import threading
+
+import numpy as np
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
+
+# Upper bound on memoized expansions of activities outside SYNONYMS/CATEGORIES
+MAX_CACHED_EXPANSIONS = 4096
+
+# Upper bound on memoized normalized activity strings
+MAX_CACHED_NORMALIZED = 65536
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Lookup tables built once per ActivityMatcher class, see ActivityMatcher.__init__
+_STATIC_TABLE_ATTRS = (
+    "_synonym_map", "_category_terms", "_category_substrings",
+    "_category_lengths", "_static_expansions",
+)
+_STATIC_TABLES = {}
+_STATIC_TABLES_LOCK = threading.Lock()
+
+
+def _strip_suffix(s: str) -> str:
+    """
+    Strip a plural suffix and then a gerund suffix from a normalized activity.
+    
+    Only whole suffixes are removed, and only when a stem of at least three
+    characters remains; "ies" becomes "y" (galleries -> gallery).
+    """
+    if s.endswith('ies') and len(s) > 5:
+        s = s[:-3] + 'y'
+    elif s.endswith('es') and len(s) > 4:
+        s = s[:-2]
+    elif s.endswith('s') and len(s) > 3:
+        s = s[:-1]
+    if s.endswith('ing') and len(s) > 5:
+        s = s[:-3]
+    return s
 
 
 class ActivityMatcher:
@@ -82,17 +122,54 @@ class ActivityMatcher:
     
     def __init__(self):
         """Initialize the activity matcher."""
+        self._norm_cache = {}
+        
+        # Activities outside SYNONYMS/CATEGORIES are memoized per instance as seen
+        self._expand_cached = lru_cache(maxsize=MAX_CACHED_EXPANSIONS)(self._expand_uncached)
+        self._morph_cached = lru_cache(maxsize=MAX_CACHED_EXPANSIONS)(self._expand_with_morph_uncached)
+        
+        # Lookup tables depend only on the class constants, so they are built
+        # by the first instance of each class and shared by the rest
+        with _STATIC_TABLES_LOCK:
+            tables = _STATIC_TABLES.get(type(self))
+            if tables is None:
+                self._build_static_tables()
+                tables = {name: getattr(self, name) for name in _STATIC_TABLE_ATTRS}
+                _STATIC_TABLES[type(self)] = tables
+        for name, value in tables.items():
+            setattr(self, name, value)
+    
+    def _build_static_tables(self):
+        """Build the lookup tables derived from SYNONYMS and CATEGORIES."""
         # Build reverse lookup for faster matching
         self._synonym_map = {}
         for key, synonyms in self.SYNONYMS.items():
-            for synonym in synonyms:
-                normalized = self._normalize(synonym)
-                if normalized not in self._synonym_map:
-                    self._synonym_map[normalized] = set()
-                self._synonym_map[normalized].add(self._normalize(key))
-                # Also add all synonyms to the set
-                for s in synonyms:
-                    self._synonym_map[normalized].add(self._normalize(s))
+            # Every synonym maps to the key and all of its synonyms
+            normalized = {self._normalize(s) for s in synonyms}
+            closure = normalized | {self._normalize(key)}
+            for synonym in normalized:
+                self._synonym_map.setdefault(synonym, set()).update(closure)
+        
+        # Category members in both their raw and normalized spelling
+        self._category_terms = {
+            category: frozenset(activities).union(self._normalize(a) for a in activities)
+            for category, activities in self.CATEGORIES.items()
+        }
+        
+        # Every substring of every category name -> categories containing it,
+        # plus the distinct name lengths, so category pattern checks are lookups
+        self._category_substrings = {"": set(self.CATEGORIES)}
+        for category in self.CATEGORIES:
+            for i in range(len(category)):
+                for j in range(i + 1, len(category) + 1):
+                    self._category_substrings.setdefault(category[i:j], set()).add(category)
+        self._category_lengths = sorted({len(category) for category in self.CATEGORIES})
+        
+        # Expansions of the known terms are fixed, so compute them once
+        self._static_expansions = {
+            normalized: self._expand_uncached(normalized)
+            for normalized in {self._normalize(k) for k in (*self.SYNONYMS, *self.CATEGORIES)}
+        }
     
     def _normalize(self, activity: str) -> str:
         """
@@ -104,10 +181,19 @@ class ActivityMatcher:
         Returns:
             Normalized activity string
         """
+        normalized = self._norm_cache.get(activity)
+        if normalized is not None:
+            return normalized
+        
         # Convert to lowercase and strip
         normalized = activity.lower().strip()
-        # Remove extra whitespace
-        normalized = re.sub(r'\s+', ' ', normalized)
+        # Remove extra whitespace; any whitespace other than a single ASCII
+        # space is non-printable, so most inputs skip the regex entirely
+        if '  ' in normalized or not normalized.isprintable():
+            normalized = _WHITESPACE_RE.sub(' ', normalized)
+        
+        if len(self._norm_cache) < MAX_CACHED_NORMALIZED:
+            self._norm_cache[activity] = normalized
         return normalized
     
     def _fuzzy_match(self, query_activity: str, data_activity: str, threshold: float = 0.8) -> bool:
@@ -122,9 +208,13 @@ class ActivityMatcher:
         Returns:
             True if activities match
         """
-        query_norm = self._normalize(query_activity)
-        data_norm = self._normalize(data_activity)
-        
+        return self._fuzzy_match_normalized(
+            self._normalize(query_activity), self._normalize(data_activity), threshold
+        )
+    
+    def _fuzzy_match_normalized(self, query_norm: str, data_norm: str,
+                                threshold: float = 0.8) -> bool:
+        """_fuzzy_match for activities that are already normalized."""
         # Exact match
         if query_norm == data_norm:
             return True
@@ -137,20 +227,26 @@ class ActivityMatcher:
         if self._is_plural_variant(query_norm, data_norm):
             return True
         
-        # Simple similarity check (Levenshtein-like)
-        similarity = self._simple_similarity(query_norm, data_norm)
-        if similarity >= threshold:
+        # Edit-distance similarity, bounded so clearly different strings exit early;
+        # the distance is at least the length gap, so most pairs stop here
+        max_len = max(len(query_norm), len(data_norm))
+        max_dist = int((1 - threshold) * max_len + 1e-9)
+        if abs(len(query_norm) - len(data_norm)) > max_dist:
+            return False
+        if self._edit_distance(query_norm, data_norm, max_dist) <= max_dist:
             return True
         
         return False
     
     def _is_plural_variant(self, a1: str, a2: str) -> bool:
         """Check if two strings are plural/singular variants."""
-        # Remove common endings and compare
-        a1_base = a1.rstrip('s').rstrip('es').rstrip('ing')
-        a2_base = a2.rstrip('s').rstrip('es').rstrip('ing')
+        # Remove common endings and compare; a silent "e" may have been dropped
+        # before the suffix (hike -> hiking, dive -> dives)
+        a1_base = _strip_suffix(a1)
+        a2_base = _strip_suffix(a2)
         
-        if a1_base == a2_base and len(a1_base) > 2:
+        if len(a1_base) > 2 and (a1_base == a2_base or a1_base + 'e' == a2_base
+                                 or a2_base + 'e' == a1_base):
             return True
         
         # Check if one is the other + 's' or 'es'
@@ -161,19 +257,53 @@ class ActivityMatcher:
         
         return False
     
+    def _edit_distance(self, s1: str, s2: str, max_dist: int) -> int:
+        """Bounded edit distance; max_dist + 1 when the strings are further apart."""
+        return Levenshtein.distance(s1, s2, score_cutoff=max_dist)
+    
+    def _fuzzy_matches(self, query_norms: Sequence[str], data_norms: Sequence[str],
+                       threshold: float = 0.8) -> List[bool]:
+        """
+        _fuzzy_match_normalized for every pair at once.
+        
+        Edit distances for the whole query x data grid come from a single
+        rapidfuzz cdist call; the substring and plural checks run only for
+        data activities the distance test did not already accept.
+        
+        Args:
+            query_norms: Normalized query activities
+            data_norms: Normalized data activities
+            threshold: Similarity threshold (0-1)
+        
+        Returns:
+            Whether each data activity fuzzy matches any query activity
+        """
+        if not query_norms or not data_norms:
+            return [False] * len(data_norms)
+        
+        query_lens = np.array([len(q) for q in query_norms])
+        data_lens = np.array([len(d) for d in data_norms])
+        max_dist = ((1 - threshold) * np.maximum.outer(data_lens, query_lens) + 1e-9).astype(np.int64)
+        dist = process.cdist(data_norms, query_norms, scorer=Levenshtein.distance,
+                             score_cutoff=int(max_dist.max()))
+        matched = (dist <= max_dist).any(axis=1).tolist()
+        
+        for i, data_norm in enumerate(data_norms):
+            if not matched[i]:
+                matched[i] = any(
+                    query_norm in data_norm or data_norm in query_norm
+                    or self._is_plural_variant(query_norm, data_norm)
+                    for query_norm in query_norms
+                )
+        return matched
+    
     def _simple_similarity(self, s1: str, s2: str) -> float:
-        """Calculate simple similarity between two strings."""
+        """Calculate edit-distance similarity between two strings (1.0 = identical)."""
         if not s1 or not s2:
             return 0.0
         
-        # Count common characters
-        common = sum(1 for c in s1 if c in s2)
         max_len = max(len(s1), len(s2))
-        
-        if max_len == 0:
-            return 1.0
-        
-        return common / max_len
+        return 1 - self._edit_distance(s1, s2, max_len) / max_len
     
     def expand_activity(self, activity: str) -> Set[str]:
         """
@@ -183,25 +313,67 @@ class ActivityMatcher:
             activity: Activity string to expand
         
         Returns:
-            Set of expanded activity strings
+            Set of expanded activity strings (shared; do not mutate)
         """
         normalized = self._normalize(activity)
-        expanded = {normalized, activity.lower().strip()}
-        
-        # Check if it's a category term
-        if normalized in self.CATEGORIES:
-            # Expand category to specific activities
-            expanded.update(self.CATEGORIES[normalized])
-            # Also add normalized versions
-            for cat_activity in self.CATEGORIES[normalized]:
-                expanded.add(self._normalize(cat_activity))
-        
-        # Check for category patterns (e.g., "outdoor activities")
-        for category, activities in self.CATEGORIES.items():
-            if normalized in category or category in normalized:
-                expanded.update(activities)
-                for cat_activity in activities:
-                    expanded.add(self._normalize(cat_activity))
+        expanded = self._static_expansions.get(normalized)
+        if expanded is None:
+            expanded = self._expand_cached(normalized)
+        
+        stripped = activity.lower().strip()
+        if stripped != normalized and stripped not in expanded:
+            expanded = expanded | {stripped}
+        return expanded
+    
+    def expand_with_morph(self, activity: str) -> FrozenSet[str]:
+        """
+        Expand an activity and add plural/singular variants of every expansion.
+        
+        Args:
+            activity: Activity string to expand
+        
+        Returns:
+            Frozen set of expanded activity strings and their variants
+        """
+        return self._morph_cached(activity.lower().strip())
+    
+    def _expand_with_morph_uncached(self, activity: str) -> FrozenSet[str]:
+        """Compute expand_with_morph for a lowercased, stripped activity."""
+        variants = {activity}
+        for expanded in self.expand_activity(activity):
+            variants.add(expanded)
+            if expanded.endswith('es'):
+                variants.update((expanded[:-1], expanded[:-2]))
+            elif expanded.endswith('s'):
+                if len(expanded) > 1:
+                    variants.add(expanded[:-1])
+                variants.add(expanded + 'es')
+            else:
+                variants.add(expanded + 's')
+        return frozenset(variants)
+    
+    def _matching_categories(self, normalized: str) -> Set[str]:
+        """Return categories that contain, or are contained in, an activity."""
+        # Activity is part of a category name
+        matches = set(self._category_substrings.get(normalized, ()))
+        
+        # Category name is part of the activity
+        for length in self._category_lengths:
+            if length > len(normalized):
+                break
+            for i in range(len(normalized) - length + 1):
+                sub = normalized[i:i + length]
+                if sub in self._category_terms:
+                    matches.add(sub)
+        return matches
+    
+    def _expand_uncached(self, normalized: str) -> FrozenSet[str]:
+        """Compute the expansion of an already normalized activity."""
+        expanded = {normalized}
+        
+        # Check for category terms and patterns (e.g., "outdoor activities")
+        for category in self._matching_categories(normalized):
+            expanded.update(self._category_terms[category])
         
         # Add from synonym map
         if normalized in self._synonym_map:
@@ -218,7 +390,7 @@ class ActivityMatcher:
             for synonym in self.SYNONYMS[normalized]:
                 expanded.add(self._normalize(synonym))
         
-        return expanded
+        return frozenset(expanded)
     
     def get_category_activities(self, category: str) -> List[str]:
         """
@@ -251,21 +423,15 @@ class ActivityMatcher:
         expanded_queries = set()
         for q_activity in query_activities:
             expanded_queries.update(self.expand_activity(q_activity))
+        expanded_queries = {self._normalize(q) for q in expanded_queries}
         
-        # Check each data activity against expanded queries
-        for data_activity in data_activities:
-            data_norm = self._normalize(data_activity)
-            
-            # Check exact match in expanded set
-            if data_norm in expanded_queries:
-                return True
-            
-            # Check fuzzy match
-            for expanded_query in expanded_queries:
-                if self._fuzzy_match(expanded_query, data_activity):
-                    return True
+        # Check exact match in expanded set for all data activities at once
+        data_norms = {self._normalize(d) for d in data_activities}
+        if not expanded_queries.isdisjoint(data_norms):
+            return True
         
-        return False
+        # Check fuzzy match only when nothing matched exactly
+        return any(self._fuzzy_matches(list(expanded_queries), list(data_norms)))
     
     def find_matching_activities(self, query_activities: List[str], data_activities: List[str]) -> List[str]:
         """
@@ -287,21 +453,19 @@ class ActivityMatcher:
         expanded_queries = set()
         for q_activity in query_activities:
             expanded_queries.update(self.expand_activity(q_activity))
+        expanded_queries = {self._normalize(q) for q in expanded_queries}
+        
+        # Exact matches for all data activities at once
+        data_norms = [self._normalize(d) for d in data_activities]
+        exact = expanded_queries.intersection(data_norms)
+        
+        # Fuzzy match each distinct data activity without an exact match at most once
+        remaining = list(dict.fromkeys(d for d in data_norms if d not in exact))
+        fuzzy = dict(zip(remaining, self._fuzzy_matches(list(expanded_queries), remaining)))
         
-        # Check each data activity
-        for data_activity in data_activities:
-            data_norm = self._normalize(data_activity)
-            
-            # Check exact match
-            if data_norm in expanded_queries:
+        for data_activity, data_norm in zip(data_activities, data_norms):
+            if data_norm in exact or fuzzy[data_norm]:
                 matches.append(data_activity)
-                continue
-            
-            # Check fuzzy match
-            for expanded_query in expanded_queries:
-                if self._fuzzy_match(expanded_query, data_activity):
-                    matches.append(data_activity)
-                    break
         
         return matches
 
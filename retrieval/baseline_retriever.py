@@ -4,12 +4,37 @@ Demonstrates limitations of simple text matching.
 """
 
 import os
-import json
+import threading
+import weakref
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
 from whoosh import index
 from whoosh.qparser import QueryParser
 from whoosh.query import And, Or, Term
 
+from retrieval.stored_fields import unpack_document
+
+
+@lru_cache(maxsize=4096)
+def _parse_doc(doc_id: str, raw) -> Dict[str, Any]:
+    """
+    Decode a stored document, memoized for documents that keep ranking high.
+    
+    The stored value is part of the key, so a rebuilt index never serves a
+    stale document. The returned dict is shared between hits; do not mutate it.
+    """
+    return unpack_document(raw)
+
+
+def _close_searchers(searchers: Dict[int, Any], lock: threading.Lock, ix):
+    """Close and forget every searcher in a BaselineRetriever's pool."""
+    with lock:
+        pending = list(searchers.values())
+        searchers.clear()
+    for searcher in pending:
+        searcher.close()
+    ix.close()
+
 
 class BaselineRetriever:
     """Naive BM25-based retriever (baseline approach)."""
@@ -26,8 +51,19 @@ class BaselineRetriever:
         
         self.index_path = index_path
         self.ix = index.open_dir(index_path)
-        self.searcher = self.ix.searcher()
+        # Whoosh searchers must not be shared across threads, so each thread
+        # gets its own, created on first use and kept until close()
+        self._local = threading.local()
+        self._searchers = {}
+        self._searchers_lock = threading.Lock()
+        # Releases the searchers' file handles even if close() is never called
+        self._finalizer = weakref.finalize(
+            self, _close_searchers, self._searchers, self._searchers_lock, self.ix
+        )
         self.query_parser = QueryParser("content", schema=self.ix.schema)
+        # Whoosh query trees are immutable once parsed, so repeated query
+        # strings reuse the parse instead of re-running the parser plugins
+        self._parse = lru_cache(maxsize=1024)(self.query_parser.parse)
     
     def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
         """
@@ -41,31 +77,72 @@ class BaselineRetriever:
             List of retrieved documents with scores
         """
         # Parse query for BM25 search
-        parsed_query = self.query_parser.parse(query)
+        parsed_query = self._parse(query)
         
         # Search
-        results = self.searcher.search(parsed_query, limit=limit)
+        searcher = self._searcher()
+        results = searcher.search(parsed_query, limit=limit)
         
-        # Format results
+        # Format results, reading stored fields by docnum without a Hit per result
         formatted_results = []
-        for result in results:
-            doc = json.loads(result["raw_data"])
+        for score, docnum in results.top_n:
+            fields = searcher.stored_fields(docnum)
+            doc = _parse_doc(fields["doc_id"], fields["raw_data"])
             formatted_results.append({
-                "doc_id": result["doc_id"],
-                "doc_type": result["doc_type"],
-                "name": result["name"],
-                "country": result.get("country", ""),
-                "region": result.get("region", ""),
-                "score": result.score,
+                "doc_id": fields["doc_id"],
+                "doc_type": fields["doc_type"],
+                "name": fields["name"],
+                "country": fields.get("country", ""),
+                "region": fields.get("region", ""),
+                "score": score,
                 "document": doc
             })
         
         return formatted_results
     
+    def _searcher(self):
+        """Return this thread's searcher, refreshed if the index has changed."""
+        searcher = getattr(self._local, "searcher", None)
+        if searcher is not None:
+            fresh = searcher.refresh()
+            if fresh is not searcher:
+                self._local.searcher = fresh
+                with self._searchers_lock:
+                    self._searchers[threading.get_ident()] = fresh
+            return fresh
+        
+        searcher = self._local.searcher = self.ix.searcher()
+        with self._searchers_lock:
+            # A leftover entry belongs to a finished thread whose id was reused
+            stale = self._searchers.pop(threading.get_ident(), None)
+            self._searchers[threading.get_ident()] = searcher
+        if stale is not None:
+            stale.close()
+        return searcher
+    
+    def search_batch(self, queries: List[str], limits: List[int]) -> List[List[Dict[str, Any]]]:
+        """
+        Perform several searches against the same searcher.
+        
+        Args:
+            queries: Natural language queries
+            limits: Maximum number of results for each query
+        
+        Returns:
+            List of result lists, aligned with `queries`
+        """
+        return [self.search(query, limit=limit) for query, limit in zip(queries, limits)]
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
     def close(self):
-        """Close the searcher."""
-        if self.searcher:
-            self.searcher.close()
+        """Close the searchers of every thread and the index."""
+        _close_searchers(self._searchers, self._searchers_lock, self.ix)
+        self._local = threading.local()
 
 
 if __name__ == "__main__":
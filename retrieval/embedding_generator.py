@@ -3,12 +3,20 @@ Generate embeddings for documents and queries using OpenAI.
 """
 
 import os
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional
+import numpy as np
 from openai import OpenAI
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Attempts per embedding request before giving up, and the first backoff delay
+MAX_ATTEMPTS = 4
+BACKOFF_SECONDS = 0.5
+
 
 class EmbeddingGenerator:
     """Generates embeddings using OpenAI's embedding model."""
@@ -24,8 +32,20 @@ class EmbeddingGenerator:
         """
         self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         self.model = model
+        # Releases the HTTP connection pool even if close() is never called
+        self._finalizer = weakref.finalize(self, self.client.close)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def close(self):
+        """Close the OpenAI client and its HTTP connections."""
+        self._finalizer()
     
-    def generate_embedding(self, text: str) -> List[float]:
+    def generate_embedding(self, text: str) -> np.ndarray:
         """
         Generate embedding for a single text.
         
@@ -33,52 +53,137 @@ class EmbeddingGenerator:
             text: Text to embed
         
         Returns:
-            List of floats representing the embedding vector
+            float32 array holding the embedding vector
         """
         try:
             response = self.client.embeddings.create(
                 model=self.model,
                 input=text
             )
-            return response.data[0].embedding
+            return np.asarray(response.data[0].embedding, dtype=np.float32)
         except Exception as e:
             print(f"Error generating embedding: {e}")
             raise
     
-    def generate_embeddings_batch(self, texts: List[str], batch_size: int = 100) -> List[List[float]]:
+    def generate_embeddings_batch(self, texts: List[str], batch_size: int = 100,
+                                  concurrency: int = 8) -> np.ndarray:
         """
         Generate embeddings for multiple texts in batches.
         
+        Batches are sent concurrently, so the round trips of up to
+        `concurrency` requests overlap.
+        
         Args:
             texts: List of texts to embed
             batch_size: Number of texts to process per batch
+            concurrency: Maximum number of requests in flight
         
         Returns:
-            List of embedding vectors
+            float32 array of shape (len(texts), dimension), aligned with `texts`
+        
+        Raises:
+            Exception: If a batch still fails after retrying
         """
-        embeddings = []
+        # Identical texts are embedded once and fanned back out
+        unique_texts = list(dict.fromkeys(texts))
+        batches = [unique_texts[i:i + batch_size] for i in range(0, len(unique_texts), batch_size)]
+        
+        if not batches:
+            return np.empty((0, self.get_embedding_dimension()), dtype=np.float32)
+        
+        if len(batches) <= 1 or concurrency <= 1:
+            batch_results = map(self._embed_batch, batches)
+            embeddings = self._collect(batch_results, len(unique_texts))
+        else:
+            with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as executor:
+                embeddings = self._collect(executor.map(self._embed_batch, batches), len(unique_texts))
         
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
+        if len(unique_texts) == len(texts):
+            return embeddings
+        row = {text: i for i, text in enumerate(unique_texts)}
+        return embeddings[[row[text] for text in texts]]
+    
+    def generate_embeddings_to_mmap(self, texts: List[str], path: str, batch_size: int = 100,
+                                    concurrency: int = 8) -> np.memmap:
+        """
+        Generate embeddings for many texts straight into a memory-mapped file.
+        
+        Texts are embedded `batch_size * concurrency` at a time, so only one
+        such chunk of vectors is held in memory; the rest live in the
+        page cache backing `path`.
+        
+        Args:
+            texts: List of texts to embed
+            path: File to write the float32 (len(texts), dimension) matrix to
+            batch_size: Number of texts to process per batch
+            concurrency: Maximum number of requests in flight
+        
+        Returns:
+            Memory-mapped float32 array, aligned with `texts`
+        """
+        out = np.memmap(path, dtype=np.float32, mode='w+',
+                        shape=(len(texts), self.get_embedding_dimension()))
+        chunk = batch_size * max(concurrency, 1)
+        for start in range(0, len(texts), chunk):
+            end = start + chunk
+            out[start:end] = self.generate_embeddings_batch(texts[start:end], batch_size, concurrency)
+        out.flush()
+        return out
+    
+    @staticmethod
+    def _collect(batch_results, num_rows: int) -> np.ndarray:
+        """Copy per-batch embedding lists into one preallocated float32 matrix."""
+        embeddings = None
+        row = 0
+        for batch in batch_results:
+            if embeddings is None:
+                embeddings = np.empty((num_rows, len(batch[0])), dtype=np.float32)
+            embeddings[row:row + len(batch)] = batch
+            row += len(batch)
+        return embeddings
+    
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """Embed one batch, retrying with exponential backoff."""
+        for attempt in range(MAX_ATTEMPTS):
             try:
                 response = self.client.embeddings.create(
                     model=self.model,
                     input=batch
                 )
-                batch_embeddings = [item.embedding for item in response.data]
-                embeddings.extend(batch_embeddings)
+                return [item.embedding for item in response.data]
             except Exception as e:
-                print(f"Error generating embeddings for batch {i//batch_size + 1}: {e}")
-                # Generate individual embeddings for this batch as fallback
-                for text in batch:
-                    try:
-                        embedding = self.generate_embedding(text)
-                        embeddings.append(embedding)
-                    except:
-                        # Use zero vector as fallback
-                        embeddings.append([0.0] * 1536)  # text-embedding-3-small dimension
+                if attempt == MAX_ATTEMPTS - 1:
+                    print(f"Error generating embeddings for batch of {len(batch)}: {e}")
+                    raise
+                time.sleep(BACKOFF_SECONDS * 2 ** attempt)
+    
+    def quantize(self, emb: np.ndarray, mode: str = "fp16"):
+        """
+        Shrink float32 embeddings for storage or bandwidth-bound scans.
         
-        return embeddings
+        The Qdrant collection already keeps its own int8 copy of the vectors
+        (see QdrantStore's ScalarQuantization); this is for embeddings kept
+        client-side, e.g. the arrays written by generate_embeddings_to_mmap.
+        
+        Args:
+            emb: float32 array of shape (n, dimension) or (dimension,)
+            mode: "fp16" for half precision, or "int8" for 8-bit values with a
+                  per-vector scale (approximate vector = q * scale)
+        
+        Returns:
+            The float16 array for "fp16", or a (q, scale) tuple of the int8
+            array and float16 per-row scales for "int8"
+        """
+        emb = np.asarray(emb, dtype=np.float32)
+        if mode == "fp16":
+            return emb.astype(np.float16)
+        if mode == "int8":
+            scale = np.abs(emb).max(axis=-1, keepdims=True) / 127
+            # All-zero vectors quantize to zeros rather than dividing by zero
+            scale[scale == 0] = 1.0
+            q = np.round(emb / scale).astype(np.int8)
+            return q, scale.astype(np.float16)
+        raise ValueError(f"Unknown quantization mode: {mode}")
     
     def get_embedding_dimension(self) -> int:
         """
@@ -4,11 +4,17 @@ Uses Reciprocal Rank Fusion (RRF) to combine results.
 """
 
 import os
-from typing import List, Dict, Any, Optional
-import sys
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from improved_retriever import ImprovedRetriever
-from vector_retriever import VectorRetriever
+import heapq
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, MutableMapping, Tuple
+import numpy as np
+from retrieval.improved_retriever import ImprovedRetriever
+from retrieval.vector_retriever import VectorRetriever
+
+# Combined result count from which RRF scores are computed with NumPy
+VECTORIZED_RRF_MIN_RESULTS = 500
 
 
 class HybridRetriever:
@@ -16,7 +22,10 @@ class HybridRetriever:
     
     def __init__(self, bm25_index_path: str, 
                  qdrant_collection: str = "travel_documents",
-                 rrf_k: int = 60):
+                 rrf_k: int = 60,
+                 embedding_cache: Optional[MutableMapping[str, List[float]]] = None,
+                 bm25_retriever: Optional[ImprovedRetriever] = None,
+                 vector_retriever: Optional[VectorRetriever] = None):
         """
         Initialize hybrid retriever.
         
@@ -24,73 +33,152 @@ class HybridRetriever:
             bm25_index_path: Path to Whoosh BM25 index
             qdrant_collection: Name of Qdrant collection
             rrf_k: RRF constant (higher = more weight to top results)
+            embedding_cache: Optional query embedding cache for the vector leg
+            bm25_retriever: Optional prebuilt BM25 retriever to reuse
+            vector_retriever: Optional prebuilt vector retriever to reuse
         """
-        self.bm25_retriever = ImprovedRetriever(bm25_index_path)
-        self.vector_retriever = VectorRetriever(collection_name=qdrant_collection)
+        self.bm25_retriever = bm25_retriever or ImprovedRetriever(bm25_index_path)
+        self.vector_retriever = vector_retriever or VectorRetriever(
+            collection_name=qdrant_collection,
+            embedding_cache=embedding_cache
+        )
+        # Retrievers passed in are shared, so their owner closes them
+        self._owned = [
+            retriever for retriever, given in ((self.bm25_retriever, bm25_retriever),
+                                               (self.vector_retriever, vector_retriever))
+            if given is None
+        ]
         self.rrf_k = rrf_k
+        # Runs the vector leg while the BM25 leg runs on the calling thread
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hybrid")
+        self._finalizer = weakref.finalize(self, self._executor.shutdown, wait=False)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
     
     def reciprocal_rank_fusion(self, bm25_results: List[Dict], 
-                                vector_results: List[Dict]) -> List[Dict]:
+                                vector_results: List[Dict],
+                                limit: Optional[int] = None) -> List[Dict]:
         """
         Combine results using Reciprocal Rank Fusion (RRF).
         
         Args:
             bm25_results: Results from BM25 search
             vector_results: Results from vector search
+            limit: Optional maximum number of results to return
         
         Returns:
             Combined and re-ranked results
         """
-        # Create score maps
+        return self._rank_fusion(bm25_results, vector_results, limit)[0]
+    
+    def _rank_fusion(self, bm25_results: List[Dict], vector_results: List[Dict],
+                     limit: Optional[int]) -> Tuple[List[Dict], int]:
+        """RRF over both result lists; also returns the number of fused documents."""
+        if len(bm25_results) + len(vector_results) >= VECTORIZED_RRF_MIN_RESULTS:
+            return self._rank_fusion_vectorized(bm25_results, vector_results, limit)
+        
         bm25_scores = {}
         vector_scores = {}
+        all_docs = {}
         
         for rank, doc in enumerate(bm25_results, 1):
             doc_id = doc.get("doc_id", "")
             if doc_id:
                 bm25_scores[doc_id] = 1.0 / (self.rrf_k + rank)
+                all_docs[doc_id] = doc
         
         for rank, doc in enumerate(vector_results, 1):
             doc_id = doc.get("doc_id", "")
             if doc_id:
                 vector_scores[doc_id] = 1.0 / (self.rrf_k + rank)
+                all_docs.setdefault(doc_id, doc)
         
-        # Combine scores
-        combined_scores = {}
-        all_docs = {}
+        combined_scores = {
+            doc_id: bm25_scores.get(doc_id, 0) + vector_scores.get(doc_id, 0)
+            for doc_id in all_docs
+        }
         
-        # Add BM25 results
-        for doc in bm25_results:
-            doc_id = doc.get("doc_id", "")
-            if doc_id:
-                combined_scores[doc_id] = bm25_scores.get(doc_id, 0)
-                all_docs[doc_id] = doc.copy()
+        # Only the top `limit` documents need ordering
+        if limit is None:
+            top = sorted(combined_scores.items(), key=itemgetter(1), reverse=True)
+        else:
+            top = heapq.nlargest(limit, combined_scores.items(), key=itemgetter(1))
         
-        # Add vector results
-        for doc in vector_results:
-            doc_id = doc.get("doc_id", "")
-            if doc_id:
-                combined_scores[doc_id] = combined_scores.get(doc_id, 0) + vector_scores.get(doc_id, 0)
-                if doc_id not in all_docs:
-                    all_docs[doc_id] = doc.copy()
-        
-        # Sort by combined score
-        sorted_docs = sorted(
-            combined_scores.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )
+        # Build final results; copy so the retrievers' (possibly cached) docs are untouched
+        final_results = [
+            {
+                **all_docs[doc_id],
+                "rrf_score": rrf_score,
+                "bm25_score": bm25_scores.get(doc_id, 0),
+                "vector_score": vector_scores.get(doc_id, 0),
+            }
+            for doc_id, rrf_score in top
+        ]
+        
+        return final_results, len(combined_scores)
+    
+    def _rank_fusion_vectorized(self, bm25_results: List[Dict], vector_results: List[Dict],
+                                limit: Optional[int]) -> Tuple[List[Dict], int]:
+        """
+        Same as the dict-based RRF, with the scoring done on NumPy arrays.
+        
+        Ties keep first-appearance order and a doc_id repeated within one list
+        keeps its last rank, exactly as in the dict-based version.
+        """
+        # Slot per document in order of first appearance, -1 for missing ids
+        slot_of = {}
         
-        # Build final results
-        final_results = []
-        for doc_id, rrf_score in sorted_docs:
-            doc = all_docs[doc_id].copy()
-            doc["rrf_score"] = rrf_score
-            doc["bm25_score"] = bm25_scores.get(doc_id, 0)
-            doc["vector_score"] = vector_scores.get(doc_id, 0)
-            final_results.append(doc)
+        def leg(results: List[Dict]):
+            slots = np.array([
+                slot_of.setdefault(doc_id, len(slot_of)) if doc_id else -1
+                for doc_id in (doc.get("doc_id") for doc in results)
+            ], dtype=np.int64)
+            positions = np.flatnonzero(slots >= 0)
+            return slots[positions], positions
         
-        return final_results
+        bm25_slots, bm25_positions = leg(bm25_results)
+        vector_slots, vector_positions = leg(vector_results)
+        num_docs = len(slot_of)
+        if not num_docs:
+            return [], 0
+        
+        def scores_of(slots, positions):
+            # A doc_id repeated within a list keeps its last (lowest) score
+            scores = np.full(num_docs, np.inf)
+            np.minimum.at(scores, slots, 1.0 / (self.rrf_k + positions + 1.0))
+            scores[np.isinf(scores)] = 0.0
+            return scores
+        
+        bm25_scores = scores_of(bm25_slots, bm25_positions)
+        vector_scores = scores_of(vector_slots, vector_positions)
+        
+        # Documents come from their last BM25 hit, else their first vector hit
+        bm25_doc = np.full(num_docs, -1)
+        np.maximum.at(bm25_doc, bm25_slots, bm25_positions)
+        vector_doc = np.full(num_docs, len(vector_results))
+        np.minimum.at(vector_doc, vector_slots, vector_positions)
+        
+        combined = bm25_scores + vector_scores
+        top = np.argsort(-combined, kind="stable")
+        if limit is not None:
+            top = top[:limit]
+        
+        final_results = [
+            {
+                **(bm25_results[bm25_doc[slot]] if bm25_doc[slot] >= 0
+                   else vector_results[vector_doc[slot]]),
+                "rrf_score": float(combined[slot]),
+                "bm25_score": float(bm25_scores[slot]),
+                "vector_score": float(vector_scores[slot]),
+            }
+            for slot in top
+        ]
+        
+        return final_results, num_docs
     
     def search(self, query: str, limit: int = 10, 
                use_hybrid: bool = True) -> Dict[str, Any]:
@@ -105,6 +193,10 @@ class HybridRetriever:
         Returns:
             Dict with combined results
         """
+        if use_hybrid:
+            # Vector search (network) overlaps with BM25 search (disk)
+            vector_future = self._executor.submit(self.vector_retriever.search, query, limit=limit)
+        
         # Get BM25 results
         bm25_result = self.bm25_retriever.search(query, limit=limit)
         bm25_results = bm25_result.get("results", [])
@@ -119,25 +211,56 @@ class HybridRetriever:
             }
         
         # Get vector results
-        vector_result = self.vector_retriever.search(query, limit=limit)
+        vector_result = vector_future.result()
+        
+        return self._fuse(query, limit, bm25_result, vector_result)
+    
+    def search_batch(self, queries: List[str], limits: List[int]) -> List[Dict[str, Any]]:
+        """
+        Perform several hybrid searches, batching each underlying retriever.
+        
+        Args:
+            queries: Natural language queries
+            limits: Maximum number of results for each query
+        
+        Returns:
+            List of combined result dicts, aligned with `queries`
+        """
+        vector_future = self._executor.submit(self.vector_retriever.search_batch, queries, limits)
+        bm25_batch = self.bm25_retriever.search_batch(queries, limits)
+        vector_batch = vector_future.result()
+        
+        return [
+            self._fuse(query, limit, bm25_result, vector_result)
+            for query, limit, bm25_result, vector_result
+            in zip(queries, limits, bm25_batch, vector_batch)
+        ]
+    
+    def _fuse(self, query: str, limit: int, bm25_result: Dict[str, Any],
+              vector_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Combine one BM25 result and one vector result using RRF."""
+        bm25_results = bm25_result.get("results", [])
         vector_results = vector_result.get("results", [])
         
         # Combine using RRF
-        combined_results = self.reciprocal_rank_fusion(bm25_results, vector_results)
+        combined_results, num_combined = self._rank_fusion(bm25_results, vector_results, limit)
         
         return {
             "query": query,
             "method": "hybrid",
-            "results": combined_results[:limit],
-            "num_results": len(combined_results),
+            "results": combined_results,
+            "num_results": num_combined,
             "bm25_count": len(bm25_results),
             "vector_count": len(vector_results),
             "bm25_rewritten_query": bm25_result.get("rewritten_query")
         }
     
     def close(self):
-        """Close retrievers."""
-        self.bm25_retriever.close()
+        """Close the executor and the retrievers this instance created."""
+        self._finalizer.detach()
+        self._executor.shutdown(wait=True)
+        for retriever in self._owned:
+            retriever.close()
 
 
 if __name__ == "__main__":
@@ -4,37 +4,77 @@ Demonstrates high-recall retrieval with structured data.
 """
 
 import os
-import json
-import sys
+import threading
+import weakref
+from functools import cached_property, lru_cache
 from typing import List, Dict, Any, Optional
+from cachetools import TTLCache
 from whoosh import index
 from whoosh.qparser import QueryParser
-from whoosh.query import And, Or, Term, Every
-
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from query_rewriter import QueryRewriter
-from activity_matcher import ActivityMatcher
+from whoosh.query import And, Or, Term, Every, Query
 
+from retrieval.query_rewriter import QueryRewriter
+from retrieval.activity_matcher import ActivityMatcher
+from retrieval.baseline_retriever import _close_searchers, _parse_doc
+from retrieval.stored_fields import unpack_activities
 
 class ImprovedRetriever:
     """Improved retriever with structured filtering and query rewriting."""
     
-    def __init__(self, index_path: str):
+    def __init__(self, index_path: str, rewriter: Optional[QueryRewriter] = None,
+                 cache_size: int = 512, cache_ttl: float = 120,
+                 activity_matcher: Optional[ActivityMatcher] = None):
         """
         Initialize retriever with index path.
         
         Args:
             index_path: Path to the Whoosh index directory
+            rewriter: Optional shared query rewriter
+            cache_size: Maximum number of cached search results
+            cache_ttl: Seconds a cached search result stays valid
+            activity_matcher: Optional shared activity matcher
         """
         if not os.path.exists(index_path):
             raise ValueError(f"Index not found at {index_path}")
         
         self.index_path = index_path
         self.ix = index.open_dir(index_path)
-        self.searcher = self.ix.searcher()
+        # Whoosh searchers must not be shared across threads, so each thread
+        # gets its own, created on first use and kept until close()
+        self._local = threading.local()
+        self._searchers = {}
+        self._searchers_lock = threading.Lock()
+        # Releases the searchers' file handles even if close() is never called
+        self._finalizer = weakref.finalize(
+            self, _close_searchers, self._searchers, self._searchers_lock, self.ix
+        )
         self.query_parser = QueryParser("content", schema=self.ix.schema)
-        self.rewriter = QueryRewriter()
-        self.activity_matcher = ActivityMatcher()
+        # Whoosh query trees are immutable once parsed, so repeated query
+        # strings reuse the parse instead of re-running the parser plugins
+        self._parse = lru_cache(maxsize=1024)(self.query_parser.parse)
+        # City/country/activity names are plain terms, so they skip the parser
+        self._content_term = lru_cache(maxsize=4096)(self._build_content_term)
+        self._filter_query = lru_cache(maxsize=256)(self._build_filter_query)
+        # Otherwise created on first use, so callers that pass explicit
+        # filters to search_with_filters never build an OpenAI client
+        if rewriter is not None:
+            self.rewriter = rewriter
+        if activity_matcher is not None:
+            self.activity_matcher = activity_matcher
+        # Repeated queries (e.g. evaluation re-runs) skip the rewrite LLM call
+        # and the search; keyed by index path so reopening elsewhere misses
+        self._result_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._result_cache_lock = threading.Lock()
+    
+    @cached_property
+    def rewriter(self) -> QueryRewriter:
+        """Query rewriter, created on first use unless one was passed in."""
+        return QueryRewriter()
+    
+    @cached_property
+    def activity_matcher(self) -> ActivityMatcher:
+        """Activity matcher, created on first use unless one was passed in."""
+        return ActivityMatcher()
     
     def search_with_filters(
         self,
@@ -58,158 +98,115 @@ class ImprovedRetriever:
             List of retrieved documents with scores
         """
         # Build BM25 query
-        parsed_query = self.query_parser.parse(query)
-        queries = [parsed_query]
-        
-        # Add structured filters
-        if city:
-            # Search in content field for city name (since name/region are STORED, not indexed)
-            # Use text search in content field for city matching
-            city_parser = QueryParser("content", schema=self.ix.schema)
-            city_query = city_parser.parse(city.lower())
-            queries.append(city_query)
-        
-        if country:
-            # Search in content field for country (since country is STORED, not indexed)
-            country_parser = QueryParser("content", schema=self.ix.schema)
-            country_query = country_parser.parse(country.lower())
-            queries.append(country_query)
+        parsed_query = self._parse(query)
         
         if activities and len(activities) > 0:
-            # Expand activities with synonyms and fuzzy matching
-            expanded_activities = set()
+            # Expand activities with synonyms and fuzzy matching, plus their
+            # plural/singular variants, as one set of unique terms
+            # Both are memoized by the matcher, so each is one lookup per activity
+            activity_variants = set()
+            activity_terms = []
             for activity in activities:
-                expanded = self.activity_matcher.expand_activity(activity)
-                expanded_activities.update(expanded)
-                # Also add the original
-                expanded_activities.add(activity.lower().strip())
-            
-            # Create queries for all expanded activities
-            activity_queries = []
-            for expanded_activity in expanded_activities:
-                # Normalize the activity
-                normalized = expanded_activity.lower().strip()
-                # Try exact match
-                activity_queries.append(Term("activities", normalized))
-                
-                # Add plural/singular variations
-                if normalized.endswith('s') and len(normalized) > 1:
-                    # Remove 's' for singular
-                    activity_queries.append(Term("activities", normalized[:-1]))
-                elif not normalized.endswith('s'):
-                    # Add 's' for plural
-                    activity_queries.append(Term("activities", normalized + 's'))
-                
-                # Also try with 'es' ending
-                if normalized.endswith('es'):
-                    activity_queries.append(Term("activities", normalized[:-2]))
-                elif normalized.endswith('s') and not normalized.endswith('es'):
-                    activity_queries.append(Term("activities", normalized + 'es'))
-            
-            # Remove duplicates by converting to set of strings, then back to Terms
-            unique_activities = set()
-            for q in activity_queries:
-                if hasattr(q, 'text'):
-                    unique_activities.add(q.text)
-            
-            # Recreate queries from unique set
-            activity_queries = [Term("activities", act) for act in unique_activities]
+                activity_terms.extend(self.activity_matcher.expand_activity(activity))
+                activity_variants.update(self.activity_matcher.expand_with_morph(activity))
             
             # Use OR to match any of the expanded activities
-            if activity_queries:
-                activity_query = Or(activity_queries) if len(activity_queries) > 1 else activity_queries[0]
-                queries.append(activity_query)
-        
-        # If we have activity filters, also search in content field as backup
-        # This ensures we find results even if structured matching is too strict
-        if activities and len(activities) > 0:
-            # Build content search query for activities
-            activity_terms = []
-            for activity in activities:
-                expanded = self.activity_matcher.expand_activity(activity)
-                activity_terms.extend([a for a in expanded])
-                # Add original
-                activity_terms.append(activity.lower().strip())
+            activity_queries = [Term("activities", act) for act in activity_variants]
+            structured_activity_query = Or(activity_queries) if len(activity_queries) > 1 else activity_queries[0]
             
-            # Create content query for activities
-            activity_text = ' OR '.join(set(activity_terms[:10]))  # Limit to avoid too many terms
-            activity_content_parser = QueryParser("content", schema=self.ix.schema)
-            activity_content_query = activity_content_parser.parse(activity_text)
+            # Also search the content field as a backup, so results are found
+            # even if structured matching is too strict
+            activity_content_query = self._content_any(set(activity_terms[:10]))  # Limit to avoid too many terms
+            if activity_content_query is not None:
+                structured_activity_query = Or([structured_activity_query, activity_content_query])
+            final_query = And([parsed_query, structured_activity_query])
             
-            # Combine structured activity query with content search using OR
-            if activity_queries:
-                # Use OR to match either structured field OR content
-                structured_activity_query = Or(activity_queries) if len(activity_queries) > 1 else activity_queries[0]
-                combined_activity_query = Or([structured_activity_query, activity_content_query])
-                # Replace activity query in queries list
-                queries = [q for q in queries if not isinstance(q, (Or, Term)) or (hasattr(q, 'fieldname') and q.fieldname != 'activities')]
-                queries.append(combined_activity_query)
+            # Lenient alternative: activity terms anywhere in the content,
+            # without the text query. Down-weighted so strict hits rank first,
+            # but searched in the same pass instead of only after a miss
+            lenient_query = self._content_any(activity_variants)
+            if lenient_query is not None:
+                final_query = Or([final_query, lenient_query.with_boost(0.3)])
+        else:
+            final_query = parsed_query
         
-        # Combine all queries with AND
-        final_query = And(queries) if len(queries) > 1 else queries[0]
-        
-        # Search
-        results = self.searcher.search(final_query, limit=limit)
-        
-        # If we have activity filters but got no results, try a more lenient search
-        # (fallback to content search with activity terms)
-        if activities and len(activities) > 0 and len(results) == 0:
-            # Build a more lenient query - search in content field for activity terms
-            activity_terms = []
-            for activity in activities:
-                expanded = self.activity_matcher.expand_activity(activity)
-                for exp_act in expanded:
-                    activity_terms.append(exp_act)
-                    # Add plural/singular variants
-                    if exp_act.endswith('s'):
-                        activity_terms.append(exp_act[:-1])
-                    else:
-                        activity_terms.append(exp_act + 's')
-            
-            # Search in content field for these terms
-            activity_text = ' OR '.join(set(activity_terms))
-            fallback_parser = QueryParser("content", schema=self.ix.schema)
-            fallback_query = fallback_parser.parse(activity_text)
-            
-            # Combine with other filters (city, country) if present
-            fallback_queries = [fallback_query]
-            if city:
-                city_parser = QueryParser("content", schema=self.ix.schema)
-                city_query = city_parser.parse(city.lower())
-                fallback_queries.append(city_query)
-            if country:
-                country_parser = QueryParser("content", schema=self.ix.schema)
-                country_query = country_parser.parse(country.lower())
-                fallback_queries.append(country_query)
-            
-            if len(fallback_queries) > 1:
-                final_query = And(fallback_queries)
-            else:
-                final_query = fallback_queries[0]
-            
-            results = self.searcher.search(final_query, limit=limit)
+        # Search, with city/country restricting the matches without being scored
+        searcher = self._searcher()
+        results = searcher.search(
+            final_query, limit=limit,
+            filter=self._filter_query(city.lower() if city else None,
+                                      country.lower() if country else None)
+        )
         
         # Format results
         # Note: We don't filter here because the query already handles matching
         # The fuzzy matching is applied in the query construction above
         formatted_results = []
-        for result in results:
-            doc = json.loads(result["raw_data"])
-            doc_activities = json.loads(result.get("extracted_activities", "[]"))
+        # Reads stored fields by docnum, without allocating a Hit per result
+        for score, docnum in results.top_n:
+            fields = searcher.stored_fields(docnum)
+            # Shared with BaselineRetriever, so documents ranking high in
+            # either retriever are decompressed and decoded once
+            doc = _parse_doc(fields["doc_id"], fields["raw_data"])
+            doc_activities = unpack_activities(fields.get("extracted_activities"))
             
             formatted_results.append({
-                "doc_id": result["doc_id"],
-                "doc_type": result["doc_type"],
-                "name": result["name"],
-                "country": result.get("country", ""),
-                "region": result.get("region", ""),
+                "doc_id": fields["doc_id"],
+                "doc_type": fields["doc_type"],
+                "name": fields["name"],
+                "country": fields.get("country", ""),
+                "region": fields.get("region", ""),
                 "activities": doc_activities,
-                "score": result.score,
+                "score": score,
                 "document": doc
             })
         
         return formatted_results
     
+    def _build_filter_query(self, city: Optional[str], country: Optional[str]):
+        """
+        Build the filter restricting results to a city and/or country.
+        
+        Args:
+            city: Lowercased city name, or None
+            country: Lowercased country name, or None
+        
+        Returns:
+            Query matching documents that mention both, or None if neither is given
+        """
+        # name/region/country are STORED, not indexed, so match in the content field
+        filters = [self._content_term(value) for value in (city, country) if value]
+        filters = [query for query in filters if query is not None]
+        if not filters:
+            return None
+        return And(filters) if len(filters) > 1 else filters[0]
+    
+    def _build_content_term(self, text: str) -> Optional[Query]:
+        """
+        Build a query matching a name or phrase in the content field.
+        
+        Args:
+            text: City, country or activity name
+        
+        Returns:
+            Term (or And of terms) for the analyzed tokens, or None if the
+            analyzer drops them all (e.g. stop words)
+        """
+        # Analyzed like indexed content, so case, punctuation and stop words
+        # are handled the same way the parser would
+        terms = [Term("content", token)
+                 for token in self.ix.schema["content"].process_text(text, mode="query")]
+        if not terms:
+            return None
+        return And(terms) if len(terms) > 1 else terms[0]
+    
+    def _content_any(self, texts) -> Optional[Query]:
+        """Query matching any of several names in the content field, or None."""
+        queries = [query for query in map(self._content_term, sorted(texts)) if query is not None]
+        if not queries:
+            return None
+        return Or(queries) if len(queries) > 1 else queries[0]
+    
     def search(self, user_query: str, limit: int = 10) -> Dict[str, Any]:
         """
         Perform improved search with automatic query rewriting.
@@ -221,6 +218,20 @@ class ImprovedRetriever:
         Returns:
             Dict with rewritten query and results
         """
+        # Refreshing first drops cached results if the index has been rewritten
+        self._searcher()
+        key = (self.index_path, user_query, limit)
+        with self._result_cache_lock:
+            cached = self._result_cache.get(key)
+        if cached is not None:
+            return {**cached, "results": list(cached["results"])}
+        
+        result = self._search(user_query, limit)
+        with self._result_cache_lock:
+            self._result_cache[key] = {**result, "results": tuple(result["results"])}
+        return result
+    
+    def _search(self, user_query: str, limit: int) -> Dict[str, Any]:
         # Rewrite query to extract structured filters
         rewritten = self.rewriter.rewrite_query(user_query)
         
@@ -248,10 +259,58 @@ class ImprovedRetriever:
             "num_results": len(results)
         }
     
+    def search_batch(self, user_queries: List[str], limits: List[int]) -> List[Dict[str, Any]]:
+        """
+        Perform several improved searches against the same searcher.
+        
+        Args:
+            user_queries: Natural language queries from users
+            limits: Maximum number of results for each query
+        
+        Returns:
+            List of search result dicts, aligned with `user_queries`
+        """
+        # Rewrites are the slow step, so they are cached concurrently up front
+        self.rewriter.rewrite_batch(user_queries)
+        return [self.search(query, limit=limit) for query, limit in zip(user_queries, limits)]
+    
+    def _searcher(self):
+        """
+        Return this thread's searcher, refreshed if the index has changed.
+        
+        A refresh means documents may have been added or removed, so cached
+        results from the previous index generation are dropped as well.
+        """
+        searcher = getattr(self._local, "searcher", None)
+        if searcher is not None:
+            fresh = searcher.refresh()
+            if fresh is not searcher:
+                self._local.searcher = fresh
+                with self._searchers_lock:
+                    self._searchers[threading.get_ident()] = fresh
+                with self._result_cache_lock:
+                    self._result_cache.clear()
+            return fresh
+        
+        searcher = self._local.searcher = self.ix.searcher()
+        with self._searchers_lock:
+            # A leftover entry belongs to a finished thread whose id was reused
+            stale = self._searchers.pop(threading.get_ident(), None)
+            self._searchers[threading.get_ident()] = searcher
+        if stale is not None:
+            stale.close()
+        return searcher
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
     def close(self):
-        """Close the searcher."""
-        if self.searcher:
-            self.searcher.close()
+        """Close the searchers of every thread and the index."""
+        _close_searchers(self._searchers, self._searchers_lock, self.ix)
+        self._local = threading.local()
 
 
 if __name__ == "__main__":
@@ -4,33 +4,60 @@ Provides vector search, hybrid search, and structured filtering.
 """
 
 import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 from langchain_community.vectorstores import Qdrant
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.retrievers import BaseRetriever
 from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
-try:
-    from langchain.retrievers import EnsembleRetriever
-except ImportError:
-    # Fallback if EnsembleRetriever not available
-    EnsembleRetriever = None
-import sys
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from query_rewriter import QueryRewriter
-from activity_matcher import ActivityMatcher
+from qdrant_client.http import models
+from retrieval.query_rewriter import QueryRewriter
+from retrieval.activity_matcher import ActivityMatcher
+
+
+def _lowercased(metadata: Dict[str, Any], key: str) -> str:
+    """Return a metadata field lowercased, using the copy stored at index time if present."""
+    value = metadata.get(key + "_lc")
+    if value is None:
+        # Indexes built before the lowercased copies were added
+        value = metadata.get(key, "").lower()
+    return value
+
+
+def _rrf(rankings: List[List[str]], k: int = 60) -> Dict[str, float]:
+    """
+    Score documents by reciprocal rank fusion.
+    
+    Args:
+        rankings: Doc id lists, each ordered best first
+        k: RRF constant (higher = flatter weighting of the top ranks)
+    
+    Returns:
+        Dict of doc id to the sum of 1 / (k + rank) over the rankings
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return scores
 
 
 class LangChainVectorRetriever:
     """LangChain-based vector retriever with structured filtering."""
     
-    def __init__(self, qdrant_path: str = "./qdrant_db", collection_name: str = "travel_documents"):
+    def __init__(self, qdrant_path: str = "./qdrant_db", collection_name: str = "travel_documents",
+                 rewriter: Optional[QueryRewriter] = None,
+                 activity_matcher: Optional[ActivityMatcher] = None):
         """
         Initialize LangChain vector retriever.
         
         Args:
             qdrant_path: Path to Qdrant database
             collection_name: Name of Qdrant collection
+            rewriter: Optional shared query rewriter
+            activity_matcher: Optional shared activity matcher
         """
         self.embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
         self.vector_store = Qdrant(
@@ -38,8 +65,8 @@ class LangChainVectorRetriever:
             path=qdrant_path,
             collection_name=collection_name,
         )
-        self.query_rewriter = QueryRewriter()
-        self.activity_matcher = ActivityMatcher()
+        self.query_rewriter = rewriter or QueryRewriter()
+        self.activity_matcher = activity_matcher or ActivityMatcher()
     
     def search(
         self,
@@ -77,49 +104,45 @@ class LangChainVectorRetriever:
             for activity in activities:
                 expanded_activities.update(self.activity_matcher.expand_activity(activity))
         
+        # Activities and the country are stored lowercased at index time, so
+        # they can be matched exactly by Qdrant before scoring
+        conditions = []
+        if expanded_activities:
+            conditions.append(models.FieldCondition(
+                key=f"{self.vector_store.metadata_payload_key}.activities",
+                match=models.MatchAny(any=sorted(expanded_activities))
+            ))
+        if country:
+            conditions.append(models.FieldCondition(
+                key=f"{self.vector_store.metadata_payload_key}.country_lc",
+                match=models.MatchValue(value=country.lower())
+            ))
+        qdrant_filter = models.Filter(must=conditions) if conditions else None
+        
         # Perform vector search
         results = self.vector_store.similarity_search_with_score(
             query=query,
-            k=limit * 2,  # Get more results for filtering
+            # City matches the name or a region substring, which keyword
+            # filters can't, so over-fetch for it only
+            k=limit * 2 if city else limit,
+            filter=qdrant_filter,
         )
         
-        # Apply structured filters
+        # Apply the city filter
+        city_lc = city.lower() if city else None
         filtered_results = []
         for doc, score in results:
             metadata = doc.metadata
             
             # Filter by city
-            if city:
+            if city_lc:
                 city_match = (
-                    metadata.get("name", "").lower() == city.lower() or
-                    metadata.get("region", "").lower().find(city.lower()) >= 0
+                    _lowercased(metadata, "name") == city_lc or
+                    city_lc in _lowercased(metadata, "region")
                 )
                 if not city_match:
                     continue
             
-            # Filter by country
-            if country:
-                country_match = metadata.get("country", "").lower() == country.lower()
-                if not country_match:
-                    continue
-            
-            # Filter by activities
-            doc_activities = metadata.get("activities", [])
-            if not isinstance(doc_activities, list):
-                doc_activities = str(doc_activities).split(",") if doc_activities else []
-            
-            if expanded_activities:
-                # Check if any expanded activity matches
-                activity_match = False
-                for doc_activity in doc_activities:
-                    doc_activity_lower = str(doc_activity).lower().strip()
-                    if doc_activity_lower in expanded_activities:
-                        activity_match = True
-                        break
-                
-                if not activity_match:
-                    continue
-            
             # Convert to result format
             result_dict = {
                 "doc_id": metadata.get("doc_id"),
@@ -127,15 +150,15 @@ class LangChainVectorRetriever:
                 "name": metadata.get("name"),
                 "country": metadata.get("country"),
                 "region": metadata.get("region"),
-                "activities": doc_activities,
+                "activities": metadata.get("activities", []),
                 "description": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
                 "score": float(score),
                 "raw_data": metadata.get("raw_data")
             }
             filtered_results.append(result_dict)
-        
-        # Limit results
-        filtered_results = filtered_results[:limit]
+            # Candidates arrive best first, so the first `limit` survivors are the top hits
+            if len(filtered_results) >= limit:
+                break
         
         return {
             "original_query": query,
@@ -152,12 +175,14 @@ class LangChainBM25Retriever(BaseRetriever):
     This wraps the existing Whoosh-based retriever in a LangChain-compatible interface.
     """
     
-    def __init__(self, whoosh_index_path: str, **kwargs):
-        """Initialize BM25 retriever with Whoosh index."""
+    def __init__(self, whoosh_index_path: str, rewriter: Optional[QueryRewriter] = None,
+                 activity_matcher: Optional[ActivityMatcher] = None, **kwargs):
+        """Initialize BM25 retriever with Whoosh index, optionally sharing a rewriter and matcher."""
         from retrieval.improved_retriever import ImprovedRetriever
         super().__init__(**kwargs)
         # Store as private attribute to avoid Pydantic validation
-        self._whoosh_retriever = ImprovedRetriever(whoosh_index_path)
+        self._whoosh_retriever = ImprovedRetriever(whoosh_index_path, rewriter=rewriter,
+                                                   activity_matcher=activity_matcher)
     
     def _get_relevant_documents(
         self,
@@ -199,6 +224,8 @@ class LangChainHybridRetriever:
         qdrant_path: str = "./qdrant_db",
         collection_name: str = "travel_documents",
         whoosh_index_path: Optional[str] = None,
+        rewriter: Optional[QueryRewriter] = None,
+        activity_matcher: Optional[ActivityMatcher] = None,
     ):
         """
         Initialize hybrid retriever.
@@ -207,24 +234,31 @@ class LangChainHybridRetriever:
             qdrant_path: Path to Qdrant database
             collection_name: Name of Qdrant collection
             whoosh_index_path: Path to Whoosh index (for BM25)
+            rewriter: Optional query rewriter shared by both legs
+            activity_matcher: Optional activity matcher shared by both legs
         """
+        # Both legs rewrite the same queries, so they share one rewriter and
+        # matcher (and their caches) unless the caller provides them
+        rewriter = rewriter or QueryRewriter()
+        activity_matcher = activity_matcher or ActivityMatcher()
+        
         # Vector retriever
-        self.vector_retriever = LangChainVectorRetriever(qdrant_path, collection_name)
+        self.vector_retriever = LangChainVectorRetriever(qdrant_path, collection_name,
+                                                         rewriter=rewriter,
+                                                         activity_matcher=activity_matcher)
         
         # BM25 retriever (if Whoosh index available)
         if whoosh_index_path and os.path.exists(whoosh_index_path):
-            self.bm25_retriever = LangChainBM25Retriever(whoosh_index_path)
-            # Create ensemble retriever if available
-            if EnsembleRetriever:
-                self.ensemble_retriever = EnsembleRetriever(
-                    retrievers=[self.bm25_retriever, self.vector_retriever.vector_store.as_retriever()],
-                    weights=[0.5, 0.5],  # Equal weight for BM25 and vector
-                )
-            else:
-                self.ensemble_retriever = None
+            self.bm25_retriever = LangChainBM25Retriever(whoosh_index_path, rewriter=rewriter,
+                                                         activity_matcher=activity_matcher)
         else:
             self.bm25_retriever = None
-            self.ensemble_retriever = None
+        
+        # The vector leg runs on the executor while BM25 runs on the calling thread
+        self._executor = None
+        if self.bm25_retriever:
+            self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="langchain-hybrid")
+            self._finalizer = weakref.finalize(self, self._executor.shutdown, wait=False)
     
     def search(self, query: str, limit: int = 10) -> Dict[str, Any]:
         """
@@ -237,27 +271,16 @@ class LangChainHybridRetriever:
         Returns:
             Dict with combined search results
         """
-        if self.ensemble_retriever:
-            # Use ensemble retriever
-            docs = self.ensemble_retriever.get_relevant_documents(query)
-            
-            # Convert to result format
-            results = []
-            for doc in docs[:limit]:
-                metadata = doc.metadata
-                results.append({
-                    "doc_id": metadata.get("doc_id"),
-                    "doc_type": metadata.get("doc_type"),
-                    "name": metadata.get("name"),
-                    "country": metadata.get("country"),
-                    "region": metadata.get("region"),
-                    "activities": metadata.get("activities", []),
-                    "description": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
-                })
+        if self.bm25_retriever:
+            vector_future = self._executor.submit(self.vector_retriever.search, query, limit=limit)
+            bm25_result = self.bm25_retriever._whoosh_retriever.search(query, limit=limit)
+            vector_result = vector_future.result()
             
+            results = self._fuse(bm25_result.get("results", []),
+                                 vector_result.get("results", []), limit)
             return {
                 "original_query": query,
-                "rewritten_query": None,  # Can add query rewriting if needed
+                "rewritten_query": bm25_result.get("rewritten_query"),
                 "results": results,
                 "num_results": len(results),
                 "method": "langchain_hybrid"
@@ -265,6 +288,50 @@ class LangChainHybridRetriever:
         else:
             # Fall back to vector search only
             return self.vector_retriever.search(query, limit=limit)
+    
+    @staticmethod
+    def _fuse(bm25_results: List[Dict], vector_results: List[Dict], limit: int,
+              k: int = 60) -> List[Dict[str, Any]]:
+        """
+        Combine BM25 and vector results with reciprocal rank fusion.
+        
+        Args:
+            bm25_results: Results from the Whoosh retriever
+            vector_results: Results from the vector retriever
+            limit: Maximum number of results
+            k: RRF constant
+        
+        Returns:
+            Fused results, best first
+        """
+        # Vector hits come last and carry the page content description
+        docs = {result.get("doc_id"): result for results in (bm25_results, vector_results)
+                for result in results}
+        scores = _rrf([[result.get("doc_id") for result in results]
+                       for results in (bm25_results, vector_results)], k)
+        
+        fused = []
+        for doc_id in sorted(scores, key=scores.__getitem__, reverse=True)[:limit]:
+            result = docs[doc_id]
+            content = result.get("description") or result.get("document", {}).get("description", "")
+            fused.append({
+                "doc_id": doc_id,
+                "doc_type": result.get("doc_type"),
+                "name": result.get("name"),
+                "country": result.get("country"),
+                "region": result.get("region"),
+                "activities": result.get("activities", []),
+                "description": content[:200] + "..." if len(content) > 200 else content,
+            })
+        return fused
+    
+    def close(self):
+        """Shut down the executor and close the BM25 retriever."""
+        if self._executor:
+            self._finalizer.detach()
+            self._executor.shutdown(wait=True)
+        if self.bm25_retriever:
+            self.bm25_retriever.close()
 
 
 if __name__ == "__main__":
@@ -3,12 +3,35 @@ Qdrant vector store integration for storing and searching document embeddings.
 """
 
 import os
-import json
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from typing import List, Dict, Any, Optional
+import orjson
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import Distance, VectorParams
 from qdrant_client.http import models
 
+# Points per upsert request when bulk loading
+UPSERT_BATCH_SIZE = 256
+
+# Upsert requests in flight at once against a Qdrant server
+UPSERT_CONCURRENCY = 4
+
+# Below this many points per upload process, start-up costs more than it saves
+MIN_POINTS_PER_UPLOAD_WORKER = 5000
+
+# Upper bound on upload processes for very large adds
+MAX_UPLOAD_WORKERS = 8
+
+# Version of the point payload layout written by add_documents; 2 stores
+# lowercased activities and raw_data as a nested object
+PAYLOAD_VERSION = 2
+
+# Indexing threshold (KB) restored after a bulk load when the collection
+# doesn't report one
+DEFAULT_INDEXING_THRESHOLD = 20000
+
 
 class QdrantStore:
     """Manages Qdrant vector database for document embeddings."""
@@ -16,7 +39,16 @@ class QdrantStore:
     def __init__(self, collection_name: str = "travel_documents", 
                  embedding_dim: int = 1536,
                  url: Optional[str] = None,
-                 api_key: Optional[str] = None):
+                 api_key: Optional[str] = None,
+                 quantize: bool = True,
+                 oversampling: float = 2.0,
+                 hnsw_m: int = 32,
+                 hnsw_ef_construct: int = 200,
+                 hnsw_ef: int = 128,
+                 prefer_grpc: bool = True,
+                 grpc_port: int = 6334,
+                 pool_size: int = 100,
+                 timeout: int = 60):
         """
         Initialize Qdrant store.
         
@@ -25,16 +57,44 @@ class QdrantStore:
             embedding_dim: Dimension of embedding vectors
             url: Qdrant server URL (None for local)
             api_key: Qdrant API key (for cloud)
+            quantize: Keep an int8 scalar-quantized copy of the vectors in RAM
+                      for scoring; originals are used to rescore the top hits
+            oversampling: Candidate multiplier scored with int8 before rescoring
+            hnsw_m: HNSW graph degree used when creating the collection
+            hnsw_ef_construct: HNSW candidate list size while building the graph
+            hnsw_ef: HNSW candidate list size at query time
+            prefer_grpc: Talk to a Qdrant server over gRPC rather than REST
+            grpc_port: Qdrant server gRPC port
+            pool_size: Connections kept open to a Qdrant server, so concurrent
+                       searches and upload threads don't queue for one
+            timeout: Request timeout in seconds for a Qdrant server
         """
         self.collection_name = collection_name
         self.embedding_dim = embedding_dim
+        self.quantize = quantize
+        self.remote = bool(url)
+        self.hnsw_config = models.HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct)
+        # Local mode always does exact search and warns on search params
+        self.search_params = None
+        if url:
+            self.search_params = models.SearchParams(
+                hnsw_ef=hnsw_ef,
+                quantization=models.QuantizationSearchParams(
+                    rescore=True,
+                    oversampling=oversampling
+                ) if quantize else None
+            )
         
         # Initialize Qdrant client
         if url:
             # Cloud Qdrant
             self.client = QdrantClient(
                 url=url,
-                api_key=api_key
+                api_key=api_key,
+                prefer_grpc=prefer_grpc,
+                grpc_port=grpc_port,
+                pool_size=pool_size,
+                timeout=timeout
             )
         else:
             # Local Qdrant - use file-based with proper path
@@ -46,9 +106,16 @@ class QdrantStore:
                 # Fallback to in-memory if file lock issues
                 print(f"Warning: Could not use file-based Qdrant ({e}), using in-memory")
                 self.client = QdrantClient(location=":memory:")
+        # Releases the HTTP session or storage lock even if close() is never called
+        self._finalizer = weakref.finalize(self, self.client.close)
         
         # Create collection if it doesn't exist
         self._ensure_collection()
+        self.legacy_payloads = self._has_legacy_payloads()
+    
+    def close(self):
+        """Close the Qdrant client."""
+        self._finalizer()
     
     def _ensure_collection(self):
         """Create collection if it doesn't exist."""
@@ -62,48 +129,167 @@ class QdrantStore:
                     vectors_config=VectorParams(
                         size=self.embedding_dim,
                         distance=Distance.COSINE
-                    )
+                    ),
+                    hnsw_config=self.hnsw_config,
+                    quantization_config=self._quantization_config()
                 )
                 print(f"Created Qdrant collection: {self.collection_name}")
+            if self.remote:
+                # Lets activity filters skip non-matching points before scoring;
+                # local mode has no payload indexes and always filters by scan
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name="activities",
+                    field_schema=models.PayloadSchemaType.KEYWORD
+                )
         except Exception as e:
             print(f"Error ensuring collection: {e}")
             raise
     
-    def add_documents(self, documents: List[Dict[str, Any]], embeddings: List[List[float]]):
+    def _has_legacy_payloads(self) -> bool:
+        """
+        Check whether the collection was built with an older payload layout.
+        
+        Points written before PAYLOAD_VERSION 2 keep activities in their source
+        casing, so exact activity filters can miss them; the index needs to be
+        rebuilt.
+        """
+        try:
+            points, _ = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=1,
+                with_payload=["payload_version"],
+                with_vectors=False
+            )
+            version = points[0].payload.get("payload_version", 1) if points else PAYLOAD_VERSION
+        except Exception as e:
+            print(f"Error checking Qdrant payload version: {e}")
+            return False
+        
+        if version < PAYLOAD_VERSION:
+            print(f"Warning: Qdrant collection '{self.collection_name}' has payload version "
+                  f"{version} (current: {PAYLOAD_VERSION}); rebuild the vector index so "
+                  f"activity filters match")
+            return True
+        return False
+    
+    def _quantization_config(self) -> Optional[models.ScalarQuantization]:
+        """Symmetric int8 scalar quantization, clipped at the 0.99 quantile."""
+        if not self.quantize:
+            return None
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=True
+            )
+        )
+    
+    @contextmanager
+    def bulk_load(self):
+        """
+        Suspend HNSW indexing while many points are added.
+        
+        Without this the server's optimizer keeps re-indexing segments as
+        they fill up during the load; with it the graph is built once when
+        the previous indexing threshold is restored on exit. Local mode has
+        no optimizer, so this is a no-op there.
+        """
+        if not self.remote:
+            yield
+            return
+        
+        info = self.client.get_collection(self.collection_name)
+        threshold = info.config.optimizer_config.indexing_threshold
+        if threshold is None:
+            # A None diff changes nothing, which would leave indexing disabled
+            threshold = DEFAULT_INDEXING_THRESHOLD
+        self.client.update_collection(
+            collection_name=self.collection_name,
+            optimizer_config=models.OptimizersConfigDiff(indexing_threshold=0)
+        )
+        try:
+            yield
+        finally:
+            self.client.update_collection(
+                collection_name=self.collection_name,
+                optimizer_config=models.OptimizersConfigDiff(indexing_threshold=threshold)
+            )
+    
+    def add_documents(self, documents: List[Dict[str, Any]], embeddings: List[List[float]],
+                      start_id: int = 0, concurrency: int = UPSERT_CONCURRENCY):
         """
         Add documents with embeddings to Qdrant.
         
         Args:
             documents: List of document dictionaries
-            embeddings: List of embedding vectors
+            embeddings: Embedding vectors, as a list or a 2-D float32 array
+            start_id: Point id of the first document, for adding in batches
+            concurrency: Upsert requests in flight at once against a server
         """
         if len(documents) != len(embeddings):
             raise ValueError("Number of documents must match number of embeddings")
         
-        points = []
-        for i, (doc, embedding) in enumerate(zip(documents, embeddings)):
-            point = PointStruct(
-                id=i,
-                vector=embedding,
-                payload={
-                    "doc_id": doc.get("doc_id", str(i)),
-                    "doc_type": doc.get("doc_type", "unknown"),
-                    "name": doc.get("name", ""),
-                    "country": doc.get("country", ""),
-                    "region": doc.get("region", ""),
-                    "activities": doc.get("activities", []),
-                    "description": doc.get("description", ""),
-                    "raw_data": json.dumps(doc.get("raw_data", {}))
-                }
-            )
-            points.append(point)
+        ids = list(range(start_id, start_id + len(documents)))
+        payloads = [
+            {
+                "doc_id": doc.get("doc_id", str(i)),
+                "doc_type": doc.get("doc_type", "unknown"),
+                "name": doc.get("name", ""),
+                "country": doc.get("country", ""),
+                "region": doc.get("region", ""),
+                # Normalized so activity filters can match keywords exactly
+                "activities": list(dict.fromkeys(
+                    activity.lower().strip() for activity in doc.get("activities", []) if activity
+                )),
+                "description": doc.get("description", ""),
+                "raw_data": doc.get("raw_data", {}),
+                "payload_version": PAYLOAD_VERSION
+            }
+            for i, doc in zip(ids, documents)
+        ]
         
-        try:
+        def upsert(start: int, wait: bool):
+            end = start + UPSERT_BATCH_SIZE
             self.client.upsert(
                 collection_name=self.collection_name,
-                points=points
+                points=models.Batch(
+                    ids=ids[start:end],
+                    vectors=embeddings[start:end],
+                    payloads=payloads[start:end]
+                ),
+                wait=wait
             )
-            print(f"Added {len(points)} documents to Qdrant")
+        
+        starts = range(0, len(ids), UPSERT_BATCH_SIZE)
+        workers = min(MAX_UPLOAD_WORKERS, os.cpu_count() or 1,
+                      len(ids) // MIN_POINTS_PER_UPLOAD_WORKER)
+        try:
+            if self.remote and workers > 1:
+                # Large adds are CPU-bound on vector serialization, which
+                # upload_collection spreads over worker processes
+                self.client.upload_collection(
+                    collection_name=self.collection_name,
+                    vectors=embeddings,
+                    payload=payloads,
+                    ids=ids,
+                    batch_size=UPSERT_BATCH_SIZE,
+                    parallel=workers,
+                    wait=True
+                )
+            elif self.remote and concurrency > 1 and len(starts) > 1:
+                # Requests overlap serialization and round trips; each one
+                # waits, since concurrent requests are applied in no set order
+                with ThreadPoolExecutor(max_workers=concurrency,
+                                        thread_name_prefix="qdrant-upsert") as pool:
+                    for future in [pool.submit(upsert, start, True) for start in starts]:
+                        future.result()
+            else:
+                # Column-oriented batches are pipelined without waiting for each
+                # to be applied; the last one waits and acts as a barrier
+                for start in starts:
+                    upsert(start, start + UPSERT_BATCH_SIZE >= len(ids))
+            print(f"Added {len(ids)} documents to Qdrant")
         except Exception as e:
             print(f"Error adding documents to Qdrant: {e}")
             raise
@@ -121,49 +307,99 @@ class QdrantStore:
         Returns:
             List of similar documents with scores
         """
-        # Build filter if provided
-        query_filter = None
-        if filter_dict:
-            must_conditions = []
-            for key, value in filter_dict.items():
-                must_conditions.append(
-                    models.FieldCondition(
-                        key=key,
-                        match=models.MatchValue(value=value)
-                    )
-                )
-            if must_conditions:
-                query_filter = models.Filter(must=must_conditions)
-        
         try:
             # Use query_points method (Qdrant client API)
             # Can pass vector directly or use Query object
             results = self.client.query_points(
                 collection_name=self.collection_name,
                 query=query_embedding,  # Pass vector directly
-                query_filter=query_filter,
+                query_filter=self._build_filter(filter_dict),
+                search_params=self.search_params,
                 limit=limit
             )
-            
-            formatted_results = []
-            for point in results.points:
-                formatted_results.append({
-                    "doc_id": point.payload.get("doc_id", ""),
-                    "doc_type": point.payload.get("doc_type", ""),
-                    "name": point.payload.get("name", ""),
-                    "country": point.payload.get("country", ""),
-                    "region": point.payload.get("region", ""),
-                    "activities": point.payload.get("activities", []),
-                    "description": point.payload.get("description", ""),
-                    "score": point.score,  # Cosine similarity score
-                    "document": json.loads(point.payload.get("raw_data", "{}"))
-                })
-            
-            return formatted_results
+            return [self._format_point(point) for point in results.points]
         except Exception as e:
             print(f"Error searching Qdrant: {e}")
             return []
     
+    def search_batch(self, query_embeddings: List[List[float]], limits: List[int],
+                     filter_dicts: Optional[List[Optional[Dict[str, Any]]]] = None
+                     ) -> List[List[Dict[str, Any]]]:
+        """
+        Run several vector searches in one request.
+        
+        Args:
+            query_embeddings: Query embedding vectors
+            limits: Maximum number of results for each query
+            filter_dicts: Optional filters for each query
+        
+        Returns:
+            List of result lists, aligned with `query_embeddings`
+        """
+        if filter_dicts is None:
+            filter_dicts = [None] * len(query_embeddings)
+        requests = [
+            models.QueryRequest(
+                query=query_embedding,
+                filter=self._build_filter(filter_dict),
+                params=self.search_params,
+                limit=limit,
+                with_payload=True
+            )
+            for query_embedding, limit, filter_dict in zip(query_embeddings, limits, filter_dicts)
+        ]
+        if not requests:
+            return []
+        
+        try:
+            responses = self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=requests
+            )
+            return [[self._format_point(point) for point in response.points]
+                    for response in responses]
+        except Exception as e:
+            print(f"Error searching Qdrant: {e}")
+            return [[] for _ in requests]
+    
+    @staticmethod
+    def _build_filter(filter_dict: Optional[Dict[str, Any]]) -> Optional[models.Filter]:
+        """
+        Build an exact-match Qdrant filter from a field -> value mapping.
+        
+        A list, tuple or set value matches points having any of its values.
+        """
+        if not filter_dict:
+            return None
+        return models.Filter(must=[
+            models.FieldCondition(
+                key=key,
+                match=models.MatchAny(any=list(value))
+                if isinstance(value, (list, tuple, set, frozenset))
+                else models.MatchValue(value=value)
+            )
+            for key, value in filter_dict.items()
+        ])
+    
+    @staticmethod
+    def _format_point(point) -> Dict[str, Any]:
+        """Convert a scored Qdrant point into a result dict."""
+        raw_data = point.payload.get("raw_data", {})
+        if isinstance(raw_data, str):
+            # Collections built before raw_data was stored as a nested object
+            raw_data = orjson.loads(raw_data)
+        return {
+            "doc_id": point.payload.get("doc_id", ""),
+            "doc_type": point.payload.get("doc_type", ""),
+            "name": point.payload.get("name", ""),
+            "country": point.payload.get("country", ""),
+            "region": point.payload.get("region", ""),
+            "activities": point.payload.get("activities", []),
+            "description": point.payload.get("description", ""),
+            "score": point.score,  # Cosine similarity score
+            "document": raw_data
+        }
+    
     def delete_collection(self):
         """Delete the collection (use with caution)."""
         try:
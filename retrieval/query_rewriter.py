@@ -4,31 +4,21 @@ LLM-powered query rewriting to extract structured filters from natural language
 
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Dict, Any, Optional, List
+import orjson
 from openai import OpenAI
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Rewrites kept per rewriter; at temperature 0.1 repeats are effectively identical
+MAX_CACHED_REWRITES = 2048
 
-class QueryRewriter:
-    """Rewrites natural language queries into structured filter queries."""
-    
-    def __init__(self, model: str = "gpt-3.5-turbo"):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.model = model
-    
-    def rewrite_query(self, user_query: str) -> Dict[str, Any]:
-        """
-        Rewrite a natural language query into structured filters.
-        
-        Args:
-            user_query: Natural language query from user
-        
-        Returns:
-            Dict with structured filters: {city, country, activities, original_query}
-        """
-        prompt = f"""Convert the following user query about travel into a structured filter query.
+SYSTEM_PROMPT = "You are a helpful assistant that extracts structured information from travel queries. Always return valid JSON."
+
+REWRITE_PROMPT = """Convert the following user query about travel into a structured filter query.
 
 Extract:
 1. City/destination name (if mentioned)
@@ -45,56 +35,35 @@ expand it to include specific activities:
 
 User query: "{user_query}"
 
-Return ONLY a JSON object with this exact structure:
-{{
-  "city": "city_name_or_null",
-  "country": "country_name_or_null",
-  "activities": ["activity1", "activity2", "activity3"],
-  "original_query": "{user_query}"
-}}
+Return a JSON object of the form:
+{{"city": "city_name_or_null", "country": "country_name_or_null", "activities": ["activity1", "activity2"]}}
 
 If a field is not mentioned, use null. Activities should be normalized (lowercase, singular forms preferred).
 If a category is mentioned, expand it to specific activities in the activities array.
 """
+
+
+class QueryRewriter:
+    """Rewrites natural language queries into structured filter queries."""
+    
+    def __init__(self, model: str = "gpt-3.5-turbo"):
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.model = model
+        # Only successful rewrites are cached; failures raise through lru_cache
+        self._rewrite_cached = lru_cache(maxsize=MAX_CACHED_REWRITES)(self._rewrite_uncached)
+    
+    def rewrite_query(self, user_query: str) -> Dict[str, Any]:
+        """
+        Rewrite a natural language query into structured filters.
+        
+        Args:
+            user_query: Natural language query from user
         
+        Returns:
+            Dict with structured filters: {city, country, activities, original_query}
+        """
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that extracts structured information from travel queries. Always return valid JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=200
-            )
-            
-            content = response.choices[0].message.content.strip()
-            
-            # Clean up the response
-            if content.startswith("```"):
-                content = content.split("```")[1]
-                if content.startswith("json"):
-                    content = content[4:]
-                content = content.strip()
-            
-            result = json.loads(content)
-            
-            # Normalize activities
-            if "activities" in result and isinstance(result["activities"], list):
-                result["activities"] = [str(a).lower().strip() for a in result["activities"] if a]
-            else:
-                result["activities"] = []
-            
-            # Normalize city and country
-            if result.get("city") and result["city"].lower() == "null":
-                result["city"] = None
-            if result.get("country") and result["country"].lower() == "null":
-                result["country"] = None
-            
-            result["original_query"] = user_query
-            
-            return result
-            
+            result = self._rewrite_cached(user_query)
         except Exception as e:
             print(f"Error rewriting query: {e}")
             # Fallback to original query
@@ -104,6 +73,62 @@ If a category is mentioned, expand it to specific activities in the activities a
                 "activities": [],
                 "original_query": user_query
             }
+        # Callers get their own copy of the cached rewrite
+        return {**result, "activities": list(result["activities"])}
+    
+    def rewrite_batch(self, user_queries: List[str], max_concurrency: int = 16) -> List[Dict[str, Any]]:
+        """
+        Rewrite many queries with concurrent LLM requests.
+        
+        Args:
+            user_queries: Natural language queries from users
+            max_concurrency: Maximum number of requests in flight
+        
+        Returns:
+            List of rewritten query dicts, aligned with `user_queries`
+        """
+        if not user_queries:
+            return []
+        
+        # Identical queries are rewritten once
+        unique_queries = list(dict.fromkeys(user_queries))
+        
+        # Requests are network-bound, so threads sharing the client overlap their round trips
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(unique_queries))) as pool:
+            rewritten = dict(zip(unique_queries, pool.map(self.rewrite_query, unique_queries)))
+        return [{**rewritten[query], "activities": list(rewritten[query]["activities"])}
+                for query in user_queries]
+    
+    def _rewrite_uncached(self, user_query: str) -> Dict[str, Any]:
+        # JSON mode guarantees a parseable object, so no markdown fences to strip
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": REWRITE_PROMPT.format(user_query=user_query)}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.1,
+            max_tokens=120
+        )
+        
+        result = orjson.loads(response.choices[0].message.content)
+        
+        # Normalize activities
+        if "activities" in result and isinstance(result["activities"], list):
+            result["activities"] = tuple(str(a).lower().strip() for a in result["activities"] if a)
+        else:
+            result["activities"] = ()
+        
+        # Normalize city and country
+        if result.get("city") and result["city"].lower() == "null":
+            result["city"] = None
+        if result.get("country") and result["country"].lower() == "null":
+            result["country"] = None
+        
+        result["original_query"] = user_query
+        
+        return result
 
 
 if __name__ == "__main__":
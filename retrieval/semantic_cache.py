@@ -0,0 +1,112 @@
+"""
+Client-side semantic query cache for vector search.
+
+Keeps the embeddings of recent queries in a fixed-size NumPy ring buffer
+and serves a new query from the cache when a previous query with the same
+filters is within a cosine-similarity threshold, skipping the Qdrant
+round trip entirely.
+"""
+
+import threading
+from typing import List, Dict, Any, Optional, Hashable
+import numpy as np
+
+
+class SemanticQueryCache:
+    """Nearest-neighbour cache of vector search results keyed by query embedding."""
+    
+    def __init__(self, capacity: int = 256, threshold: float = 0.97, dim: int = 1536):
+        """
+        Initialize the cache.
+        
+        Args:
+            capacity: Maximum number of cached queries
+            threshold: Minimum cosine similarity for a cached query to be reused
+            dim: Embedding dimension
+        """
+        self.capacity = capacity
+        self.threshold = threshold
+        self._vecs = np.zeros((capacity, dim), dtype=np.float32)
+        self._hits = np.zeros(capacity, dtype=np.int64)
+        # Insertion order, so ties between equally-hit entries evict the oldest
+        self._ticks = np.zeros(capacity, dtype=np.int64)
+        self._tick = 0
+        self._keys: List[Optional[Hashable]] = [None] * capacity
+        self._limits = np.zeros(capacity, dtype=np.int64)
+        self._results: List[Optional[List[Dict[str, Any]]]] = [None] * capacity
+        self._size = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+    
+    def lookup(self, embedding: List[float], key: Hashable,
+               limit: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Return cached results for a near-duplicate query, if any.
+        
+        Args:
+            embedding: Query embedding
+            key: Filters the results were produced with; only equal keys match
+            limit: Number of results requested
+        
+        Returns:
+            Up to `limit` cached results, or None on a miss
+        """
+        vec = self._normalize(embedding)
+        with self._lock:
+            if not self._size:
+                return None
+            sims = self._vecs[:self._size] @ vec
+            eligible = self._limits[:self._size] >= limit
+            eligible &= np.fromiter((k == key for k in self._keys[:self._size]),
+                                    dtype=bool, count=self._size)
+            sims[~eligible] = -1.0
+            slot = int(np.argmax(sims))
+            if sims[slot] < self.threshold:
+                return None
+            self._hits[slot] += 1
+            return self._results[slot][:limit]
+    
+    def insert(self, embedding: List[float], key: Hashable, limit: int,
+               results: List[Dict[str, Any]]):
+        """
+        Cache the results of a query, evicting the least-hit entry when full.
+        
+        Ties are broken by age, so fresh entries (which all start at zero
+        hits) rotate through the cache instead of replacing one slot forever.
+        
+        Args:
+            embedding: Query embedding
+            key: Filters the results were produced with
+            limit: Number of results that were requested
+            results: Search results to cache
+        """
+        vec = self._normalize(embedding)
+        with self._lock:
+            if self._size < self.capacity:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.lexsort((self._ticks, self._hits))[0])
+                # Age the counts so entries that were hot long ago can be evicted
+                self._hits //= 2
+            self._vecs[slot] = vec
+            self._hits[slot] = 0
+            self._tick += 1
+            self._ticks[slot] = self._tick
+            self._keys[slot] = key
+            self._limits[slot] = limit
+            self._results[slot] = list(results)
+    
+    def clear(self):
+        """Drop all cached queries."""
+        with self._lock:
+            self._size = 0
+            self._hits[:] = 0
+            self._ticks[:] = 0
+            self._keys = [None] * self.capacity
+            self._results = [None] * self.capacity
@@ -0,0 +1,66 @@
+"""
+Compact encodings for the STORED fields of the Whoosh indexes.
+
+The full document is stored as MessagePack, which is smaller than JSON and
+decodes several times faster than the zlib-compressed JSON used before, and
+activity lists are stored as native lists instead of JSON strings. Decoders
+also accept the older encodings so existing indexes keep working until they
+are rebuilt.
+"""
+
+import zlib
+from typing import List, Dict, Any, Union
+import orjson
+import ormsgpack
+
+# First byte of a zlib stream at any compression level (deflate, 32K window)
+_ZLIB_HEADER = 0x78
+
+
+def pack_document(doc: Dict[str, Any]) -> bytes:
+    """
+    Encode a document for the raw_data field.
+    
+    Args:
+        doc: Document dictionary
+    
+    Returns:
+        MessagePack bytes
+    """
+    return ormsgpack.packb(doc)
+
+
+def unpack_document(value: Union[bytes, str]) -> Dict[str, Any]:
+    """
+    Decode a raw_data field value.
+    
+    Args:
+        value: MessagePack bytes, or zlib-compressed JSON bytes or a JSON
+            string from an older index
+    
+    Returns:
+        Document dictionary
+    """
+    if isinstance(value, bytes):
+        # A document packs to a MessagePack map, whose first byte is never 0x78
+        if value[0] != _ZLIB_HEADER:
+            return ormsgpack.unpackb(value)
+        value = zlib.decompress(value)
+    return orjson.loads(value)
+
+
+def unpack_activities(value: Union[List[str], str, None]) -> List[str]:
+    """
+    Decode an extracted_activities field value.
+    
+    Args:
+        value: Activity list, or a JSON string from an older index
+    
+    Returns:
+        List of activity strings
+    """
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return orjson.loads(value)
+    return list(value)
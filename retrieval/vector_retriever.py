@@ -2,26 +2,145 @@
 Vector-based retriever using Qdrant for semantic search.
 """
 
-import os
-from typing import List, Dict, Any, Optional
-import sys
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from embedding_generator import EmbeddingGenerator
-from qdrant_store import QdrantStore
+import threading
+from functools import cached_property
+from typing import List, Dict, Any, Optional, MutableMapping
+from cachetools import LRUCache
+from retrieval.activity_matcher import ActivityMatcher
+from retrieval.embedding_generator import EmbeddingGenerator
+from retrieval.qdrant_store import QdrantStore
+from retrieval.semantic_cache import SemanticQueryCache
+
+# Embedding caches may be shared between retrievers and hit from worker threads
+_EMBEDDING_CACHE_LOCK = threading.Lock()
+
+# Query embeddings kept by a retriever that isn't given a shared cache
+EMBEDDING_CACHE_SIZE = 1024
+
+
+def _cache_key(filter_dict: Optional[Dict[str, Any]]) -> Optional[tuple]:
+    """Hashable semantic-cache key for a set of search filters."""
+    return tuple(sorted(filter_dict.items())) if filter_dict else None
 
 
 class VectorRetriever:
     """Vector-based retriever using Qdrant for semantic similarity search."""
     
-    def __init__(self, collection_name: str = "travel_documents"):
+    def __init__(self, collection_name: str = "travel_documents",
+                 embedding_cache: Optional[MutableMapping[str, List[float]]] = None,
+                 embedding_generator: Optional[EmbeddingGenerator] = None,
+                 qdrant_store: Optional[QdrantStore] = None,
+                 query_cache: Optional[SemanticQueryCache] = None,
+                 activity_matcher: Optional[ActivityMatcher] = None,
+                 **store_kwargs):
         """
         Initialize vector retriever.
         
         Args:
             collection_name: Name of the Qdrant collection
+            embedding_cache: Optional mapping of normalized query text to its
+                             embedding, shared between retrievers; defaults
+                             to a private LRU cache
+            embedding_generator: Optional shared embedding generator
+            qdrant_store: Optional shared Qdrant store (ignores collection_name)
+            query_cache: Optional semantic cache that serves near-duplicate
+                         queries without querying Qdrant
+            activity_matcher: Optional shared activity matcher
+            **store_kwargs: QdrantStore options (url, api_key, pool_size, ...)
+                            used when no qdrant_store is passed in
         """
-        self.embedding_generator = EmbeddingGenerator()
-        self.qdrant_store = QdrantStore(collection_name=collection_name)
+        self.embedding_generator = embedding_generator or EmbeddingGenerator()
+        self.qdrant_store = qdrant_store or QdrantStore(collection_name=collection_name,
+                                                       **store_kwargs)
+        # Shared dependencies are left to their owner on close()
+        self._owned = [
+            dep for dep, given in ((self.embedding_generator, embedding_generator),
+                                   (self.qdrant_store, qdrant_store))
+            if given is None
+        ]
+        if embedding_cache is None:
+            embedding_cache = LRUCache(maxsize=EMBEDDING_CACHE_SIZE)
+        self.embedding_cache = embedding_cache
+        self.query_cache = query_cache
+        if activity_matcher is not None:
+            self.activity_matcher = activity_matcher
+    
+    @cached_property
+    def activity_matcher(self) -> ActivityMatcher:
+        """Activity matcher, created on first use unless one was passed in."""
+        return ActivityMatcher()
+    
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed queries, reusing cached embeddings and batching the misses."""
+        keys = [query.strip().lower() for query in queries]
+        with _EMBEDDING_CACHE_LOCK:
+            embeddings = {key: self.embedding_cache.get(key) for key in keys}
+        
+        misses = {key: query for key, query in zip(keys, queries) if embeddings[key] is None}
+        if misses:
+            generated = self.embedding_generator.generate_embeddings_batch(list(misses.values()))
+            with _EMBEDDING_CACHE_LOCK:
+                for key, embedding in zip(misses, generated):
+                    self.embedding_cache[key] = embedding
+                    embeddings[key] = embedding
+        
+        return [embeddings[key] for key in keys]
+    
+    def _embed_query(self, query: str) -> List[float]:
+        """Embed a single query, reusing its cached embedding."""
+        key = query.strip().lower()
+        with _EMBEDDING_CACHE_LOCK:
+            embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            embedding = self.embedding_generator.generate_embedding(query)
+            with _EMBEDDING_CACHE_LOCK:
+                self.embedding_cache[key] = embedding
+        return embedding
+    
+    def _search_store(self, query_embedding: List[float], limit: int,
+                      filter_dict: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Search Qdrant, going through the semantic query cache when configured."""
+        if self.query_cache is None:
+            return self.qdrant_store.search(
+                query_embedding=query_embedding,
+                limit=limit,
+                filter_dict=filter_dict
+            )
+        
+        key = _cache_key(filter_dict)
+        results = self.query_cache.lookup(query_embedding, key, limit)
+        if results is None:
+            results = self.qdrant_store.search(
+                query_embedding=query_embedding,
+                limit=limit,
+                filter_dict=filter_dict
+            )
+            if results:
+                self.query_cache.insert(query_embedding, key, limit, results)
+        return results
+    
+    def _search_store_batch(self, query_embeddings: List[List[float]], limits: List[int],
+                            filter_dicts: List[Optional[Dict[str, Any]]]) -> List[List[Dict[str, Any]]]:
+        """Search Qdrant for several queries in one request, skipping semantic cache hits."""
+        batch_results: List[Optional[List[Dict[str, Any]]]] = [None] * len(query_embeddings)
+        if self.query_cache is not None:
+            for i, (query_embedding, limit, filter_dict) in enumerate(
+                    zip(query_embeddings, limits, filter_dicts)):
+                batch_results[i] = self.query_cache.lookup(query_embedding, _cache_key(filter_dict), limit)
+        
+        misses = [i for i, results in enumerate(batch_results) if results is None]
+        if misses:
+            fetched = self.qdrant_store.search_batch(
+                [query_embeddings[i] for i in misses],
+                [limits[i] for i in misses],
+                [filter_dicts[i] for i in misses]
+            )
+            for i, results in zip(misses, fetched):
+                batch_results[i] = results
+                if self.query_cache is not None and results:
+                    self.query_cache.insert(query_embeddings[i], _cache_key(filter_dicts[i]),
+                                            limits[i], results)
+        return batch_results
     
     def search(self, query: str, limit: int = 10, 
                doc_type: Optional[str] = None,
@@ -39,7 +158,7 @@ class VectorRetriever:
             Dict with results and metadata
         """
         # Generate query embedding
-        query_embedding = self.embedding_generator.generate_embedding(query)
+        query_embedding = self._embed_query(query)
         
         # Build filters
         filter_dict = {}
@@ -49,10 +168,10 @@ class VectorRetriever:
             filter_dict["country"] = country
         
         # Search in Qdrant
-        results = self.qdrant_store.search(
-            query_embedding=query_embedding,
-            limit=limit,
-            filter_dict=filter_dict if filter_dict else None
+        results = self._search_store(
+            query_embedding,
+            limit,
+            filter_dict if filter_dict else None
         )
         
         return {
@@ -62,10 +181,43 @@ class VectorRetriever:
             "num_results": len(results)
         }
     
+    def search_batch(self, queries: List[str], limits: List[int],
+                     filter_dicts: Optional[List[Optional[Dict[str, Any]]]] = None
+                     ) -> List[Dict[str, Any]]:
+        """
+        Perform several semantic searches with one embedding and one Qdrant request.
+        
+        Args:
+            queries: Natural language queries
+            limits: Maximum number of results for each query
+            filter_dicts: Optional filters for each query (e.g. {"doc_type": "guide"})
+        
+        Returns:
+            List of result dicts, aligned with `queries`
+        """
+        query_embeddings = self._embed_queries(queries)
+        if filter_dicts is None:
+            filter_dicts = [None] * len(queries)
+        
+        batch_results = []
+        for query, results in zip(queries, self._search_store_batch(query_embeddings, limits, filter_dicts)):
+            batch_results.append({
+                "query": query,
+                "method": "vector",
+                "results": results,
+                "num_results": len(results)
+            })
+        
+        return batch_results
+    
     def search_with_activities(self, query: str, activities: List[str], 
                                limit: int = 10) -> Dict[str, Any]:
         """
-        Search with activity-based filtering (post-filtering).
+        Search with activity-based filtering, applied by Qdrant before scoring.
+        
+        Collections built before activities were lowercased at ingest can't be
+        matched exactly, so for those the results are over-fetched and
+        post-filtered case-insensitively until the index is rebuilt.
         
         Args:
             query: Natural language query
@@ -75,23 +227,48 @@ class VectorRetriever:
         Returns:
             Dict with filtered results
         """
-        # Perform vector search
-        result = self.search(query, limit=limit * 2)  # Get more results for filtering
+        if activities and self.qdrant_store.legacy_payloads:
+            return self._post_filter_activities(query, activities, limit)
         
-        # Filter by activities
+        filter_dict = None
         if activities:
-            filtered_results = []
-            for doc in result["results"]:
-                doc_activities = doc.get("activities", [])
-                # Check if any requested activity matches
-                if any(act.lower() in str(doc_activities).lower() for act in activities):
-                    filtered_results.append(doc)
+            # Activities are stored lowercased, like the expansions, so they
+            # can be matched exactly against the keyword payload index
+            expanded = set()
+            for activity in activities:
+                expanded.update(self.activity_matcher.expand_with_morph(activity))
+            filter_dict = {"activities": tuple(sorted(expanded))}
+        
+        results = self._search_store(self._embed_query(query), limit, filter_dict)
+        
+        return {
+            "query": query,
+            "method": "vector",
+            "results": results,
+            "num_results": len(results)
+        }
+    
+    def _post_filter_activities(self, query: str, activities: List[str],
+                                limit: int) -> Dict[str, Any]:
+        result = self.search(query, limit=limit * 2)  # Get more results for filtering
+        
+        wanted = [act.lower() for act in activities]
+        filtered_results = []
+        for doc in result["results"]:
+            doc_activities = [str(act).lower() for act in doc.get("activities", [])]
+            # Check if any requested activity matches
+            if any(act in doc_act for act in wanted for doc_act in doc_activities):
+                filtered_results.append(doc)
                 if len(filtered_results) >= limit:
                     break
-            result["results"] = filtered_results[:limit]
-            result["num_results"] = len(filtered_results)
-        
+        result["results"] = filtered_results
+        result["num_results"] = len(filtered_results)
         return result
+    
+    def close(self):
+        """Close the embedding generator and Qdrant store, unless they were passed in."""
+        for dep in self._owned:
+            dep.close()
 
 
 if __name__ == "__main__":
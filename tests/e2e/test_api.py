@@ -2,6 +2,7 @@
 
 import os
 import sys
+import asyncio
 import pytest
 import tempfile
 import shutil
@@ -11,7 +12,7 @@ from unittest.mock import patch, MagicMock
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from app.main import app
+from app.main import app, APIResponse, BatchScheduler, _RESULT_CACHE, _normalize, _build_context_text
 
 
 class TestAPI:
@@ -34,6 +35,8 @@ class TestAPI:
              patch('app.main.langchain_hybrid_retriever') as mock_langchain_hybrid, \
              patch('app.main.LANGCHAIN_AVAILABLE', True):
             
+            _RESULT_CACHE.clear()
+            
             # Setup mocks
             mock_baseline.search.return_value = [
                 {"doc_id": "test_1", "name": "Test", "score": 1.0}
@@ -114,6 +117,40 @@ class TestAPI:
         )
         assert response.status_code in [200, 503]  # 503 if index not available
     
+    def test_search_results_are_cached(self, client, mock_retrievers):
+        """Repeated queries differing only in case/whitespace hit the result cache."""
+        for query in ["Test", "  test "]:
+            response = client.post(
+                "/api/search",
+                json={"query": query, "use_improved": False, "limit": 10}
+            )
+            assert response.status_code == 200
+        
+        assert mock_retrievers["baseline"].search.call_count == 1
+    
+    def test_chat_context_is_cached(self, client, mock_retrievers):
+        """Test repeated chat queries reuse the rendered context block."""
+        mock_retrievers["baseline"].search.return_value = [
+            {"doc_id": "test_1", "name": "Test", "doc_type": "destination",
+             "document": {"description": "Museums"}}
+        ]
+        
+        with patch('app.main._build_context_text', wraps=_build_context_text) as build:
+            for query in ["Test", "  test "]:
+                response = client.post(
+                    "/api/chat",
+                    json={"query": query, "use_improved": False, "limit": 5}
+                )
+                assert response.status_code == 200
+                assert "Museums" in response.json()["context_text"]
+        
+        assert build.call_count == 1
+    
+    def test_normalize_query(self):
+        """Test ingress normalization collapses case, whitespace and Unicode forms."""
+        assert _normalize("  Paris   Tours ") == "paris tours"
+        assert _normalize("Cafe\u0301 tours") == _normalize("Caf\u00e9 Tours") == "caf\u00e9 tours"
+    
     def test_search_improved(self, client, mock_retrievers):
         """Test improved search endpoint."""
         response = client.post(
@@ -159,6 +196,13 @@ class TestAPI:
         # May return 200 (if retrievers work) or 503 (if not initialized)
         assert response.status_code in [200, 503, 500]
     
+    def test_response_encodes_numpy_and_bytes(self):
+        """Test the default response class serializes NumPy scores and bytes."""
+        import numpy as np
+        
+        response = APIResponse({"score": np.float32(0.5), "raw": b"abc", "ids": np.arange(2)})
+        assert response.body == b'{"score":0.5,"raw":"abc","ids":[0,1]}'
+    
     def test_search_invalid_request(self, client):
         """Test search with invalid request."""
         response = client.post(
@@ -231,3 +275,46 @@ class TestAPI:
             # Should use LangChain method
             assert data["method"] in ["langchain_vector", "langchain_hybrid"]
 
+
+
+class TestBatchScheduler:
+    """Tests for the search micro-batcher."""
+    
+    def test_concurrent_requests_are_batched(self):
+        """Test that concurrent submissions are flushed as one batch."""
+        retriever = MagicMock()
+        retriever.search_batch.side_effect = lambda queries, limits: [
+            {"query": q, "limit": l} for q, l in zip(queries, limits)
+        ]
+        scheduler = BatchScheduler(lambda method: retriever, max_batch=8, flush_ms=50)
+        
+        async def run():
+            scheduler.start(["improved"])
+            try:
+                return await asyncio.gather(
+                    scheduler.submit("improved", "paris", 5),
+                    scheduler.submit("improved", "tokyo", 10),
+                )
+            finally:
+                await scheduler.stop()
+        
+        results = asyncio.run(run())
+        
+        assert results == [{"query": "paris", "limit": 5}, {"query": "tokyo", "limit": 10}]
+        retriever.search_batch.assert_called_once_with(["paris", "tokyo"], [5, 10])
+    
+    def test_batch_errors_propagate(self):
+        """Test that a failing batch raises in every waiting request."""
+        retriever = MagicMock()
+        retriever.search_batch.side_effect = RuntimeError("index unavailable")
+        scheduler = BatchScheduler(lambda method: retriever, flush_ms=1)
+        
+        async def run():
+            scheduler.start(["baseline"])
+            try:
+                await scheduler.submit("baseline", "paris", 5)
+            finally:
+                await scheduler.stop()
+        
+        with pytest.raises(RuntimeError):
+            asyncio.run(run())
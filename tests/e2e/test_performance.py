@@ -1,55 +1,82 @@
-"""Performance and load tests."""
+"""Performance benchmarks for the retrieval hot paths.
 
+Run with ``pytest tests/e2e/test_performance.py --benchmark-only``; CI compares
+each run's means against the previous saved run and fails on a >15% regression.
+"""
+
+import os
 import pytest
-import time
+import numpy as np
 from unittest.mock import patch, MagicMock
-from retrieval.baseline_retriever import BaselineRetriever
-from retrieval.improved_retriever import ImprovedRetriever
+from qdrant_client import QdrantClient
+
+pytest.importorskip("pytest_benchmark")
+
 from retrieval.activity_matcher import ActivityMatcher
+from retrieval.qdrant_store import QdrantStore
+from retrieval.query_rewriter import QueryRewriter
 
 
 class TestPerformance:
-    """Performance tests."""
+    """Benchmarks of activity expansion, vector search and query rewriting."""
     
-    def test_activity_matcher_performance(self):
-        """Test activity matcher performance."""
-        matcher = ActivityMatcher()
-        
-        start = time.time()
-        for _ in range(100):
-            matcher.expand_activity("outdoor activities")
-        elapsed = time.time() - start
+    @pytest.fixture
+    def qdrant_store(self):
+        """In-memory Qdrant store holding 1,000 synthetic documents."""
+        with patch('retrieval.qdrant_store.QdrantClient', return_value=QdrantClient(location=":memory:")):
+            store = QdrantStore(collection_name="benchmark_collection")
         
-        # Should complete 100 operations in < 1 second
-        assert elapsed < 1.0
-        assert elapsed / 100 < 0.01  # < 10ms per operation
+        rng = np.random.default_rng(0)
+        documents = [
+            {
+                "doc_id": f"destination_{i}",
+                "doc_type": "destination",
+                "name": f"Destination {i}",
+                "activities": ["hiking", "museums", "snorkeling"][i % 3:],
+                "raw_data": {"name": f"Destination {i}"}
+            }
+            for i in range(1000)
+        ]
+        store.add_documents(documents, rng.standard_normal((1000, 1536), dtype=np.float32))
+        yield store
+        store.close()
     
-    def test_query_rewriter_performance(self):
-        """Test query rewriter response time requirement."""
-        # Note: This tests the requirement, actual API calls will be slower
-        # In production, query rewriting should complete in < 2 seconds
-        requirement_max_time = 2.0
-        assert requirement_max_time > 0  # Requirement exists
+    @pytest.fixture
+    def rewriter(self):
+        """Query rewriter answering from a mocked OpenAI client."""
+        with patch.dict(os.environ, {'OPENAI_API_KEY': 'test-key'}):
+            rew = QueryRewriter()
+        rew.client = MagicMock()
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = '{"city": "Lisbon", "country": null, "activities": ["Snorkeling", "diving"]}'
+        rew.client.chat.completions.create.return_value = response
+        return rew
     
-    def test_search_response_time_requirement(self):
-        """Test search response time requirement."""
-        # Search should complete in < 1 second (excluding LLM calls)
-        requirement_max_time = 1.0
-        assert requirement_max_time > 0
+    def test_activity_expand(self, benchmark):
+        """Benchmark expanding a category into activities."""
+        matcher = ActivityMatcher()
+        
+        expanded = benchmark(matcher.expand_activity, "outdoor activities")
+        assert "hiking" in expanded
     
-    @pytest.mark.slow
-    def test_concurrent_searches(self):
-        """Test concurrent search operations."""
-        # This would test concurrent API requests
-        # For now, just verify the requirement exists
-        max_concurrent = 10
-        assert max_concurrent > 0
+    def test_qdrant_search(self, benchmark, qdrant_store):
+        """Benchmark a vector search over 1,000 points."""
+        query = np.random.default_rng(1).standard_normal(1536, dtype=np.float32).tolist()
+        
+        results = benchmark(qdrant_store.search, query, limit=10)
+        assert len(results) == 10
     
-    def test_memory_usage(self):
-        """Test memory usage requirements."""
-        # System should handle 1000+ documents without excessive memory
-        max_documents = 1000
-        max_memory_mb = 500  # Should use < 500MB for 1000 documents
-        assert max_documents > 0
-        assert max_memory_mb > 0
-
+    def test_qdrant_search_with_activity_filter(self, benchmark, qdrant_store):
+        """Benchmark a vector search filtered on activities."""
+        query = np.random.default_rng(1).standard_normal(1536, dtype=np.float32).tolist()
+        
+        results = benchmark(qdrant_store.search, query, limit=10,
+                            filter_dict={"activities": ("snorkeling",)})
+        assert all("snorkeling" in r["activities"] for r in results)
+    
+    def test_rewrite_query(self, benchmark, rewriter):
+        """Benchmark parsing a rewrite, with the cache cleared before each round."""
+        result = benchmark.pedantic(rewriter.rewrite_query, args=("snorkeling near lisbon",),
+                                    setup=rewriter._rewrite_cached.cache_clear, rounds=200)
+        assert result["activities"] == ["snorkeling", "diving"]
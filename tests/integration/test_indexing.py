@@ -28,7 +28,8 @@ class TestIndexing:
                 "name": "Paris",
                 "country": "France",
                 "description": "City with museums and art galleries.",
-                "activities": ["museums", "art galleries"]
+                "activities": ["museums", "art galleries"],
+                "rating": 4.5
             }
         ]
         guides = [
@@ -62,6 +63,48 @@ class TestIndexing:
         assert os.path.exists(index_path)
         assert os.path.isdir(index_path)
     
+    @patch('indexing.llm_extractor.OpenAI')
+    @patch('indexing.index_builder.MIN_DOCS_PER_PROC', 2)
+    @patch('indexing.index_builder.os.cpu_count', return_value=3)
+    def test_build_baseline_index_multiprocess(self, mock_cpu_count, mock_openai, temp_dir):
+        """Test that large builds use a multi-process writer and keep every document."""
+        from whoosh import index
+        
+        builder = IndexBuilder(index_dir=os.path.join(temp_dir, "indexes"), build_vector_index=False)
+        documents = [
+            {"type": "destination", "name": f"City {i}", "country": "France",
+             "description": "City with museums."}
+            for i in range(10)
+        ]
+        
+        index_path = builder.build_baseline_index(documents)
+        
+        with index.open_dir(index_path).searcher() as searcher:
+            assert searcher.doc_count() == 10
+    
+    @patch('indexing.llm_extractor.OpenAI')
+    @patch('indexing.index_builder.MIN_DOCS_PER_PROC', 2)
+    @patch('indexing.index_builder.os.cpu_count', return_value=3)
+    def test_streamed_build_sizes_writer_pool(self, mock_cpu_count, mock_openai, temp_dir):
+        """Test streamed input is counted before choosing a multi-process writer."""
+        from whoosh import index
+        
+        builder = IndexBuilder(index_dir=os.path.join(temp_dir, "indexes"), build_vector_index=False)
+        
+        def stream(n):
+            for i in range(n):
+                yield {"type": "destination", "name": f"City {i}", "country": "France",
+                       "description": "City with museums."}
+        
+        with patch.object(builder, '_open_writer', wraps=builder._open_writer) as open_writer:
+            builder.build_baseline_index(stream(3), index_name="small")
+            index_path = builder.build_baseline_index(stream(10), index_name="large")
+        
+        # Two processes need at most 4 documents buffered to decide
+        assert [call[0][1] for call in open_writer.call_args_list] == [3, 4]
+        with index.open_dir(index_path).searcher() as searcher:
+            assert searcher.doc_count() == 10
+    
     @patch('indexing.llm_extractor.OpenAI')
     @patch('retrieval.embedding_generator.OpenAI')
     def test_build_improved_index(self, mock_embedding_openai, mock_extractor_openai, temp_dir, sample_data):
@@ -69,7 +112,7 @@ class TestIndexing:
         # Mock LLM extractor
         mock_extractor_response = MagicMock()
         mock_extractor_response.choices = [MagicMock()]
-        mock_extractor_response.choices[0].message.content = '["museums", "art galleries"]'
+        mock_extractor_response.choices[0].message.content = '{"activities": ["museums", "art galleries"]}'
         
         mock_extractor_client = MagicMock()
         mock_extractor_client.chat.completions.create.return_value = mock_extractor_response
@@ -97,6 +140,48 @@ class TestIndexing:
         assert os.path.exists(index_path)
         assert os.path.isdir(index_path)
     
+    @patch('indexing.llm_extractor.OpenAI')
+    @patch('indexing.index_builder.INDEX_WINDOW', 1)
+    def test_build_improved_index_streamed(self, mock_openai, temp_dir, sample_data):
+        """Test the improved index can be built from a document stream in windows."""
+        from whoosh import index
+        from indexing.index_builder import iter_documents
+        from retrieval.stored_fields import unpack_document
+        
+        builder = IndexBuilder(index_dir=os.path.join(temp_dir, "indexes"), build_vector_index=False)
+        builder.extractor = MagicMock()
+        builder.extractor.extract_activities_batch.side_effect = lambda items: [["museums"]] * len(items)
+        
+        index_path = builder.build_improved_index(iter_documents(*sample_data))
+        
+        assert builder.extractor.extract_activities_batch.call_count == 2
+        with index.open_dir(index_path).searcher() as searcher:
+            assert searcher.doc_count() == 2
+            assert searcher.document(doc_id="guide_1")["doc_type"] == "guide"
+            # Fractional numbers are streamed as floats, which the stored fields can encode
+            raw_data = unpack_document(searcher.document(doc_id="destination_0")["raw_data"])
+            assert raw_data["rating"] == 4.5
+    
+    @patch('indexing.llm_extractor.OpenAI')
+    @patch('indexing.index_builder.INDEX_WINDOW', 1)
+    def test_build_improved_index_pipelines_vectors(self, mock_openai, temp_dir, sample_data):
+        """Test every window is embedded once, in order, alongside extraction."""
+        from indexing.index_builder import iter_documents
+        
+        builder = IndexBuilder(index_dir=os.path.join(temp_dir, "indexes"), build_vector_index=False)
+        builder.build_vector_index = True
+        builder.build_vector_index_for_documents = MagicMock()
+        builder.qdrant_store = MagicMock()
+        builder.extractor = MagicMock()
+        builder.extractor.extract_activities_batch.side_effect = lambda items: [["museums"]] * len(items)
+        
+        builder.build_improved_index(iter_documents(*sample_data))
+        
+        builder.qdrant_store.bulk_load.assert_called_once_with()
+        calls = builder.build_vector_index_for_documents.call_args_list
+        assert [call[0][1] for call in calls] == [0, 1]
+        assert [call[0][0][0]["type"] for call in calls] == ["destination", "guide"]
+    
     def test_load_documents(self, sample_data):
         """Test document loading."""
         builder = IndexBuilder()
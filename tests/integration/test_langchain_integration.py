@@ -81,7 +81,7 @@ class TestLangChainIntegration:
             # Mock activity extractor
             mock_extractor_response = MagicMock()
             mock_extractor_response.choices = [MagicMock()]
-            mock_extractor_response.choices[0].message.content = '["museums", "dining"]'
+            mock_extractor_response.choices[0].message.content = '{"activities": ["museums", "dining"]}'
             mock_openai_extractor.return_value.chat.completions.create.return_value = mock_extractor_response
             
             # Mock LangChain embeddings
@@ -101,9 +101,8 @@ class TestLangChainIntegration:
         qdrant_path = os.path.join(temp_dir, "qdrant_db")
         
         # Build index
-        with patch('indexing.langchain_index_builder.Qdrant') as mock_qdrant:
-            mock_vector_store = MagicMock()
-            mock_qdrant.from_documents.return_value = mock_vector_store
+        with patch('indexing.langchain_index_builder.Qdrant') as mock_qdrant, \
+             patch('indexing.langchain_index_builder.QdrantClient') as mock_client_class:
             
             builder = LangChainIndexBuilder(
                 qdrant_path=qdrant_path,
@@ -115,11 +114,14 @@ class TestLangChainIntegration:
                 return_value={"extracted_activities": ["museums"]}
             )
             
+            builder.embeddings = MagicMock()
+            builder.embeddings.embed_documents.return_value = [[0.1] * 1536] * 3
+            
             vector_store = builder.build_vector_index(sample_documents, recreate=True)
             
-            assert mock_qdrant.from_documents.called
-            call_args = mock_qdrant.from_documents.call_args
-            assert len(call_args[1]["documents"]) == 3
+            assert vector_store is mock_qdrant.return_value
+            points = mock_client_class.return_value.upsert.call_args[1]["points"]
+            assert len(points.ids) == 3
     
     @pytest.mark.integration
     def test_vector_retriever_with_filters(self, temp_dir, mock_openai):
@@ -178,8 +180,7 @@ class TestLangChainIntegration:
         os.makedirs(whoosh_index_path, exist_ok=True)
         
         with patch('retrieval.langchain_retriever.LangChainVectorRetriever') as mock_vector_class, \
-             patch('retrieval.langchain_retriever.LangChainBM25Retriever') as mock_bm25_class, \
-             patch('retrieval.langchain_retriever.EnsembleRetriever') as mock_ensemble_class:
+             patch('retrieval.langchain_retriever.LangChainBM25Retriever') as mock_bm25_class:
             
             # Mock vector retriever
             mock_vector_retriever = MagicMock()
@@ -192,18 +193,11 @@ class TestLangChainIntegration:
             
             # Mock BM25 retriever
             mock_bm25_retriever = MagicMock()
+            mock_bm25_retriever._whoosh_retriever.search.return_value = {
+                "results": [{"doc_id": "dest_1", "name": "Paris"}]
+            }
             mock_bm25_class.return_value = mock_bm25_retriever
             
-            # Mock ensemble retriever
-            from langchain_core.documents import Document
-            mock_doc = Document(
-                page_content="Paris is beautiful",
-                metadata={"doc_id": "dest_1", "name": "Paris"}
-            )
-            mock_ensemble = MagicMock()
-            mock_ensemble.get_relevant_documents.return_value = [mock_doc]
-            mock_ensemble_class.return_value = mock_ensemble
-            
             retriever = LangChainHybridRetriever(
                 qdrant_path=qdrant_path,
                 whoosh_index_path=whoosh_index_path
@@ -212,8 +206,9 @@ class TestLangChainIntegration:
             result = retriever.search("Paris", limit=5)
             
             assert result["method"] == "langchain_hybrid"
-            assert "results" in result
-            assert mock_ensemble.get_relevant_documents.called
+            assert [r["doc_id"] for r in result["results"]] == ["dest_1"]
+            assert mock_bm25_retriever._whoosh_retriever.search.called
+            assert mock_vector_retriever.search.called
     
     @pytest.mark.integration
     def test_activity_filtering_integration(self, temp_dir, mock_openai):
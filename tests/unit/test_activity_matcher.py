@@ -1,7 +1,8 @@
 """Unit tests for ActivityMatcher."""
 
 import pytest
-from retrieval.activity_matcher import ActivityMatcher
+from unittest.mock import patch
+from retrieval.activity_matcher import ActivityMatcher, _strip_suffix
 
 
 class TestActivityMatcher:
@@ -47,6 +48,62 @@ class TestActivityMatcher:
         assert "tour" in expanded_plural
         assert "tours" in expanded_plural
     
+    def test_expand_activity_cached(self):
+        """Test expansions of known and unknown activities are reused."""
+        matcher = ActivityMatcher()
+        assert matcher.expand_activity("Outdoor Activities") is matcher.expand_activity("outdoor activities")
+        
+        expanded = matcher.expand_activity("kayak")
+        assert matcher.expand_activity(" Kayak ") is expanded
+        assert "kayaks" in expanded
+        assert matcher._expand_cached.cache_info().hits == 1
+    
+    def test_expand_with_morph(self):
+        """Test plural/singular variants of every expansion are added and cached."""
+        matcher = ActivityMatcher()
+        with patch.object(matcher, "expand_activity", return_value={"beaches", "tour", "museums"}):
+            variants = matcher.expand_with_morph("Beaches ")
+            assert matcher.expand_with_morph("beaches") is variants
+        
+        assert variants == {"beaches", "beache", "beach", "tour", "tours",
+                            "museums", "museum", "museumses"}
+    
+    def test_matching_categories(self):
+        """Test category lookup matches names in either direction."""
+        matcher = ActivityMatcher()
+        assert matcher._matching_categories("outdoor") == {"outdoor", "outdoor activities"}
+        assert matcher._matching_categories("great food tours") == {"food"}
+        assert matcher._matching_categories("snorkeling") == set()
+    
+    def test_normalize_whitespace(self):
+        """Test normalization collapses any whitespace run to one space."""
+        matcher = ActivityMatcher()
+        assert matcher._normalize("  City  Tours ") == "city tours"
+        assert matcher._normalize("city\ttours") == "city tours"
+        assert matcher._normalize("city\u00a0tours") == "city tours"
+        assert matcher._normalize("city tours") == "city tours"
+    
+    def test_exact_match_skips_fuzzy(self):
+        """Test that an exact match short-circuits fuzzy matching."""
+        matcher = ActivityMatcher()
+        with patch.object(matcher, "_fuzzy_match_normalized") as mock_fuzzy:
+            assert matcher.match_activities(["hiking"], ["Snorkel", "Hiking"])
+            assert matcher.find_matching_activities(["hiking"], ["Hiking", "hiking "]) == ["Hiking", "hiking "]
+        mock_fuzzy.assert_not_called()
+    
+    def test_static_tables_shared_per_class(self):
+        """Test lookup tables are built once per class and shared by instances."""
+        first, second = ActivityMatcher(), ActivityMatcher()
+        assert first._synonym_map is second._synonym_map
+        assert first._static_expansions is second._static_expansions
+        
+        class CustomMatcher(ActivityMatcher):
+            SYNONYMS = {"rafting": ["rafting", "white water rafting"]}
+        
+        custom = CustomMatcher()
+        assert "white water rafting" in custom.expand_activity("rafting")
+        assert "white water rafting" not in first.expand_activity("rafting")
+    
     def test_match_activities_exact(self):
         """Test exact activity matching."""
         matcher = ActivityMatcher()
@@ -114,6 +171,50 @@ class TestActivityMatcher:
         similarity = matcher._simple_similarity("snorkeling", "snorkel")
         assert 0 <= similarity <= 1
     
+    def test_simple_similarity_is_edit_distance(self):
+        """Test similarity is one minus the normalized Levenshtein distance."""
+        matcher = ActivityMatcher()
+        # "snorkeling" -> "snorkel" deletes 3 of 10 characters
+        assert matcher._simple_similarity("snorkeling", "snorkel") == pytest.approx(0.7)
+        # Same characters in a different order are no longer a perfect match
+        assert matcher._simple_similarity("ab", "ba") == 0.0
+        assert matcher._simple_similarity("kitten", "sitting") == pytest.approx(1 - 3 / 7)
+        assert matcher._simple_similarity("", "abc") == 0.0
+    
+    def test_fuzzy_match_edit_distance_threshold(self):
+        """Test fuzzy matching accepts distances up to the threshold, inclusive."""
+        matcher = ActivityMatcher()
+        # Two substitutions in ten characters is exactly 0.8 similarity
+        assert matcher._fuzzy_match("kayakingxx", "kayakingyy")
+        assert not matcher._fuzzy_match("kayakingxx", "kayakinyyy")
+    
+    def test_fuzzy_match_length_prefilter(self):
+        """Test pairs whose length gap exceeds the threshold skip edit distance."""
+        matcher = ActivityMatcher()
+        with patch.object(matcher, "_edit_distance") as mock_distance:
+            assert not matcher._fuzzy_match("hiking", "wine tasting")
+            # Substring matches are still accepted regardless of length
+            assert matcher._fuzzy_match("tour", "guided city tour")
+        mock_distance.assert_not_called()
+    
+    def test_edit_distance_is_bounded(self):
+        """Test the edit distance stops at max_dist + 1."""
+        matcher = ActivityMatcher()
+        assert matcher._edit_distance("kitten", "sitting", 3) == 3
+        assert matcher._edit_distance("kitten", "sitting", 2) == 3
+        assert matcher._edit_distance("café", "cafe", 4) == 1
+        assert matcher._edit_distance("", "abc", 1) == 2
+    
+    def test_fuzzy_matches_agrees_with_pairwise(self):
+        """Test the batched fuzzy match agrees with matching pair by pair."""
+        matcher = ActivityMatcher()
+        queries = ["snorkeling", "hike", "tour", "museum"]
+        data = ["snorkling", "hiking", "guided city tour", "museums", "wine tasting", "opera"]
+        expected = [any(matcher._fuzzy_match_normalized(q, d) for q in queries) for d in data]
+        assert matcher._fuzzy_matches(queries, data) == expected
+        assert expected == [True, True, True, True, False, False]
+        assert matcher._fuzzy_matches([], data) == [False] * len(data)
+    
     def test_is_plural_variant(self):
         """Test plural variant detection."""
         matcher = ActivityMatcher()
@@ -121,3 +222,13 @@ class TestActivityMatcher:
         assert matcher._is_plural_variant("tours", "tour") is True
         assert matcher._is_plural_variant("hiking", "hike") is True
 
+        assert matcher._is_plural_variant("galleries", "gallery") is True
+        assert matcher._is_plural_variant("wine tastings", "wine taste") is True
+    
+    def test_strip_suffix_whole_suffixes_only(self):
+        """Test suffixes are stripped as strings, not as character sets."""
+        assert _strip_suffix("skiing") == "ski"
+        assert _strip_suffix("snorkeling") == "snorkel"
+        assert _strip_suffix("tastings") == "tast"
+        assert _strip_suffix("beaches") == "beach"
+        assert _strip_suffix("gas") == "gas"
@@ -4,9 +4,10 @@ import os
 import pytest
 import tempfile
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from whoosh import index
 from whoosh.fields import Schema, TEXT, ID, STORED
-from retrieval.baseline_retriever import BaselineRetriever
+from retrieval.baseline_retriever import BaselineRetriever, _parse_doc
 
 
 class TestBaselineRetriever:
@@ -93,3 +94,75 @@ class TestBaselineRetriever:
         retriever.close()
         # Should not raise exception
 
+    
+    def test_context_manager_closes_searchers(self, test_index):
+        """Test leaving the context closes every pooled searcher."""
+        with BaselineRetriever(test_index) as retriever:
+            searcher = retriever._searcher()
+            assert retriever.search("museums")
+        
+        assert searcher.is_closed
+        assert retriever._searchers == {}
+    
+    def test_search_batch(self, test_index):
+        """Test batched search returns one result list per query."""
+        retriever = BaselineRetriever(test_index)
+        results = retriever.search_batch(["museums", "nonexistent_query_xyz"], [10, 10])
+        
+        assert len(results) == 2
+        assert len(results[0]) > 0
+        assert results[0][0]["doc_id"] == "test_1"
+        
+        retriever.close()
+    
+    def test_repeated_query_reuses_parse(self, test_index):
+        """Test repeated queries hit the parsed-query cache with identical results."""
+        retriever = BaselineRetriever(test_index)
+        first = retriever.search("museums", limit=10)
+        second = retriever.search("museums", limit=10)
+        
+        assert first == second
+        assert retriever._parse.cache_info().hits == 1
+        
+        retriever.close()
+    
+    def test_stored_document_parse_is_cached(self, test_index):
+        """Test repeated hits reuse the decoded stored document."""
+        _parse_doc.cache_clear()
+        retriever = BaselineRetriever(test_index)
+        first = retriever.search("museums", limit=10)
+        second = retriever.search("paris", limit=10)
+        
+        assert first[0]["document"] == {"name": "Paris"}
+        assert second[0]["document"] is first[0]["document"]
+        assert _parse_doc.cache_info().hits == 1
+        
+        retriever.close()
+    
+    def test_searcher_per_thread(self, test_index):
+        """Test each thread searches with its own searcher."""
+        retriever = BaselineRetriever(test_index)
+        
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(lambda _: retriever.search("museums"), range(8)))
+        main_searcher = retriever._searcher()
+        
+        assert main_searcher is retriever._searcher()
+        assert len(set(map(id, retriever._searchers.values()))) == len(retriever._searchers) > 1
+        
+        retriever.close()
+        assert retriever._searchers == {}
+    
+    def test_searcher_sees_index_updates(self, test_index):
+        """Test the searcher is refreshed after the index changes."""
+        retriever = BaselineRetriever(test_index)
+        assert retriever.search("tokyo") == []
+        
+        writer = index.open_dir(test_index).writer()
+        writer.add_document(doc_id="test_2", doc_type="destination", name="Tokyo",
+                            content="Tokyo has temples.", raw_data='{"name": "Tokyo"}')
+        writer.commit()
+        
+        assert [r["doc_id"] for r in retriever.search("tokyo")] == ["test_2"]
+        
+        retriever.close()
@@ -2,6 +2,7 @@
 
 import os
 import pytest
+import numpy as np
 from unittest.mock import Mock, patch, MagicMock
 from retrieval.embedding_generator import EmbeddingGenerator
 
@@ -37,9 +38,9 @@ class TestEmbeddingGenerator:
         generator.client.embeddings.create.return_value = mock_response
         
         embedding = generator.generate_embedding("test text")
-        assert isinstance(embedding, list)
-        assert len(embedding) == 1536
-        assert all(isinstance(x, (int, float)) for x in embedding)
+        assert isinstance(embedding, np.ndarray)
+        assert embedding.dtype == np.float32
+        assert embedding.shape == (1536,)
     
     def test_generate_embedding_error(self, generator):
         """Test error handling in embedding generation."""
@@ -66,6 +67,22 @@ class TestEmbeddingGenerator:
         embeddings = generator.generate_embeddings_batch(texts, batch_size=3)
         assert len(embeddings) == 3
         assert all(len(emb) == 1536 for emb in embeddings)
+        assert embeddings.shape == (3, 1536)
+        assert embeddings.dtype == np.float32
+    
+    def test_generate_embeddings_batch_deduplicates(self, generator):
+        """Test identical texts are embedded once and fanned back out in order."""
+        def respond(model, input):
+            response = MagicMock()
+            response.data = [MagicMock(embedding=[float(len(text))] * 1536) for text in input]
+            return response
+        
+        generator.client.embeddings.create.side_effect = respond
+        
+        embeddings = generator.generate_embeddings_batch(["a", "bb", "a"])
+        
+        assert generator.client.embeddings.create.call_args[1]["input"] == ["a", "bb"]
+        assert [emb[0] for emb in embeddings] == [1.0, 2.0, 1.0]
     
     def test_generate_embedding_text_cleaning(self, generator):
         """Test text cleaning in embedding generation."""
@@ -84,3 +101,73 @@ class TestEmbeddingGenerator:
         # Check that input was passed correctly
         assert "input" in call_args[1] or len(call_args[0]) > 0
 
+    
+    def test_generate_embeddings_batch_concurrent_order(self, generator):
+        """Test concurrently embedded batches are returned in input order."""
+        def respond(model, input):
+            response = MagicMock()
+            response.data = [MagicMock(embedding=[float(text)]) for text in input]
+            return response
+        
+        generator.client.embeddings.create.side_effect = respond
+        
+        texts = [str(i) for i in range(25)]
+        embeddings = generator.generate_embeddings_batch(texts, batch_size=4, concurrency=3)
+        
+        assert [emb[0] for emb in embeddings] == [float(i) for i in range(25)]
+        assert generator.client.embeddings.create.call_count == 7
+    
+    def test_generate_embeddings_batch_retries(self, generator):
+        """Test a failed batch request is retried, and raises once retries run out."""
+        mock_response = MagicMock()
+        mock_response.data = [MagicMock(embedding=[0.1] * 1536)]
+        generator.client.embeddings.create.side_effect = [Exception("rate limited"), mock_response]
+        
+        with patch('retrieval.embedding_generator.time.sleep') as mock_sleep:
+            embeddings = generator.generate_embeddings_batch(["text1"])
+            assert len(embeddings) == 1
+            mock_sleep.assert_called_once()
+            
+            generator.client.embeddings.create.side_effect = Exception("API Error")
+            with pytest.raises(Exception):
+                generator.generate_embeddings_batch(["text2"])
+    
+    def test_generate_embeddings_to_mmap(self, generator, tmp_path):
+        """Test embeddings are written to a float32 memory-mapped file."""
+        def respond(model, input):
+            response = MagicMock()
+            response.data = [MagicMock(embedding=[float(text)] * 1536) for text in input]
+            return response
+        
+        generator.client.embeddings.create.side_effect = respond
+        path = str(tmp_path / "embeddings.f32")
+        
+        texts = [str(i) for i in range(7)]
+        embeddings = generator.generate_embeddings_to_mmap(texts, path, batch_size=2, concurrency=2)
+        
+        assert isinstance(embeddings, np.memmap)
+        stored = np.memmap(path, dtype=np.float32, mode="r", shape=(7, 1536))
+        assert stored[:, 0].tolist() == [float(i) for i in range(7)]
+    
+    def test_quantize(self, generator):
+        """Test fp16 and per-vector int8 quantization."""
+        emb = np.array([[0.5, -0.25, 0.1], [0.0, 0.0, 0.0]], dtype=np.float32)
+        
+        assert generator.quantize(emb).dtype == np.float16
+        
+        q, scale = generator.quantize(emb, mode="int8")
+        assert q.dtype == np.int8 and scale.shape == (2, 1)
+        assert q[0].tolist() == [127, -64, 25]
+        assert q[1].tolist() == [0, 0, 0]
+        np.testing.assert_allclose(q * scale.astype(np.float32), emb, atol=0.005)
+        
+        with pytest.raises(ValueError):
+            generator.quantize(emb, mode="int4")
+    
+    def test_close(self):
+        """Test the OpenAI client is closed once, via close() or the context manager."""
+        with patch('retrieval.embedding_generator.OpenAI') as mock_openai:
+            with EmbeddingGenerator() as gen:
+                pass
+            gen.close()
+        mock_openai.return_value.close.assert_called_once()
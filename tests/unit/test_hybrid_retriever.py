@@ -4,6 +4,7 @@ import os
 import pytest
 import tempfile
 import shutil
+import threading
 from whoosh import index
 from whoosh.fields import Schema, TEXT, ID, STORED, KEYWORD
 from retrieval.hybrid_retriever import HybridRetriever
@@ -52,6 +53,34 @@ class TestHybridRetriever:
         assert retriever.vector_retriever is not None
         retriever.close()
     
+    def test_init_reuses_prebuilt_retrievers(self, test_index):
+        """Test HybridRetriever reuses injected retrievers instead of building its own."""
+        bm25 = MagicMock()
+        vector = MagicMock()
+        retriever = HybridRetriever(
+            bm25_index_path=test_index,
+            bm25_retriever=bm25,
+            vector_retriever=vector
+        )
+        assert retriever.bm25_retriever is bm25
+        assert retriever.vector_retriever is vector
+    
+    def test_close_leaves_injected_retrievers_open(self, test_index):
+        """Test closing only closes the retrievers the hybrid retriever created."""
+        bm25 = MagicMock()
+        vector = MagicMock()
+        with HybridRetriever(bm25_index_path=test_index, bm25_retriever=bm25,
+                             vector_retriever=vector):
+            pass
+        bm25.close.assert_not_called()
+        vector.close.assert_not_called()
+        
+        with patch('retrieval.hybrid_retriever.VectorRetriever') as mock_vector_cls:
+            with HybridRetriever(bm25_index_path=test_index, bm25_retriever=bm25):
+                pass
+        mock_vector_cls.return_value.close.assert_called_once()
+        bm25.close.assert_not_called()
+    
     @patch('retrieval.embedding_generator.OpenAI')
     def test_reciprocal_rank_fusion(self, mock_openai, test_index):
         """Test RRF ranking."""
@@ -80,6 +109,44 @@ class TestHybridRetriever:
         
         retriever.close()
     
+    @patch('retrieval.embedding_generator.OpenAI')
+    def test_reciprocal_rank_fusion_limit(self, mock_openai, test_index):
+        """Test RRF keeps only the top results and leaves inputs untouched."""
+        retriever = HybridRetriever(
+            bm25_index_path=test_index,
+            qdrant_collection="test_collection"
+        )
+        
+        bm25_results = [{"doc_id": "doc1"}, {"doc_id": "doc2"}]
+        vector_results = [{"doc_id": "doc2"}, {"doc_id": "doc3"}]
+        
+        combined = retriever.reciprocal_rank_fusion(bm25_results, vector_results, limit=2)
+        
+        assert [doc["doc_id"] for doc in combined] == ["doc2", "doc1"]
+        assert combined[0]["rrf_score"] == pytest.approx(1 / 62 + 1 / 61)
+        assert bm25_results[1] == {"doc_id": "doc2"}
+        
+        retriever.close()
+    
+    @patch('retrieval.embedding_generator.OpenAI')
+    def test_reciprocal_rank_fusion_vectorized(self, mock_openai, test_index):
+        """Test the NumPy RRF path matches the dict-based one, ties and duplicates included."""
+        retriever = HybridRetriever(
+            bm25_index_path=test_index,
+            qdrant_collection="test_collection"
+        )
+        
+        bm25_results = [{"doc_id": f"doc{i % 7}", "leg": "bm25", "i": i} for i in range(12)]
+        bm25_results.append({"doc_id": "", "leg": "bm25"})
+        vector_results = [{"doc_id": f"doc{i}", "leg": "vector", "i": i} for i in range(4, 15)]
+        
+        expected = retriever._rank_fusion(bm25_results, vector_results, limit=6)
+        with patch('retrieval.hybrid_retriever.VECTORIZED_RRF_MIN_RESULTS', 0):
+            assert retriever._rank_fusion(bm25_results, vector_results, limit=6) == expected
+            assert retriever._rank_fusion([], [], limit=6) == ([], 0)
+        
+        retriever.close()
+    
     @patch('retrieval.embedding_generator.OpenAI')
     @patch('retrieval.query_rewriter.OpenAI')
     def test_search(self, mock_query_openai, mock_embedding_openai, test_index):
@@ -112,3 +179,30 @@ class TestHybridRetriever:
         
         retriever.close()
 
+    
+    @patch('retrieval.embedding_generator.OpenAI')
+    def test_search_runs_legs_concurrently(self, mock_openai, test_index):
+        """Test the vector leg runs while the BM25 leg is still in progress."""
+        retriever = HybridRetriever(
+            bm25_index_path=test_index,
+            qdrant_collection="test_collection"
+        )
+        vector_started = threading.Event()
+        
+        def bm25_search(query, limit):
+            # Only returns once the vector search has started in parallel
+            assert vector_started.wait(timeout=5)
+            return {"results": [{"doc_id": "test_1"}]}
+        
+        def vector_search(query, limit):
+            vector_started.set()
+            return {"results": [{"doc_id": "test_2"}]}
+        
+        retriever.bm25_retriever.search = MagicMock(side_effect=bm25_search)
+        retriever.vector_retriever.search = MagicMock(side_effect=vector_search)
+        
+        result = retriever.search("museums", limit=10)
+        
+        assert {doc["doc_id"] for doc in result["results"]} == {"test_1", "test_2"}
+        
+        retriever.close()
@@ -6,6 +6,7 @@ import tempfile
 import shutil
 from whoosh import index
 from whoosh.fields import Schema, TEXT, ID, STORED, KEYWORD
+from whoosh.query import And, Or, Term
 from retrieval.improved_retriever import ImprovedRetriever
 from unittest.mock import patch, MagicMock
 
@@ -76,6 +77,61 @@ class TestImprovedRetriever:
         
         retriever.close()
     
+    def test_search_results_cached(self, test_index):
+        """Test repeated searches are served from the result cache."""
+        rewriter = MagicMock()
+        rewriter.rewrite_query.return_value = {"city": None, "country": None, "activities": ["museums"]}
+        retriever = ImprovedRetriever(test_index, rewriter=rewriter)
+        
+        first = retriever.search("museums", limit=10)
+        first["results"].clear()
+        second = retriever.search("museums", limit=10)
+        retriever.search("museums", limit=5)
+        
+        assert rewriter.rewrite_query.call_count == 2
+        assert len(second["results"]) == 1
+        
+        retriever.close()
+    
+    def test_search_compact_stored_fields(self, test_index):
+        """Test documents written with compressed raw_data and list activities decode."""
+        from retrieval.stored_fields import pack_document
+        
+        writer = index.open_dir(test_index).writer()
+        writer.add_document(
+            doc_id="test_2",
+            doc_type="destination",
+            name="Lyon",
+            country="France",
+            region="Lyon, France",
+            content="Lyon has food markets.",
+            activities="food markets",
+            extracted_activities=["food markets"],
+            raw_data=pack_document({"name": "Lyon"})
+        )
+        writer.commit()
+        
+        retriever = ImprovedRetriever(test_index, rewriter=MagicMock())
+        results = retriever.search_with_filters("food", limit=10)
+        
+        assert results[0]["document"] == {"name": "Lyon"}
+        assert results[0]["activities"] == ["food markets"]
+        
+        retriever.close()
+    
+    def test_stored_document_parse_is_cached(self, test_index):
+        """Test a document hit by repeated searches is decoded once."""
+        from retrieval.baseline_retriever import _parse_doc
+        
+        _parse_doc.cache_clear()
+        retriever = ImprovedRetriever(test_index, rewriter=MagicMock())
+        first = retriever.search_with_filters("paris", limit=10)
+        second = retriever.search_with_filters("museums", limit=10)
+        
+        assert first[0]["document"] is second[0]["document"]
+        assert _parse_doc.cache_info().hits == 1
+        retriever.close()
+    
     def test_search_with_filters(self, test_index):
         """Test search with structured filters."""
         retriever = ImprovedRetriever(test_index)
@@ -108,3 +164,107 @@ class TestImprovedRetriever:
         retriever.close()
         # Should not raise exception
 
+    
+    def test_activity_expansion_memoized(self, test_index):
+        """Test each activity is expanded once across filter branches and searches."""
+        retriever = ImprovedRetriever(test_index, rewriter=MagicMock())
+        retriever.search_with_filters(query="nonexistent", activities=["Museums "], limit=10)
+        retriever.search_with_filters(query="nonexistent", activities=["museums"], limit=10)
+        
+        info = retriever.activity_matcher._morph_cached.cache_info()
+        assert (info.hits, info.misses) == (1, 1)
+        retriever.close()
+    
+    def test_filters_reuse_parser(self, test_index):
+        """Test filter parsing goes through the shared, cached content parser."""
+        retriever = ImprovedRetriever(test_index, rewriter=MagicMock())
+        with patch('retrieval.improved_retriever.QueryParser') as mock_parser_cls:
+            for _ in range(2):
+                retriever.search_with_filters(query="museums", city="Paris", country="France",
+                                              activities=["museums"], limit=10)
+        
+        mock_parser_cls.assert_not_called()
+        assert retriever._parse.cache_info().hits == 1
+        assert retriever._filter_query.cache_info().hits == 1
+        assert retriever._content_term.cache_info().hits >= 2
+        retriever.close()
+    
+    def test_index_update_invalidates_results(self, test_index):
+        """Test an index change refreshes the searcher and drops cached results."""
+        rewriter = MagicMock()
+        rewriter.rewrite_query.return_value = {"city": None, "country": None, "activities": ["museums"]}
+        retriever = ImprovedRetriever(test_index, rewriter=rewriter)
+        assert retriever.search("museums", limit=10)["num_results"] == 1
+        
+        writer = index.open_dir(test_index).writer()
+        writer.add_document(doc_id="test_2", doc_type="destination", name="Rome", country="Italy",
+                            region="Rome, Italy", content="Rome has museums.", activities="museums",
+                            extracted_activities='["museums"]', raw_data='{"name": "Rome"}')
+        writer.commit()
+        
+        assert retriever.search("museums", limit=10)["num_results"] == 2
+        
+        with retriever:
+            searcher = retriever._searcher()
+        assert searcher.is_closed
+        assert retriever._searchers == {}
+    
+    def test_activity_query_single_search(self, test_index):
+        """Test strict and lenient activity matching run as one search call."""
+        retriever = ImprovedRetriever(test_index, rewriter=MagicMock())
+        searcher = MagicMock()
+        searcher.search.return_value = MagicMock(top_n=[])
+        retriever._searcher = lambda: searcher
+        retriever.search_with_filters(query="museums OR galleries", city="Paris",
+                                      activities=["museums"], limit=10)
+        
+        searcher.search.assert_called_once()
+        (activity_query,), kwargs = searcher.search.call_args
+        strict_query, lenient_query = activity_query.subqueries
+        assert kwargs["filter"] == retriever._parse("paris")
+        assert strict_query.subqueries[0] == retriever._parse("museums OR galleries")
+        assert lenient_query.boost < 1
+        retriever.close()
+    
+    def test_content_terms_built_without_parser(self, test_index):
+        """Test names become analyzed content terms, not parsed OR strings."""
+        retriever = ImprovedRetriever(test_index, rewriter=MagicMock())
+        
+        assert retriever._content_term("New York") == And([Term("content", "new"), Term("content", "york")])
+        assert retriever._content_term("the") is None
+        assert retriever._content_any(["art galleries", "museums"]) == Or([
+            And([Term("content", "art"), Term("content", "galleries")]),
+            Term("content", "museums"),
+        ])
+        retriever.close()
+    
+    def test_city_country_filter(self, test_index):
+        """Test city/country restrict results through the search filter."""
+        retriever = ImprovedRetriever(test_index, rewriter=MagicMock())
+        
+        assert len(retriever.search_with_filters(query="museums", city="Paris")) == 1
+        assert retriever.search_with_filters(query="museums", city="Rome") == []
+        assert retriever._filter_query(None, None) is None
+        retriever.close()
+    
+    def test_lenient_activity_match_without_text_hit(self, test_index):
+        """Test content activity matches are returned when the text query misses."""
+        retriever = ImprovedRetriever(test_index, rewriter=MagicMock())
+        results = retriever.search_with_filters(query="zzzz", activities=["museum"], limit=10)
+        
+        assert [r["doc_id"] for r in results] == ["test_1"]
+        retriever.close()
+    
+    def test_rewriter_and_matcher_created_lazily(self, test_index):
+        """Test the rewriter is only built when a search needs it."""
+        with patch('retrieval.improved_retriever.QueryRewriter') as mock_rewriter_cls:
+            retriever = ImprovedRetriever(test_index)
+            retriever.search_with_filters(query="museums", city="Paris", limit=10)
+            mock_rewriter_cls.assert_not_called()
+            
+            assert retriever.rewriter is mock_rewriter_cls.return_value
+            assert retriever.rewriter is retriever.rewriter
+        
+        mock_rewriter_cls.assert_called_once()
+        assert "activity_matcher" not in vars(retriever)
+        retriever.close()
@@ -85,10 +85,11 @@ class TestLangChainIndexBuilder:
             json.dump([sample_documents[1]], f)
         
         # Load documents
-        documents = builder.load_documents(destinations_path, guides_path)
+        documents = list(builder.load_documents(destinations_path, guides_path))
         assert len(documents) == 2
         assert documents[0]["name"] == "Paris"
         assert documents[1]["name"] == "Tokyo Travel Guide"
+        assert [doc["type"] for doc in documents] == ["destination", "guide"]
     
     def test_load_documents_missing_files(self, builder, temp_dir):
         """Test loading documents when files don't exist."""
@@ -96,7 +97,7 @@ class TestLangChainIndexBuilder:
         guides_path = os.path.join(temp_dir, "guides.json")
         
         # Should not raise error, just return empty list
-        documents = builder.load_documents(destinations_path, guides_path)
+        documents = list(builder.load_documents(destinations_path, guides_path))
         assert documents == []
     
     @patch('indexing.langchain_index_builder.ActivityExtractor')
@@ -119,50 +120,93 @@ class TestLangChainIndexBuilder:
         assert doc.metadata["doc_type"] == "destination"
         assert doc.metadata["name"] == "Paris"
         assert doc.metadata["country"] == "France"
+        assert doc.metadata["name_lc"] == "paris"
+        assert doc.metadata["country_lc"] == "france"
         assert "museums" in doc.metadata["activities"]
         assert "art" in doc.metadata["activities"]  # From extracted activities
     
+    @patch('indexing.langchain_index_builder.MIN_DOCS_PER_WORKER', 1)
+    def test_documents_to_langchain_docs_sharded(self, builder, sample_documents):
+        """Test sharded conversion in worker processes keeps order and doc ids."""
+        docs = builder.documents_to_langchain_docs(sample_documents, [["art"], []], workers=2)
+        
+        assert [doc.metadata["doc_id"] for doc in docs] == ["destination_0", "guide_1"]
+        assert docs[0].metadata["activities"][0] == "art"
+        assert docs == [
+            builder.document_to_langchain_doc(doc, i, extracted_activities=acts)
+            for i, (doc, acts) in enumerate(zip(sample_documents, [["art"], []]))
+        ]
+    
+    def test_document_to_langchain_doc_activity_order(self, builder, sample_documents):
+        """Test merged activities keep extracted-then-original order without duplicates."""
+        doc = builder.document_to_langchain_doc(
+            sample_documents[0], 0, extracted_activities=["museums", "Art ", "art"]
+        )
+        
+        assert doc.metadata["activities"][:2] == ["museums", "art"]
+        assert doc.metadata["activities"].count("museums") == 1
+    
+    @patch('indexing.langchain_index_builder.QdrantClient')
     @patch('indexing.langchain_index_builder.Qdrant')
     @patch('indexing.langchain_index_builder.ActivityExtractor')
-    def test_build_vector_index(self, mock_extractor, mock_qdrant, builder, sample_documents, temp_dir):
-        """Test building vector index."""
+    def test_build_vector_index(self, mock_extractor, mock_qdrant, mock_client_class, builder, sample_documents, temp_dir):
+        """Test building vector index embeds all texts in one request and upserts the vectors."""
         # Mock activity extractor
         mock_extractor_instance = MagicMock()
-        mock_extractor_instance.extract_structured_fields.return_value = {
-            "extracted_activities": []
-        }
+        mock_extractor_instance.extract_activities_batch.return_value = [[], []]
         builder.extractor = mock_extractor_instance
-        
-        # Mock Qdrant
-        mock_vector_store = MagicMock()
-        mock_qdrant.from_documents.return_value = mock_vector_store
+        builder.embeddings.embed_documents.return_value = [[0.1] * 1536, [0.2] * 1536]
         
         # Build index
         vector_store = builder.build_vector_index(sample_documents, recreate=True)
         
-        # Verify Qdrant.from_documents was called
-        assert mock_qdrant.from_documents.called
-        call_args = mock_qdrant.from_documents.call_args
-        assert len(call_args[1]["documents"]) == 2
-        assert isinstance(call_args[1]["documents"][0], Document)
+        # One embeddings request for both documents
+        builder.embeddings.embed_documents.assert_called_once()
+        assert len(builder.embeddings.embed_documents.call_args[0][0]) == 2
+        
+        # Precomputed vectors upserted with LangChain's payload layout
+        mock_client = mock_client_class.return_value
+        mock_client.upsert.assert_called_once()
+        points = mock_client.upsert.call_args[1]["points"]
+        assert len(points.ids) == 2
+        assert points.vectors[0] == [0.1] * 1536
+        assert "Paris" in points.payloads[0]["page_content"]
+        assert points.payloads[0]["metadata"]["doc_id"] == "destination_0"
+        assert mock_client.upsert.call_args[1]["wait"] is True
+        assert vector_store is mock_qdrant.return_value
+    
+    @patch('indexing.langchain_index_builder.BUILD_WINDOW', 1)
+    @patch('indexing.langchain_index_builder.QdrantClient')
+    @patch('indexing.langchain_index_builder.Qdrant')
+    def test_build_vector_index_streamed_in_windows(self, mock_qdrant, mock_client_class, builder, sample_documents):
+        """Test a document stream is extracted, embedded and upserted one window at a time."""
+        builder.extractor = MagicMock()
+        builder.extractor.extract_activities_batch.side_effect = lambda items: [[]] * len(items)
+        builder.embeddings.embed_documents.side_effect = lambda texts: [[0.1] * 1536] * len(texts)
+        
+        builder.build_vector_index(iter(sample_documents), recreate=True)
+        
+        assert builder.extractor.extract_activities_batch.call_count == 2
+        assert builder.embeddings.embed_documents.call_count == 2
+        mock_client = mock_client_class.return_value
+        mock_client.create_collection.assert_called_once()
+        doc_ids = [call[1]["points"].payloads[0]["metadata"]["doc_id"]
+                   for call in mock_client.upsert.call_args_list]
+        assert doc_ids == ["destination_0", "guide_1"]
     
+    @patch('indexing.langchain_index_builder.QdrantClient')
     @patch('indexing.langchain_index_builder.Qdrant')
     @patch('indexing.langchain_index_builder.ActivityExtractor')
-    def test_build_vector_index_recreate(self, mock_extractor, mock_qdrant, builder, sample_documents, temp_dir):
+    def test_build_vector_index_recreate(self, mock_extractor, mock_qdrant, mock_client_class, builder, sample_documents, temp_dir):
         """Test building vector index with recreate=True removes existing database."""
         # Create existing Qdrant directory
         os.makedirs(builder.qdrant_path, exist_ok=True)
         
         # Mock activity extractor
         mock_extractor_instance = MagicMock()
-        mock_extractor_instance.extract_structured_fields.return_value = {
-            "extracted_activities": []
-        }
+        mock_extractor_instance.extract_activities_batch.return_value = [[], []]
         builder.extractor = mock_extractor_instance
-        
-        # Mock Qdrant
-        mock_vector_store = MagicMock()
-        mock_qdrant.from_documents.return_value = mock_vector_store
+        builder.embeddings.embed_documents.return_value = [[0.1] * 1536, [0.2] * 1536]
         
         # Build index
         builder.build_vector_index(sample_documents, recreate=True)
@@ -14,7 +14,8 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspa
 from retrieval.langchain_retriever import (
     LangChainVectorRetriever,
     LangChainBM25Retriever,
-    LangChainHybridRetriever
+    LangChainHybridRetriever,
+    _rrf
 )
 
 
@@ -131,6 +132,24 @@ class TestLangChainVectorRetriever:
         if result["num_results"] > 0:
             assert result["results"][0]["country"] == "France"
     
+    def test_search_uses_lowercased_metadata(self, retriever):
+        """Test the city filter uses the lowercased copies stored at index time."""
+        doc = Document(page_content="Lyon", metadata={
+            "doc_id": "dest_3", "name": "Lyon", "country": "France", "region": "Rhone",
+            "name_lc": "lyon", "country_lc": "france", "region_lc": "auvergne-rhone-alpes",
+        })
+        retriever.vector_store.similarity_search_with_score.return_value = [(doc, 0.9)]
+        
+        assert retriever.search("food", city="AUVERGNE")["num_results"] == 1
+        assert retriever.search("food", city="Paris")["num_results"] == 0
+    
+    def test_search_stops_at_limit(self, retriever):
+        """Test candidates after the first `limit` matches are not formatted."""
+        result = retriever.search("Paris", limit=1)
+        
+        assert [r["doc_id"] for r in result["results"]] == ["dest_1"]
+        assert result["num_results"] == 1
+    
     def test_search_with_activities_filter(self, retriever):
         """Test search with activities filter."""
         retriever.activity_matcher.expand_activity.return_value = ["museums", "museum"]
@@ -142,6 +161,29 @@ class TestLangChainVectorRetriever:
             doc_activities = result["results"][0]["activities"]
             assert any("museum" in str(act).lower() for act in doc_activities)
     
+    def test_activities_filter_pushed_to_qdrant(self, retriever):
+        """Test activity filters are sent to Qdrant instead of over-fetching."""
+        retriever.vector_store.metadata_payload_key = "metadata"
+        retriever.activity_matcher.expand_activity.return_value = ["museums", "museum"]
+        retriever.search("cultural activities", limit=5, activities=["museums"])
+        
+        kwargs = retriever.vector_store.similarity_search_with_score.call_args.kwargs
+        condition = kwargs["filter"].must[0]
+        assert kwargs["k"] == 5
+        assert condition.key == "metadata.activities"
+        assert condition.match.any == ["museum", "museums"]
+    
+    def test_country_filter_pushed_to_qdrant(self, retriever):
+        """Test the country filter is sent to Qdrant on the lowercased copy."""
+        retriever.vector_store.metadata_payload_key = "metadata"
+        retriever.search("capital cities", limit=5, country="FRANCE")
+        
+        kwargs = retriever.vector_store.similarity_search_with_score.call_args.kwargs
+        condition = kwargs["filter"].must[0]
+        assert kwargs["k"] == 5
+        assert condition.key == "metadata.country_lc"
+        assert condition.match.value == "france"
+    
     def test_search_rewrites_query(self, retriever):
         """Test that query rewriting is applied."""
         retriever.query_rewriter.rewrite_query.return_value = {
@@ -256,43 +298,37 @@ class TestLangChainHybridRetriever:
         return mock_retriever
     
     @pytest.fixture
-    def mock_ensemble_retriever(self):
-        """Mock ensemble retriever."""
-        mock_ensemble = MagicMock()
-        mock_doc = Document(
-            page_content="Paris is the capital",
-            metadata={
-                "doc_id": "dest_1",
-                "doc_type": "destination",
-                "name": "Paris",
-                "country": "France"
-            }
-        )
-        mock_ensemble.get_relevant_documents.return_value = [mock_doc]
-        return mock_ensemble
+    def mock_bm25_retriever(self):
+        """Mock BM25 retriever."""
+        mock_bm25 = MagicMock()
+        mock_bm25._whoosh_retriever.search.return_value = {
+            "rewritten_query": {"city": "Paris"},
+            "results": [
+                {"doc_id": "dest_2", "name": "Lyon", "document": {"description": "Lyon"}},
+                {"doc_id": "dest_1", "name": "Paris", "document": {"description": "Paris"}},
+            ]
+        }
+        return mock_bm25
     
     @pytest.fixture
-    def retriever(self, temp_dir, mock_vector_retriever, mock_ensemble_retriever):
+    def retriever(self, temp_dir, mock_vector_retriever, mock_bm25_retriever):
         """Create LangChainHybridRetriever instance."""
         qdrant_path = os.path.join(temp_dir, "qdrant_db")
         whoosh_index_path = os.path.join(temp_dir, "whoosh_index")
         os.makedirs(whoosh_index_path, exist_ok=True)
         
         with patch('retrieval.langchain_retriever.LangChainVectorRetriever') as mock_vector_class, \
-             patch('retrieval.langchain_retriever.LangChainBM25Retriever') as mock_bm25_class, \
-             patch('retrieval.langchain_retriever.EnsembleRetriever') as mock_ensemble_class:
+             patch('retrieval.langchain_retriever.LangChainBM25Retriever') as mock_bm25_class:
             
             mock_vector_class.return_value = mock_vector_retriever
-            mock_bm25_class.return_value = MagicMock()
-            mock_ensemble_class.return_value = mock_ensemble_retriever
+            mock_bm25_class.return_value = mock_bm25_retriever
             
             retriever = LangChainHybridRetriever(
                 qdrant_path=qdrant_path,
                 whoosh_index_path=whoosh_index_path
             )
-            retriever.vector_retriever = mock_vector_retriever
-            retriever.ensemble_retriever = mock_ensemble_retriever
-            return retriever
+        yield retriever
+        retriever.close()
     
     def test_init_with_whoosh(self, temp_dir, mock_vector_retriever):
         """Test initialization with Whoosh index."""
@@ -301,12 +337,10 @@ class TestLangChainHybridRetriever:
         os.makedirs(whoosh_index_path, exist_ok=True)
         
         with patch('retrieval.langchain_retriever.LangChainVectorRetriever') as mock_vector_class, \
-             patch('retrieval.langchain_retriever.LangChainBM25Retriever') as mock_bm25_class, \
-             patch('retrieval.langchain_retriever.EnsembleRetriever') as mock_ensemble_class:
+             patch('retrieval.langchain_retriever.LangChainBM25Retriever') as mock_bm25_class:
             
             mock_vector_class.return_value = mock_vector_retriever
             mock_bm25_class.return_value = MagicMock()
-            mock_ensemble_class.return_value = MagicMock()
             
             retriever = LangChainHybridRetriever(
                 qdrant_path=qdrant_path,
@@ -314,7 +348,7 @@ class TestLangChainHybridRetriever:
             )
             assert retriever.vector_retriever is not None
             assert retriever.bm25_retriever is not None
-            assert retriever.ensemble_retriever is not None
+            retriever.close()
     
     def test_init_without_whoosh(self, temp_dir, mock_vector_retriever):
         """Test initialization without Whoosh index."""
@@ -329,16 +363,23 @@ class TestLangChainHybridRetriever:
             )
             assert retriever.vector_retriever is not None
             assert retriever.bm25_retriever is None
-            assert retriever.ensemble_retriever is None
     
-    def test_search_with_ensemble(self, retriever):
-        """Test search using ensemble retriever."""
+    def test_search_fuses_legs(self, retriever, mock_bm25_retriever):
+        """Test search combines BM25 and vector results with RRF."""
         result = retriever.search("Paris", limit=5)
         
         assert result["original_query"] == "Paris"  # Should use the query parameter
         assert result["method"] == "langchain_hybrid"
-        assert "results" in result
-        assert retriever.ensemble_retriever.get_relevant_documents.called
+        assert result["rewritten_query"] == {"city": "Paris"}
+        assert [r["doc_id"] for r in result["results"]] == ["dest_1", "dest_2"]
+        assert result["results"][0]["description"] == "Paris is beautiful"
+        mock_bm25_retriever._whoosh_retriever.search.assert_called_once_with("Paris", limit=5)
+    
+    def test_rrf(self):
+        """Test RRF sums reciprocal ranks across rankings."""
+        scores = _rrf([["a", "b"], ["b"]], k=60)
+        
+        assert scores == {"a": 1 / 61, "b": 1 / 62 + 1 / 61}
     
     def test_search_fallback_to_vector(self, temp_dir, mock_vector_retriever):
         """Test search falls back to vector when ensemble not available."""
@@ -358,3 +399,31 @@ class TestLangChainHybridRetriever:
             assert result["method"] == "langchain_vector"
             assert mock_vector_retriever.search.called
 
+    
+    def test_close(self, retriever, mock_bm25_retriever):
+        """Test close shuts down the executor and closes the BM25 retriever."""
+        retriever.close()
+        
+        mock_bm25_retriever.close.assert_called_once()
+        with pytest.raises(RuntimeError):
+            retriever._executor.submit(print)
+    
+    def test_legs_share_rewriter_and_matcher(self, temp_dir, mock_vector_retriever):
+        """Test both legs are built with the same rewriter and activity matcher."""
+        whoosh_index_path = os.path.join(temp_dir, "whoosh_index")
+        os.makedirs(whoosh_index_path, exist_ok=True)
+        rewriter, matcher = MagicMock(), MagicMock()
+        
+        with patch('retrieval.langchain_retriever.LangChainVectorRetriever') as mock_vector_class, \
+             patch('retrieval.langchain_retriever.LangChainBM25Retriever') as mock_bm25_class:
+            mock_vector_class.return_value = mock_vector_retriever
+            retriever = LangChainHybridRetriever(
+                qdrant_path=os.path.join(temp_dir, "qdrant_db"),
+                whoosh_index_path=whoosh_index_path,
+                rewriter=rewriter,
+                activity_matcher=matcher
+            )
+            retriever.close()
+        
+        for mock_class in (mock_vector_class, mock_bm25_class):
+            assert mock_class.call_args.kwargs == {"rewriter": rewriter, "activity_matcher": matcher}
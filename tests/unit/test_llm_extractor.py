@@ -24,11 +24,20 @@ class TestActivityExtractor:
         assert hasattr(extractor, 'client')
         assert hasattr(extractor, 'model')
     
+    @patch('indexing.llm_extractor.OpenAI')
+    def test_extractors_share_http_client(self, mock_openai):
+        """Test every extractor's OpenAI client uses the same pooled HTTP client."""
+        ActivityExtractor()
+        ActivityExtractor()
+        
+        first, second = (call[1]["http_client"] for call in mock_openai.call_args_list)
+        assert first is second
+    
     def test_extract_activities(self, extractor):
         """Test activity extraction."""
         mock_response = MagicMock()
         mock_response.choices = [MagicMock()]
-        mock_response.choices[0].message.content = '["snorkeling", "diving", "beaches"]'
+        mock_response.choices[0].message.content = '{"activities": ["snorkeling", "diving", "beaches"]}'
         
         extractor.client.chat.completions.create.return_value = mock_response
         
@@ -40,12 +49,15 @@ class TestActivityExtractor:
         assert isinstance(activities, list)
         assert len(activities) > 0
         assert "snorkeling" in activities or "diving" in activities
+        
+        call_kwargs = extractor.client.chat.completions.create.call_args[1]
+        assert call_kwargs["response_format"] == {"type": "json_object"}
     
     def test_extract_structured_fields(self, extractor):
         """Test structured field extraction."""
         mock_response = MagicMock()
         mock_response.choices = [MagicMock()]
-        mock_response.choices[0].message.content = '["museums", "art galleries", "city tours"]'
+        mock_response.choices[0].message.content = '{"activities": ["museums", "art galleries", "city tours"]}'
         
         extractor.client.chat.completions.create.return_value = mock_response
         
@@ -66,3 +78,81 @@ class TestActivityExtractor:
         activities = extractor.extract_activities("test description", "destination")
         assert activities == []
 
+    
+    def test_extract_activities_batch(self, extractor):
+        """Test batch extraction returns one list per item, in order."""
+        def respond(**kwargs):
+            prompt = kwargs["messages"][1]["content"]
+            response = MagicMock()
+            response.choices = [MagicMock()]
+            response.choices[0].message.content = '{"activities": ["hiking"]}' if "mountain" in prompt else '{"activities": ["diving"]}'
+            return response
+        
+        extractor.client.chat.completions.create.side_effect = respond
+        
+        results = extractor.extract_activities_batch([
+            ("A mountain retreat.", "destination"),
+            ("A reef with clear water.", "destination"),
+            ("Guided mountain walks.", "guide")
+        ])
+        
+        assert results == [["hiking"], ["diving"], ["hiking"]]
+        assert extractor.client.chat.completions.create.call_count == 3
+    
+    def test_extract_activities_batch_deduplicates(self, extractor):
+        """Test identical descriptions of the same type are extracted once."""
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = '{"activities": ["hiking"]}'
+        extractor.client.chat.completions.create.return_value = response
+        
+        results = extractor.extract_activities_batch([
+            ("A mountain retreat.", "destination"),
+            ("A mountain retreat.", "destination"),
+            ("A mountain retreat.", "guide")
+        ])
+        
+        assert results == [["hiking"], ["hiking"], ["hiking"]]
+        assert results[0] is not results[1]
+        assert extractor.client.chat.completions.create.call_count == 2
+    
+    def test_extract_activities_batch_empty(self, extractor):
+        """Test batch extraction of no items makes no requests."""
+        assert extractor.extract_activities_batch([]) == []
+        assert not extractor.client.chat.completions.create.called
+    
+    def test_extract_activities_disk_cache(self, tmp_path):
+        """Test extractions persist on disk and are reused by a new extractor."""
+        cache_path = str(tmp_path / "llm_cache.sqlite")
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = '{"activities": ["hiking"]}'
+        
+        with patch.dict(os.environ, {'OPENAI_API_KEY': 'test-key'}):
+            first = ActivityExtractor(cache_path=cache_path)
+            first.client = MagicMock()
+            first.client.chat.completions.create.return_value = response
+            assert first.extract_activities("A mountain retreat.") == ["hiking"]
+            assert first.extract_activities("A mountain retreat.") == ["hiking"]
+            assert first.client.chat.completions.create.call_count == 1
+            
+            second = ActivityExtractor(cache_path=cache_path)
+            second.client = MagicMock()
+            assert second.extract_activities("A mountain retreat.") == ["hiking"]
+            assert not second.client.chat.completions.create.called
+            
+            # The document type is part of the key
+            second.client.chat.completions.create.return_value = response
+            second.extract_activities("A mountain retreat.", "guide")
+            assert second.client.chat.completions.create.call_count == 1
+    
+    def test_extract_activities_errors_not_cached(self, tmp_path):
+        """Test failed extractions are retried rather than cached."""
+        with patch.dict(os.environ, {'OPENAI_API_KEY': 'test-key'}):
+            extractor = ActivityExtractor(cache_path=str(tmp_path / "llm_cache.sqlite"))
+        extractor.client = MagicMock()
+        extractor.client.chat.completions.create.side_effect = Exception("API Error")
+        
+        assert extractor.extract_activities("test description") == []
+        assert extractor.extract_activities("test description") == []
+        assert extractor.client.chat.completions.create.call_count == 2
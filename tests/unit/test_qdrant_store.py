@@ -5,7 +5,8 @@ import pytest
 import tempfile
 import shutil
 from unittest.mock import patch, MagicMock
-from retrieval.qdrant_store import QdrantStore
+from qdrant_client.http import models
+from retrieval.qdrant_store import QdrantStore, DEFAULT_INDEXING_THRESHOLD
 
 
 class TestQdrantStore:
@@ -25,6 +26,17 @@ class TestQdrantStore:
         assert store.collection_name == "test_collection"
         assert store.embedding_dim == 1536
     
+    @patch('retrieval.qdrant_store.QdrantClient')
+    def test_remote_client_uses_grpc_pool(self, mock_client, temp_qdrant_dir):
+        """Test a server URL gets a pooled gRPC client."""
+        store = QdrantStore(collection_name="test_collection", url="http://qdrant:6333")
+        
+        kwargs = mock_client.call_args[1]
+        assert store.remote
+        assert kwargs["prefer_grpc"] is True
+        assert kwargs["grpc_port"] == 6334
+        assert kwargs["pool_size"] == 100
+    
     def test_recreate_collection(self, temp_qdrant_dir):
         """Test collection recreation."""
         store = QdrantStore(collection_name="test_collection")
@@ -53,6 +65,95 @@ class TestQdrantStore:
         except Exception:
             pass  # Expected if Qdrant not available
     
+    @patch('retrieval.qdrant_store.UPSERT_BATCH_SIZE', 2)
+    def test_add_documents_batched(self, temp_qdrant_dir):
+        """Test bulk adds are split into batches and only the last one waits."""
+        store = QdrantStore(collection_name="test_collection")
+        store.client = MagicMock()
+        
+        documents = [{"doc_id": f"test_{i}", "raw_data": {"name": "Test"}} for i in range(5)]
+        store.add_documents(documents, [[0.1] * 1536] * 5, start_id=10)
+        
+        calls = store.client.upsert.call_args_list
+        assert [call[1]["points"].ids for call in calls] == [[10, 11], [12, 13], [14]]
+        assert [call[1]["wait"] for call in calls] == [False, False, True]
+        assert calls[0][1]["points"].payloads[1]["doc_id"] == "test_1"
+    
+    @patch('retrieval.qdrant_store.UPSERT_BATCH_SIZE', 2)
+    def test_add_documents_concurrent_remote(self, temp_qdrant_dir):
+        """Test batches against a server are sent concurrently and each waits."""
+        store = QdrantStore(collection_name="test_collection")
+        store.client = MagicMock()
+        store.remote = True
+        
+        documents = [{"doc_id": f"test_{i}", "raw_data": {"name": "Test"}} for i in range(5)]
+        store.add_documents(documents, [[0.1] * 1536] * 5, start_id=10)
+        
+        calls = store.client.upsert.call_args_list
+        assert sorted(call[1]["points"].ids for call in calls) == [[10, 11], [12, 13], [14]]
+        assert all(call[1]["wait"] for call in calls)
+    
+    @patch('retrieval.qdrant_store.MIN_POINTS_PER_UPLOAD_WORKER', 2)
+    @patch('retrieval.qdrant_store.os.cpu_count', return_value=4)
+    def test_add_documents_large_remote_uses_upload_processes(self, mock_cpu_count, temp_qdrant_dir):
+        """Test large adds against a server are uploaded from worker processes."""
+        store = QdrantStore(collection_name="test_collection")
+        store.client = MagicMock()
+        store.remote = True
+        
+        documents = [{"doc_id": f"test_{i}", "raw_data": {"name": "Test"}} for i in range(5)]
+        store.add_documents(documents, [[0.1] * 1536] * 5, start_id=10)
+        
+        store.client.upsert.assert_not_called()
+        kwargs = store.client.upload_collection.call_args[1]
+        assert kwargs["ids"] == [10, 11, 12, 13, 14]
+        assert kwargs["parallel"] == 2
+        assert kwargs["payload"][1]["doc_id"] == "test_1"
+    
+    def test_bulk_load_restores_indexing_threshold(self, temp_qdrant_dir):
+        """Test bulk loads suspend HNSW indexing on a server and restore it after."""
+        store = QdrantStore(collection_name="test_collection")
+        store.client = MagicMock()
+        store.remote = True
+        store.client.get_collection.return_value.config.optimizer_config.indexing_threshold = 20000
+        
+        with store.bulk_load():
+            first = store.client.update_collection.call_args
+            assert first[1]["optimizer_config"].indexing_threshold == 0
+        
+        last = store.client.update_collection.call_args
+        assert last[1]["optimizer_config"].indexing_threshold == 20000
+    
+    def test_bulk_load_restores_default_threshold_when_unset(self, temp_qdrant_dir):
+        """Test an unreported indexing threshold is restored to the default, not left at 0."""
+        store = QdrantStore(collection_name="test_collection")
+        store.client = MagicMock()
+        store.remote = True
+        store.client.get_collection.return_value.config.optimizer_config.indexing_threshold = None
+        
+        with store.bulk_load():
+            pass
+        
+        last = store.client.update_collection.call_args
+        assert last[1]["optimizer_config"].indexing_threshold == DEFAULT_INDEXING_THRESHOLD
+    
+    def test_detects_legacy_payloads(self, temp_qdrant_dir):
+        """Test collections written before payload version 2 are flagged for a rebuild."""
+        store = QdrantStore(collection_name="test_collection")
+        store.client.delete_collection("test_collection")
+        store._ensure_collection()
+        assert not store._has_legacy_payloads()
+        
+        store.client.upsert("test_collection", points=[
+            models.PointStruct(id=0, vector=[0.1] * 1536,
+                               payload={"activities": ["Northern Lights viewing"]})
+        ])
+        assert store._has_legacy_payloads()
+        
+        store.add_documents([{"doc_id": "test_0", "activities": ["Hiking"], "raw_data": {}}],
+                            [[0.1] * 1536])
+        assert not store._has_legacy_payloads()
+    
     def test_search(self, temp_qdrant_dir):
         """Test vector search."""
         store = QdrantStore(collection_name="test_collection")
@@ -62,6 +163,51 @@ class TestQdrantStore:
         
         assert isinstance(results, list)
     
+    def test_search_reads_nested_and_legacy_raw_data(self, temp_qdrant_dir):
+        """Test raw_data is stored as a nested payload and old JSON strings still decode."""
+        store = QdrantStore(collection_name="test_collection")
+        store.add_documents([{"doc_id": "test_0", "raw_data": {"name": "Paris"}}], [[0.1] * 1536])
+        
+        payload = store.client.retrieve("test_collection", ids=[0])[0].payload
+        assert payload["raw_data"] == {"name": "Paris"}
+        
+        store.client = MagicMock()
+        store.client.query_points.return_value.points = [
+            MagicMock(payload={"raw_data": {"name": "Paris"}}, score=0.9),
+            MagicMock(payload={"raw_data": '{"name": "Lyon"}'}, score=0.8),
+        ]
+        results = store.search([0.1] * 1536, limit=2)
+        assert [r["document"] for r in results] == [{"name": "Paris"}, {"name": "Lyon"}]
+    
+    def test_search_batch(self, temp_qdrant_dir):
+        """Test batched search returns one filtered result list per query."""
+        store = QdrantStore(collection_name="test_collection")
+        documents = [
+            {"doc_id": "dest_0", "doc_type": "destination", "raw_data": {}},
+            {"doc_id": "guide_0", "doc_type": "guide", "raw_data": {}},
+        ]
+        store.add_documents(documents, [[0.1] * 1536, [0.2] * 1536])
+        
+        results = store.search_batch([[0.1] * 1536, [0.1] * 1536], [10, 10],
+                                     [None, {"doc_type": "guide"}])
+        
+        assert len(results) == 2
+        assert {r["doc_id"] for r in results[0]} == {"dest_0", "guide_0"}
+        assert [r["doc_id"] for r in results[1]] == ["guide_0"]
+    
+    def test_search_with_any_of_filter(self, temp_qdrant_dir):
+        """Test a sequence filter value matches points with any of its values."""
+        store = QdrantStore(collection_name="test_collection")
+        documents = [
+            {"doc_id": "louvre", "activities": ["Museums", " Art ", "art"], "raw_data": {}},
+            {"doc_id": "alps", "activities": ["hiking"], "raw_data": {}},
+        ]
+        store.add_documents(documents, [[0.1] * 1536, [0.2] * 1536])
+        
+        results = store.search([0.1] * 1536, limit=10, filter_dict={"activities": ("art", "opera")})
+        assert [r["doc_id"] for r in results] == ["louvre"]
+        assert results[0]["activities"] == ["museums", "art"]
+    
     def test_search_with_filter(self, temp_qdrant_dir):
         """Test vector search with filter."""
         store = QdrantStore(collection_name="test_collection")
@@ -72,3 +218,20 @@ class TestQdrantStore:
         results = store.search(query_embedding, limit=10, filter_dict=filter_dict)
         assert isinstance(results, list)
 
+    
+    def test_quantization_config(self, temp_qdrant_dir):
+        """Test int8 scalar quantization is configured by default and can be disabled."""
+        store = QdrantStore(collection_name="test_collection")
+        config = store._quantization_config()
+        assert config.scalar.type == "int8"
+        # Local (file-based) mode searches exactly, so no rescoring params are sent
+        assert store.search_params is None
+        
+        store.quantize = False
+        assert store._quantization_config() is None
+    
+    def test_hnsw_config(self, temp_qdrant_dir):
+        """Test HNSW build parameters are configurable."""
+        store = QdrantStore(collection_name="test_collection", hnsw_m=16, hnsw_ef_construct=100)
+        assert store.hnsw_config.m == 16
+        assert store.hnsw_config.ef_construct == 100
@@ -68,4 +68,44 @@ class TestQueryRewriter:
         # Should return default structure on error
         assert "original_query" in result
         assert result.get("activities", []) == []
-
+    
+    def test_rewrite_query_cached(self, rewriter):
+        """Test repeated queries reuse the rewrite and get their own copy."""
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = '{"city": "Paris", "country": null, "activities": ["Museums"]}'
+        rewriter.client.chat.completions.create.return_value = mock_response
+        
+        first = rewriter.rewrite_query("museums in paris")
+        first["activities"].append("opera")
+        assert rewriter.client.chat.completions.create.call_args[1]["response_format"] == {"type": "json_object"}
+        second = rewriter.rewrite_query("museums in paris")
+        
+        assert second["activities"] == ["museums"]
+        assert rewriter.client.chat.completions.create.call_count == 1
+    
+    def test_rewrite_query_errors_not_cached(self, rewriter):
+        """Test a failed rewrite is retried on the next call."""
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = '{"city": null, "country": null, "activities": ["hiking"]}'
+        rewriter.client.chat.completions.create.side_effect = [Exception("API Error"), mock_response]
+        
+        assert rewriter.rewrite_query("hiking")["activities"] == []
+        assert rewriter.rewrite_query("hiking")["activities"] == ["hiking"]
+    
+    def test_rewrite_batch(self, rewriter):
+        """Test batch rewrites are aligned with the input and duplicates are sent once."""
+        def respond(model, messages, **kwargs):
+            response = MagicMock()
+            response.choices = [MagicMock()]
+            query = "hiking" if '"hiking"' in messages[1]["content"] else "diving"
+            response.choices[0].message.content = f'{{"city": null, "country": null, "activities": ["{query}"]}}'
+            return response
+        rewriter.client.chat.completions.create.side_effect = respond
+        
+        results = rewriter.rewrite_batch(["hiking", "diving", "hiking"])
+        
+        assert [r["activities"] for r in results] == [["hiking"], ["diving"], ["hiking"]]
+        assert [r["original_query"] for r in results] == ["hiking", "diving", "hiking"]
+        assert rewriter.client.chat.completions.create.call_count == 2
@@ -0,0 +1,58 @@
+"""Unit tests for SemanticQueryCache."""
+
+import pytest
+from retrieval.semantic_cache import SemanticQueryCache
+
+
+class TestSemanticQueryCache:
+    """Test suite for SemanticQueryCache."""
+    
+    @pytest.fixture
+    def cache(self):
+        """Create a small cache over 4-dimensional embeddings."""
+        return SemanticQueryCache(capacity=2, threshold=0.97, dim=4)
+    
+    def test_lookup_empty(self, cache):
+        """Test lookup on an empty cache misses."""
+        assert cache.lookup([1.0, 0.0, 0.0, 0.0], None, 10) is None
+    
+    def test_near_duplicate_hit(self, cache):
+        """Test a near-identical query is served from the cache."""
+        results = [{"doc_id": "a"}, {"doc_id": "b"}]
+        cache.insert([1.0, 0.0, 0.0, 0.0], None, 10, results)
+        
+        assert cache.lookup([0.99, 0.01, 0.0, 0.0], None, 1) == [{"doc_id": "a"}]
+        assert cache.lookup([0.0, 1.0, 0.0, 0.0], None, 10) is None
+    
+    def test_key_and_limit_must_match(self, cache):
+        """Test cached results are only reused for equal filters and smaller limits."""
+        cache.insert([1.0, 0.0, 0.0, 0.0], (("doc_type", "guide"),), 5, [{"doc_id": "a"}])
+        
+        assert cache.lookup([1.0, 0.0, 0.0, 0.0], None, 5) is None
+        assert cache.lookup([1.0, 0.0, 0.0, 0.0], (("doc_type", "guide"),), 10) is None
+        assert cache.lookup([1.0, 0.0, 0.0, 0.0], (("doc_type", "guide"),), 5) is not None
+    
+    def test_evicts_least_hit_entry(self, cache):
+        """Test the least-hit entry is evicted when the cache is full."""
+        cache.insert([1.0, 0.0, 0.0, 0.0], None, 10, [{"doc_id": "a"}])
+        cache.insert([0.0, 1.0, 0.0, 0.0], None, 10, [{"doc_id": "b"}])
+        cache.lookup([1.0, 0.0, 0.0, 0.0], None, 10)
+        cache.insert([0.0, 0.0, 1.0, 0.0], None, 10, [{"doc_id": "c"}])
+        
+        assert cache.lookup([1.0, 0.0, 0.0, 0.0], None, 10) == [{"doc_id": "a"}]
+        assert cache.lookup([0.0, 1.0, 0.0, 0.0], None, 10) is None
+        assert cache.lookup([0.0, 0.0, 1.0, 0.0], None, 10) == [{"doc_id": "c"}]
+    
+    def test_eviction_rotates_through_unhit_entries(self):
+        """Test a full cache keeps learning instead of overwriting one slot."""
+        cache = SemanticQueryCache(capacity=4, threshold=0.97, dim=10)
+        for i in range(10):
+            embedding = [0.0] * 10
+            embedding[i] = 1.0
+            cache.insert(embedding, None, 10, [{"doc_id": str(i)}])
+        
+        newest_but_one = [0.0] * 10
+        newest_but_one[8] = 1.0
+        assert cache.lookup(newest_but_one, None, 10) == [{"doc_id": "8"}]
+        oldest = [1.0] + [0.0] * 9
+        assert cache.lookup(oldest, None, 10) is None
@@ -0,0 +1,32 @@
+"""Unit tests for the stored field encodings."""
+
+import zlib
+import orjson
+from retrieval.stored_fields import pack_document, unpack_document, unpack_activities
+
+
+class TestStoredFields:
+    """Test suite for stored field encoding and decoding."""
+    
+    def test_document_round_trip(self):
+        """Test a packed document decodes to the original."""
+        doc = {"name": "Paris", "activities": ["museums"], "rating": 4.5, "visits": 12}
+        packed = pack_document(doc)
+        
+        assert isinstance(packed, bytes)
+        assert len(packed) < len(orjson.dumps(doc))
+        assert unpack_document(packed) == doc
+    
+    def test_document_legacy_encodings(self):
+        """Test documents from older indexes still decode."""
+        doc = {"name": "Paris"}
+        
+        assert unpack_document(zlib.compress(orjson.dumps(doc), 1)) == doc
+        assert unpack_document(zlib.compress(orjson.dumps(doc), 9)) == doc
+        assert unpack_document('{"name": "Paris"}') == doc
+    
+    def test_activities(self):
+        """Test activities decode from lists, JSON strings and missing values."""
+        assert unpack_activities(["museums"]) == ["museums"]
+        assert unpack_activities('["museums"]') == ["museums"]
+        assert unpack_activities(None) == []
@@ -4,6 +4,7 @@ import os
 import pytest
 from unittest.mock import patch, MagicMock
 from retrieval.vector_retriever import VectorRetriever
+from retrieval.semantic_cache import SemanticQueryCache
 
 
 class TestVectorRetriever:
@@ -16,7 +17,7 @@ class TestVectorRetriever:
             ret = VectorRetriever(collection_name="test_collection")
             # Mock the embedding generator and qdrant store
             ret.embedding_generator = MagicMock()
-            ret.qdrant_store = MagicMock()
+            ret.qdrant_store = MagicMock(legacy_payloads=False)
             return ret
     
     def test_init(self, retriever):
@@ -25,6 +26,15 @@ class TestVectorRetriever:
         assert hasattr(retriever, 'embedding_generator')
         assert hasattr(retriever, 'qdrant_store')
     
+    @patch('retrieval.vector_retriever.EmbeddingGenerator')
+    @patch('retrieval.vector_retriever.QdrantStore')
+    def test_store_options_passed_through(self, mock_store, mock_generator):
+        """Test QdrantStore options reach the store the retriever creates."""
+        VectorRetriever(collection_name="test_collection", url="http://qdrant:6333", pool_size=8)
+        
+        mock_store.assert_called_once_with(collection_name="test_collection",
+                                           url="http://qdrant:6333", pool_size=8)
+    
     def test_search(self, retriever):
         """Test vector search."""
         # Mock embedding
@@ -52,3 +62,106 @@ class TestVectorRetriever:
         
         assert "results" in result
 
+    
+    def test_search_batch(self, retriever):
+        """Test batched vector search embeds and queries Qdrant in one call each."""
+        retriever.embedding_generator.generate_embeddings_batch.return_value = [[0.1] * 1536, [0.2] * 1536]
+        retriever.qdrant_store.search_batch.return_value = [
+            [{"doc_id": "test_1", "name": "Test", "score": 0.9}], []
+        ]
+        
+        results = retriever.search_batch(["first", "second"], [5, 10], [None, {"doc_type": "guide"}])
+        
+        assert len(results) == 2
+        assert results[0]["query"] == "first"
+        assert results[1]["query"] == "second"
+        assert [r["num_results"] for r in results] == [1, 0]
+        retriever.embedding_generator.generate_embeddings_batch.assert_called_once_with(["first", "second"])
+        retriever.qdrant_store.search_batch.assert_called_once_with(
+            [[0.1] * 1536, [0.2] * 1536], [5, 10], [None, {"doc_type": "guide"}]
+        )
+        retriever.qdrant_store.search.assert_not_called()
+    
+    def test_search_batch_skips_semantic_cache_hits(self, retriever):
+        """Test only semantic cache misses are sent in the Qdrant batch."""
+        retriever.query_cache = SemanticQueryCache(capacity=4, dim=1536)
+        retriever.embedding_generator.generate_embedding.return_value = [0.1] * 1536
+        retriever.embedding_generator.generate_embeddings_batch.return_value = [[0.1] * 1536, [0.0, 1.0] + [0.0] * 1534]
+        retriever.qdrant_store.search.return_value = [{"doc_id": "test_1", "score": 0.9}]
+        retriever.qdrant_store.search_batch.return_value = [[{"doc_id": "test_2", "score": 0.8}]]
+        
+        retriever.search("museums", limit=5)
+        results = retriever.search_batch(["museum", "beaches"], [5, 5])
+        
+        assert [r["results"][0]["doc_id"] for r in results] == ["test_1", "test_2"]
+        assert retriever.qdrant_store.search_batch.call_args[0][1] == [5]
+    
+    def test_default_embedding_cache(self, retriever):
+        """Test a retriever without a shared cache still reuses embeddings."""
+        retriever.embedding_generator.generate_embedding.return_value = [0.1] * 1536
+        retriever.qdrant_store.search.return_value = []
+        
+        retriever.search("museums", limit=5)
+        retriever.search_with_activities("Museums", ["art"], limit=5)
+        
+        retriever.embedding_generator.generate_embedding.assert_called_once_with("museums")
+    
+    def test_embedding_cache_reused(self, retriever):
+        """Test repeated queries reuse cached embeddings."""
+        retriever.embedding_cache = {}
+        retriever.embedding_generator.generate_embedding.return_value = [0.1] * 1536
+        retriever.embedding_generator.generate_embeddings_batch.return_value = [[0.2] * 1536]
+        retriever.qdrant_store.search.return_value = []
+        retriever.qdrant_store.search_batch.return_value = [[], []]
+        
+        retriever.search("Test Query", limit=5)
+        retriever.search("  test query ", limit=5)
+        retriever.search_batch(["test query", "other"], [5, 5])
+        
+        retriever.embedding_generator.generate_embedding.assert_called_once_with("Test Query")
+        retriever.embedding_generator.generate_embeddings_batch.assert_called_once_with(["other"])
+    
+    def test_semantic_query_cache(self, retriever):
+        """Test near-duplicate queries are served from the semantic cache."""
+        retriever.query_cache = SemanticQueryCache(capacity=4, dim=1536)
+        retriever.embedding_generator.generate_embedding.return_value = [0.1] * 1536
+        retriever.qdrant_store.search.return_value = [
+            {"doc_id": "test_1", "name": "Test", "score": 0.9}
+        ]
+        
+        first = retriever.search("museums", limit=5)
+        second = retriever.search("museum", limit=5)
+        
+        assert second["results"] == first["results"]
+        assert retriever.qdrant_store.search.call_count == 1
+    
+    def test_search_with_activities(self, retriever):
+        """Test activities are expanded into a server-side filter instead of post-filtering."""
+        retriever.activity_matcher = MagicMock()
+        retriever.activity_matcher.expand_with_morph.side_effect = lambda a: {a.lower(), a.lower() + "s"}
+        retriever.embedding_generator.generate_embedding.return_value = [0.1] * 1536
+        retriever.qdrant_store.search.return_value = [{"doc_id": "test_1", "activities": ["museums"]}]
+        
+        result = retriever.search_with_activities("art", ["MUSEUM", "opera"], limit=5)
+        
+        assert [doc["doc_id"] for doc in result["results"]] == ["test_1"]
+        assert result["num_results"] == 1
+        retriever.qdrant_store.search.assert_called_once_with(
+            query_embedding=[0.1] * 1536,
+            limit=5,
+            filter_dict={"activities": ("museum", "museums", "opera", "operas")}
+        )
+    
+    def test_search_with_activities_legacy_payloads(self, retriever):
+        """Test mixed-case payloads from older collections are post-filtered case-insensitively."""
+        retriever.qdrant_store.legacy_payloads = True
+        retriever.search = MagicMock(return_value={"results": [
+            {"doc_id": "test_1", "activities": ["Northern Lights viewing", "dining"]},
+            {"doc_id": "test_2", "activities": ["hiking"]},
+        ]})
+        
+        result = retriever.search_with_activities("aurora", ["northern lights"], limit=5)
+        
+        assert [doc["doc_id"] for doc in result["results"]] == ["test_1"]
+        retriever.search.assert_called_once_with("aurora", limit=10)
+        retriever.qdrant_store.search.assert_not_called()